@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+from types import SimpleNamespace
+
+from ..services.batch_protocol import ELEMENT_START, ELEMENT_END
+from ..services.response_cache import make_cache_key
+from ..services.text_utils import estimate_tokens
+
+# An element block in a batched prompt: start marker with its id, then the element's prompt
+_ELEMENT_PATTERN = re.compile(r"\[ELEMENT_START\s+id\s*=\s*(\d+)\s*\](.*?)\[ELEMENT_END\]", re.S)
+
+# The text to simplify inside a full element prompt, see create_element_prompt. Compact
+# batches (create_compact_element_prompt) send the text itself between the markers.
+_ELEMENT_TEXT_PATTERN = re.compile(r"reading level:\n\n(.*?)\n\n", re.S)
+
+# Lead-in of a plain (non-batched) prompt, see simplify_text
+_TEXT_PROMPT_PREFIX = "Please simplify the following text:\n\n"
+
+
+class FakeAPIError(Exception):
+    """Simulated failed call, shaped like openai.APIStatusError so the retry logic treats it alike"""
+
+    def __init__(self, status_code=429, retry_after=None):
+        super().__init__(f"Error code: {status_code} - simulated failure")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+def prompt_key(messages) -> str:
+    """Key a recorded response by the system and user prompts that produced it"""
+    system_prompt = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user_prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    return make_cache_key(system_prompt, user_prompt)
+
+
+def load_recordings(path):
+    """
+    Load recorded responses written by RecordingAsyncOpenAI
+
+    Args:
+        path (str): JSON Lines file of {"key": ..., "content": ...} objects
+
+    Returns:
+        dict: Response content by prompt key
+    """
+    recordings = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recordings[entry["key"]] = entry["content"]
+    return recordings
+
+
+def _element_text(prompt):
+    """The text an element prompt asks to simplify"""
+    match = _ELEMENT_TEXT_PATTERN.search(prompt)
+    return match.group(1) if match else prompt.strip()
+
+
+def _completion(content, prompt_tokens, finish_reason="stop"):
+    """A chat completion response with the attributes the pipeline reads"""
+    completion_tokens = estimate_tokens(content)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+    )
+
+
+class FakeAsyncOpenAI:
+    """
+    Offline stand-in for the AsyncAzureOpenAI client, for load tests and benchmarks
+
+    Answers chat.completions.create() after a configurable delay. Batched prompts get
+    one [ELEMENT_START id=N]...[ELEMENT_END] block back per element, holding that
+    element's text passed through transform. Responses recorded with
+    RecordingAsyncOpenAI are replayed when the same prompts come in again.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=429, retry_after=None,
+                 drop_rate=0.0, transform=None, replay_path=None, seed=None):
+        """
+        Initialize the fake client
+
+        Args:
+            latency (float): Seconds each call takes
+            jitter (float): Up to this many seconds are added to each call at random
+            error_rate (float): Fraction of calls that raise FakeAPIError
+            error_status (int): HTTP status of the simulated errors (429 or 5xx are retried)
+            retry_after (float, optional): Retry-After seconds sent with simulated errors
+            drop_rate (float): Fraction of elements left out of batched replies, to exercise recovery
+            transform (callable, optional): Turns an element's text into its "simplified" text
+                (default: returned unchanged)
+            replay_path (str, optional): Responses recorded by RecordingAsyncOpenAI to replay
+            seed (int, optional): Seed for the random delays, errors and drops
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.drop_rate = drop_rate
+        self.transform = transform or (lambda text: text)
+        self.recordings = load_recordings(replay_path) if replay_path else {}
+        self._random = random.Random(seed)
+
+        self.calls = 0
+        self.errors = 0
+        self.replayed = 0
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _reply(self, user_prompt):
+        """Build the reply to a prompt, following the element marker protocol"""
+        blocks = _ELEMENT_PATTERN.findall(user_prompt)
+        if not blocks:
+            text = user_prompt[len(_TEXT_PROMPT_PREFIX):] if user_prompt.startswith(_TEXT_PROMPT_PREFIX) else user_prompt
+            return self.transform(text.strip())
+
+        return "\n".join(
+            f"{ELEMENT_START.format(id=element_id)}{self.transform(_element_text(prompt))}{ELEMENT_END}"
+            for element_id, prompt in blocks
+            if not (self.drop_rate and self._random.random() < self.drop_rate)
+        )
+
+    async def create(self, model=None, messages=(), **kwargs):
+        """Simulate chat.completions.create"""
+        self.calls += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            raise FakeAPIError(self.error_status, self.retry_after)
+
+        user_prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+
+        content = self.recordings.get(prompt_key(messages)) if self.recordings else None
+        if content is not None:
+            self.replayed += 1
+        else:
+            content = self._reply(user_prompt)
+        return _completion(content, prompt_tokens)
+
+
+class RecordingAsyncOpenAI:
+    """
+    Wraps a real async client and appends every response to a file for FakeAsyncOpenAI to replay
+
+    Only complete responses (finish_reason "stop") are recorded.
+    """
+
+    def __init__(self, client, path):
+        """
+        Args:
+            client: The client to forward calls to
+            path (str): JSON Lines file to append recordings to
+        """
+        self.client = client
+        self.path = path
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        """Forward chat.completions.create and record the response"""
+        response = await self.client.chat.completions.create(**kwargs)
+        choice = response.choices[0]
+        if choice.finish_reason == "stop" and choice.message.content:
+            line = json.dumps({"key": prompt_key(kwargs["messages"]), "content": choice.message.content},
+                              ensure_ascii=False)
+            await asyncio.to_thread(self._append, line)
+        return response
+
+    def _append(self, line):
+        directory = os.path.dirname(self.path)
+        with self._lock:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
@@ -1,18 +1,66 @@
-from openai import AzureOpenAI, AsyncAzureOpenAI
+import os
 
 from ..utils.config import config
 
+# Clients are created on first use, so importing the app neither loads the
+# openai package nor requires Azure credentials
+_openai_client = None
+_async_openai_client = None
 
-openai_client = AzureOpenAI(
-    api_key=config.AZURE_OPENAI_API_KEY,
-    api_version=config.AZURE_OPENAI_API_VERSION,
-    azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
-    max_retries=2,  # Limit retries at the client level
-)
 
-async_openai_client = AsyncAzureOpenAI(
-    api_key=config.AZURE_OPENAI_API_KEY,
-    api_version=config.AZURE_OPENAI_API_VERSION,
-    azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
-    max_retries=2,
-)
+def get_openai_client():
+    """Return the shared synchronous Azure OpenAI client, creating it on first use"""
+    global _openai_client
+    if _openai_client is None:
+        from openai import AzureOpenAI
+
+        _openai_client = AzureOpenAI(
+            api_key=config.AZURE_OPENAI_API_KEY,
+            api_version=config.AZURE_OPENAI_API_VERSION,
+            azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
+            max_retries=2,  # Limit retries at the client level
+        )
+    return _openai_client
+
+
+def get_async_openai_client():
+    """
+    Return the shared asynchronous client, creating it on first use
+
+    config.OPENAI_CLIENT selects Azure OpenAI ("azure"), Azure OpenAI with every
+    response recorded for replay ("record"), or the offline fake ("fake").
+    """
+    global _async_openai_client
+    if _async_openai_client is None:
+        if config.OPENAI_CLIENT == "fake":
+            from .fake_openai import FakeAsyncOpenAI
+
+            settings = config.FAKE_OPENAI
+            _async_openai_client = FakeAsyncOpenAI(
+                latency=settings["latency_seconds"],
+                jitter=settings["jitter_seconds"],
+                error_rate=settings["error_rate"],
+                drop_rate=settings["drop_rate"],
+                replay_path=settings["replay_path"] if os.path.exists(settings["replay_path"]) else None
+            )
+            return _async_openai_client
+
+        from openai import AsyncAzureOpenAI
+
+        _async_openai_client = AsyncAzureOpenAI(
+            api_key=config.AZURE_OPENAI_API_KEY,
+            api_version=config.AZURE_OPENAI_API_VERSION,
+            azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
+            max_retries=0,  # Retries are handled by process_with_openai
+        )
+        if config.OPENAI_CLIENT == "record":
+            from .fake_openai import RecordingAsyncOpenAI
+
+            _async_openai_client = RecordingAsyncOpenAI(_async_openai_client, config.FAKE_OPENAI["replay_path"])
+    return _async_openai_client
+
+
+def set_async_openai_client(client):
+    """Replace the shared asynchronous client, e.g. with a FakeAsyncOpenAI in benchmarks"""
+    global _async_openai_client
+    _async_openai_client = client
@@ -1,19 +1,28 @@
+import asyncio
 import logging
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
-from typing import Dict, Any
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict, Any, List
 import json
-from datetime import datetime
-import docx
 import os
+import shutil
+import tempfile
+import time
+import uuid
 
 from app.services.prompt_generation import create_system_prompt
-from app.services.simplification import simplify_document
+from app.services.simplification import simplify_document, simplify_documents
+from app.services.jobs import job_manager, QueueFullError, COMPLETED, FAILED
+from app.services.storage import output_storage, DOCX_MEDIA_TYPE
 from app.utils.folders import ensure_directory_exists
 from app.utils.config import config
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/docs", tags=["Docs"])
+
+# Size of the chunks uploads are copied in
+UPLOAD_CHUNK_SIZE = 1024 * 1024
  
 
 @router.post("/dummy")
@@ -22,94 +31,425 @@ async def dummy_upload(formData: Dict[str, Any]):
     return {"message": "File received", "data": formData}
 
 
-@router.post("/simplification")
-async def simplify_file(
-    file: UploadFile = File(...),
-    base_prompt: str = Form(None),
-    keywords_to_keep: str = Form(None),
-    keywords_to_replace: str = Form(None),
-    samples: str = Form(None)
-):
+def _parse_prompt_form(base_prompt, keywords_to_keep, keywords_to_replace, samples):
     """
-    Simplifies a docx file and returns the simplified version
+    Parse the prompt settings sent as form fields, falling back to the defaults
+    
+    Returns:
+        dict: Prompt configuration for this request
     """
-    # Parse JSON strings from form data    
     try:
-        base_prompt = base_prompt or config.PROMPT_CONFIG["base_prompt"]
-        keywords_to_keep_list = json.loads(keywords_to_keep) if keywords_to_keep else config.PROMPT_CONFIG["keywords_to_keep"]
-        keywords_to_replace_list = json.loads(keywords_to_replace) if keywords_to_replace else config.PROMPT_CONFIG["keywords_to_replace"]
-        samples_list = json.loads(samples) if samples else config.PROMPT_CONFIG["examples"]
+        return {
+            "base_prompt": base_prompt or config.PROMPT_CONFIG["base_prompt"],
+            "keywords_to_keep": json.loads(keywords_to_keep) if keywords_to_keep else config.PROMPT_CONFIG["keywords_to_keep"],
+            "keywords_to_replace": json.loads(keywords_to_replace) if keywords_to_replace else config.PROMPT_CONFIG["keywords_to_replace"],
+            "examples": json.loads(samples) if samples else config.PROMPT_CONFIG["examples"]
+        }
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=400, detail=f"Invalid JSON format: {str(e)}")
+
+
+def _create_prompt(prompt_config):
+    """Create the system prompt for a request's prompt configuration"""
+    # Create a set to store highlighted words
+    highlighted_words = set()
     
-    # Validate file type
+    return create_system_prompt(
+        prompt_config["base_prompt"],
+        prompt_config["keywords_to_keep"],
+        prompt_config["keywords_to_replace"],
+        prompt_config["examples"],
+        highlighted_words
+    )
+
+
+def _validate_upload(file: UploadFile):
+    """Reject uploads that are not docx files"""
     if not file.filename.lower().endswith('.docx'):
         raise HTTPException(status_code=400, detail="Only .docx files are supported")
 
-    # Create temporary file
-    temp_dir = "temp_uploads"
-    ensure_directory_exists(temp_dir)
+
+def _copy_file(source, destination):
+    """Copy one file object into another in chunks. Blocking, so run it off the event loop."""
+    source.seek(0)
+    shutil.copyfileobj(source, destination, UPLOAD_CHUNK_SIZE)
+    destination.seek(0)
+
+
+async def _open_upload(file: UploadFile):
+    """
+    Validate an uploaded docx file and return the file object to parse it from
+    
+    Starlette already holds the upload in a spooled temporary file (in memory for
+    small files, on disk for large ones), so it is parsed from there without a copy.
+    The file object is closed when the request finishes.
+    
+    Args:
+        file (UploadFile): The uploaded file
+    
+    Returns:
+        file: Binary file object positioned at the start
+    """
+    _validate_upload(file)
+    await file.seek(0)
+    return file.file
+
+
+async def _spool_upload(file: UploadFile):
+    """
+    Validate an uploaded docx file and copy it into a spooled temporary file that outlives the request
+    
+    Files up to config.UPLOAD_SPOOL_MAX_SIZE stay in memory; larger ones are written
+    to disk in chunks on a worker thread.
+    
+    Args:
+        file (UploadFile): The uploaded file
+    
+    Returns:
+        SpooledTemporaryFile: The copy, to be closed by the caller
+    """
+    _validate_upload(file)
+    spooled = tempfile.SpooledTemporaryFile(max_size=config.UPLOAD_SPOOL_MAX_SIZE)
+    try:
+        await asyncio.to_thread(_copy_file, file.file, spooled)
+    except Exception as e:
+        spooled.close()
+        raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
+    return spooled
+
+
+async def _save_upload(file: UploadFile, directory):
+    """
+    Validate an uploaded docx file and save it under a unique name
+    
+    The file is written in chunks on a worker thread, so the event loop is not blocked.
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    temp_file_path = f"{temp_dir}/{file.filename}_{timestamp}"
+    Args:
+        file (UploadFile): The uploaded file
+        directory (str): Directory to save the file in
+    
+    Returns:
+        str: Path to the saved file
+    """
+    _validate_upload(file)
+    ensure_directory_exists(directory)
+    file_path = os.path.join(directory, f"{uuid.uuid4().hex}.docx")
+    
+    def write():
+        with open(file_path, "wb") as f:
+            _copy_file(file.file, f)
     
-    # Save uploaded file
     try:
-        with open(temp_file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        await asyncio.to_thread(write)
     except Exception as e:
+        _remove_temp_file(file_path)
         raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+    
+    return file_path
+
+
+def _remove_temp_file(temp_file_path):
+    """Remove a temporary upload, logging rather than raising on failure"""
+    try:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+    except Exception as e:
+        logger.error(f"Error removing temporary file: {str(e)}")
+
+
+async def _stored_file_response(filename):
+    """
+    Respond with a stored output: streamed from disk for local storage, from memory otherwise
+    
+    Raises:
+        HTTPException: 404 if the output does not exist or has expired
+    """
+    file_path = output_storage.local_path(filename)
+    if file_path is not None:
+        return FileResponse(path=file_path, filename=filename, media_type=DOCX_MEDIA_TYPE)
+    
+    data = await asyncio.to_thread(output_storage.get, filename)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"File not found: {filename}")
+    return Response(
+        content=data,
+        media_type=DOCX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def _readability_response(result):
+    """Readability scores of a simplification result, per section and for the whole document"""
+    report = result.readability
+    return {
+        "gradeLevel": round(report.document.grade_level, 2),
+        "readingEase": round(report.document.reading_ease, 2),
+        "smog": round(report.document.smog, 2),
+        "sections": [
+            {
+                "title": section.title,
+                "gradeLevel": round(section.scores.grade_level, 2),
+                "readingEase": round(section.scores.reading_ease, 2)
+            }
+            for section in report.sections
+        ]
+    }
+
+
+@router.post("/simplification")
+async def simplify_file(
+    file: UploadFile = File(...),
+    base_prompt: str = Form(None),
+    keywords_to_keep: str = Form(None),
+    keywords_to_replace: str = Form(None),
+    samples: str = Form(None),
+    download: bool = Form(False)
+):
+    """
+    Simplifies a docx file and returns the simplified version
+    
+    Responds with the simplified text and scores as JSON, or with the simplified
+    docx itself when download is set.
+    """
+    # Parse JSON strings from form data    
+    custom_prompt_config = _parse_prompt_form(base_prompt, keywords_to_keep, keywords_to_replace, samples)
+    upload = await _open_upload(file)
 
     # Process the document
     try:
-        # Create a set to store highlighted words
-        highlighted_words = set()
-        
         # Create system prompt
-        system_prompt = create_system_prompt(
-            base_prompt,
-            keywords_to_keep_list,
-            keywords_to_replace_list,
-            samples_list,
-            highlighted_words
-        )
-        
-        # Replace existing configuration with form data for this request
-        custom_prompt_config = {
-            "base_prompt": base_prompt,
-            "keywords_to_keep": keywords_to_keep_list,
-            "keywords_to_replace": keywords_to_replace_list,
-            "examples": samples_list
-        }
+        system_prompt = _create_prompt(custom_prompt_config)
         
         # Process the document
-        output_file_path, readability_score = await simplify_document(
-            temp_file_path, 
+        result = await simplify_document(
+            upload,
             system_prompt=system_prompt,
-            prompt_config=custom_prompt_config
+            prompt_config=custom_prompt_config,
+            filename=file.filename
         )
         
-        # Extract simplified text for readability calculation
-        doc = docx.Document(output_file_path)
-        full_text = " ".join([para.text for para in doc.paragraphs])
+        if download:
+            return Response(
+                content=result.document_bytes,
+                media_type=DOCX_MEDIA_TYPE,
+                headers={
+                    "Content-Disposition": f'attachment; filename="{result.filename}"',
+                    "X-Readability-Score": f"{result.readability_score:.2f}"
+                }
+            )
         
         return {
             "message": "File processed successfully",
-            "filename": os.path.basename(output_file_path),
-            "readabilityScore": round(readability_score, 2),
-            "simplifiedText": full_text
+            "filename": result.filename,
+            "readabilityScore": round(result.readability_score, 2),
+            "readability": _readability_response(result),
+            "simplifiedText": result.simplified_text,
+            "timings": {stage: round(seconds, 3) for stage, seconds in result.timings.items()}
         }
     except Exception as e:
         logger.error(f"Error processing document: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
-    finally:
-        # Clean up temporary file
+
+
+@router.post("/simplification/stream")
+async def simplify_file_stream(
+    file: UploadFile = File(...),
+    base_prompt: str = Form(None),
+    keywords_to_keep: str = Form(None),
+    keywords_to_replace: str = Form(None),
+    samples: str = Form(None)
+):
+    """
+    Simplifies a docx file, streaming progress as newline-delimited JSON events
+    
+    Events, one JSON object per line:
+        started   - elements that needed no model call (cached, headings, ...) and the batch count
+        batch     - the simplified elements of one batch, as soon as that batch completes
+        heartbeat - sent while waiting on slow batches so proxies keep the connection open
+        complete  - the output filename and readability scores
+        error     - processing failed
+    """
+    custom_prompt_config = _parse_prompt_form(base_prompt, keywords_to_keep, keywords_to_replace, samples)
+    system_prompt = _create_prompt(custom_prompt_config)
+    
+    # The pipeline runs after this handler returns, when the upload itself is already closed
+    upload = await _spool_upload(file)
+    filename = file.filename
+    
+    events = asyncio.Queue()
+    
+    async def run_pipeline():
         try:
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            result = await simplify_document(
+                upload,
+                system_prompt=system_prompt,
+                prompt_config=custom_prompt_config,
+                progress_callback=events.put,
+                filename=filename
+            )
+            await events.put({
+                "event": "complete",
+                "message": "File processed successfully",
+                "filename": result.filename,
+                "readabilityScore": round(result.readability_score, 2),
+                "readability": _readability_response(result)
+            })
         except Exception as e:
-            logger.error(f"Error removing temporary file: {str(e)}")
+            logger.error(f"Error processing document: {str(e)}", exc_info=True)
+            await events.put({"event": "error", "detail": f"Error processing document: {str(e)}"})
+        finally:
+            upload.close()
+            await events.put(None)
+    
+    async def event_stream():
+        pipeline = asyncio.create_task(run_pipeline())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=config.STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    event = {"event": "heartbeat"}
+                
+                if event is None:
+                    break
+                yield json.dumps(event, default=str) + "\n"
+        finally:
+            # Client disconnected before the pipeline finished
+            if not pipeline.done():
+                pipeline.cancel()
+    
+    # Also closed once the response is done, in case the client left before the stream started
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson", background=BackgroundTask(upload.close))
+
+
+@router.post("/simplification/batch")
+async def simplify_files(
+    files: List[UploadFile] = File(...),
+    base_prompt: str = Form(None),
+    keywords_to_keep: str = Form(None),
+    keywords_to_replace: str = Form(None),
+    samples: str = Form(None)
+):
+    """
+    Simplifies many docx files at once and returns a manifest of the results
+    
+    The elements of all files share one scheduler, so batches are packed across
+    files. Each simplified file is stored as soon as it is finished and can be
+    fetched with GET /docs/simplification; failed files are listed with their error.
+    """
+    if len(files) > config.BATCH_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {config.BATCH_MAX_DOCUMENTS} files can be sent in one batch")
+    for file in files:
+        _validate_upload(file)
+    
+    custom_prompt_config = _parse_prompt_form(base_prompt, keywords_to_keep, keywords_to_replace, samples)
+    system_prompt = _create_prompt(custom_prompt_config)
+    
+    # Keep the uploads on disk rather than all in memory while the batch runs
+    upload_dir = tempfile.mkdtemp(prefix="batch_")
+    try:
+        documents = [(await _save_upload(file, upload_dir), file.filename) for file in files]
+        
+        started = time.perf_counter()
+        outcomes = await simplify_documents(
+            documents,
+            system_prompt=system_prompt,
+            prompt_config=custom_prompt_config
+        )
+        
+        manifest = []
+        for outcome in outcomes:
+            result = outcome.result
+            manifest.append({
+                "originalFilename": outcome.filename,
+                "status": COMPLETED if result else FAILED,
+                "filename": result.filename if result else None,
+                "readabilityScore": round(result.readability_score, 2) if result else None,
+                "error": outcome.error
+            })
+        
+        completed = sum(1 for outcome in outcomes if outcome.result)
+        return {
+            "message": f"Processed {completed} of {len(outcomes)} files",
+            "completed": completed,
+            "failed": len(outcomes) - completed,
+            "totalSeconds": round(time.perf_counter() - started, 2),
+            "documents": manifest
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing batch: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing batch: {str(e)}")
+    finally:
+        await asyncio.to_thread(shutil.rmtree, upload_dir, True)
+
+
+@router.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    base_prompt: str = Form(None),
+    keywords_to_keep: str = Form(None),
+    keywords_to_replace: str = Form(None),
+    samples: str = Form(None)
+):
+    """
+    Queues a docx file for simplification in the background and returns its job id
+    """
+    custom_prompt_config = _parse_prompt_form(base_prompt, keywords_to_keep, keywords_to_replace, samples)
+    input_path = await _save_upload(file, os.path.join(config.JOBS_DIR, "inputs"))
+    
+    try:
+        job_id = await job_manager.submit(file.filename, input_path, custom_prompt_config)
+    except QueueFullError as e:
+        _remove_temp_file(input_path)
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {"message": "File queued for processing", "jobId": job_id, "status": "queued"}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Returns the status and progress of a background simplification job
+    """
+    job = await asyncio.to_thread(job_manager.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    return {
+        "jobId": job["id"],
+        "status": job["status"],
+        "originalFilename": job["filename"],
+        "queuePosition": job_manager.queue_position(job_id),
+        "progress": {
+            "completedBatches": job["completed_batches"],
+            "totalBatches": job["total_batches"]
+        },
+        "filename": os.path.basename(job["output_path"]) if job["output_path"] else None,
+        "readabilityScore": round(job["readability_score"], 2) if job["readability_score"] is not None else None,
+        "error": job["error"],
+        "createdAt": job["created_at"],
+        "updatedAt": job["updated_at"]
+    }
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Returns the simplified file of a completed background job
+    """
+    job = await asyncio.to_thread(job_manager.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is not completed (status: {job['status']})")
+    
+    try:
+        return await _stored_file_response(os.path.basename(job["output_path"]))
+    except HTTPException:
+        raise HTTPException(status_code=404, detail=f"Output file no longer exists for job: {job_id}")
 
 
 @router.get("/simplification")
@@ -118,18 +458,9 @@ async def get_file(filename: str):
     Returns a processed file
     """
     try:
-        file_path = f"test_runs/{filename}"
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail=f"File not found: {filename}")
-            
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
+        return await _stored_file_response(filename)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error retrieving file: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error retrieving file: {str(e)}")
-
@@ -1,7 +1,12 @@
 import logging
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
 
 from app.utils.config import config
+from app.services.openai_processor import response_cache
+from app.services.document_processor import element_cache
+from app.services.rate_limiting import openai_limiter
+from app.services.metrics import registry, CONTENT_TYPE
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -27,3 +32,31 @@ def get_default_config():
     except Exception as e:
         logger.error(f"Error getting prepopulated data: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error getting prepopulated data: {str(e)}")
+
+
+@router.get("/cache-stats")
+def get_cache_stats():
+    """
+    Returns hit/miss counters for the response and per-element caches
+    """
+    return {
+        "responses": response_cache.stats(),
+        "elements": element_cache.stats()
+    }
+
+
+@router.get("/rate-limits")
+def get_rate_limits():
+    """
+    Returns the current Azure OpenAI concurrency limit and per-minute usage
+    """
+    return openai_limiter.stats()
+
+
+@router.get("/metrics")
+def get_metrics():
+    """
+    Returns stage timings, batch latencies, token usage, in-flight gauges and
+    fallback counts in the Prometheus text format
+    """
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,78 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple
+
+# Markers wrapping each element in a batched prompt and in the model's reply
+ELEMENT_START = "[ELEMENT_START id={id}]"
+ELEMENT_END = "[ELEMENT_END]"
+
+# Matches either marker; group 1 holds the id of a start marker
+_MARKER_PATTERN = re.compile(r"\[ELEMENT_START\s+id\s*=\s*(\d+)\s*\]|\[ELEMENT_END\]")
+
+
+class ParsedBatch(NamedTuple):
+    """Result of parsing a batched model reply"""
+    results: Dict[int, str]
+    missing: List[int]
+    duplicated: List[int]
+
+
+def wrap_element(batch_id: int, text: str) -> str:
+    """
+    Wrap one element's prompt in indexed markers
+
+    Args:
+        batch_id: Id of the element within its batch
+        text: The element's prompt
+
+    Returns:
+        str: The marked-up element
+    """
+    return f"{ELEMENT_START.format(id=batch_id)}{text}{ELEMENT_END}"
+
+
+def parse_batch_response(response: str, expected_ids: Iterable[int]) -> ParsedBatch:
+    """
+    Split a batched reply into per-element texts in a single pass
+
+    Results are matched by the id in each start marker, not by position, so a
+    dropped or reordered element does not shift the ones after it. An element
+    whose end marker is missing runs up to the next start marker. A trailing
+    element without an end marker is treated as truncated and reported missing.
+
+    Args:
+        response: The model's reply
+        expected_ids: Ids sent in the batch
+
+    Returns:
+        ParsedBatch: Texts by id, plus the ids that were missing or appeared more than once.
+        Duplicated ids are left out of the results since it is unclear which copy is right.
+    """
+    expected = set(expected_ids)
+    results = {}
+    duplicated = set()
+
+    open_id = None
+    open_end = 0
+
+    def close(element_id, text):
+        if element_id not in expected:
+            return
+        if element_id in results or element_id in duplicated:
+            duplicated.add(element_id)
+            results.pop(element_id, None)
+            return
+        results[element_id] = text.strip()
+
+    for match in _MARKER_PATTERN.finditer(response or ""):
+        if match.group(1) is not None:
+            # A new element starts - an unterminated previous element ends here
+            if open_id is not None:
+                close(open_id, response[open_end:match.start()])
+            open_id = int(match.group(1))
+            open_end = match.end()
+        elif open_id is not None:
+            close(open_id, response[open_end:match.start()])
+            open_id = None
+
+    missing = sorted(expected - results.keys() - duplicated)
+    return ParsedBatch(results=results, missing=missing, duplicated=sorted(duplicated))
@@ -0,0 +1,237 @@
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.utils.config import config
+from app.services.prompt_generation import create_element_prompt
+from app.services.text_utils import estimate_tokens
+from app.services.elements import DocumentElement
+
+logger = logging.getLogger(__name__)
+
+# Tokens spent on the element markers and separators around each element
+MARKER_OVERHEAD_TOKENS = 12
+
+# A section that does not fit in the current batch only starts a new one if the current
+# batch is at least this full, so keeping sections together adds few calls
+SECTION_MIN_FILL = 0.5
+
+# Element types outside the body text, each kept in a section of its own
+STORY_TYPES = ("header", "footer", "footnote", "endnote")
+
+
+def estimate_element_tokens(element: DocumentElement,
+                            prompt_builder: Callable = create_element_prompt):
+    """
+    Estimate the input and expected output tokens of one element in a batch
+
+    Args:
+        element: The document element
+        prompt_builder: Function building the per-element prompt
+
+    Returns:
+        tuple: (input_tokens, output_tokens)
+    """
+    input_tokens = estimate_tokens(prompt_builder(element, element.text)) + MARKER_OVERHEAD_TOKENS
+    output_tokens = int(estimate_tokens(element.text) * config.OUTPUT_TOKEN_RATIO) + MARKER_OVERHEAD_TOKENS
+    return input_tokens, output_tokens
+
+
+def pack_batches(elements: List[DocumentElement],
+                 max_input_tokens: int = None,
+                 max_output_tokens: int = None,
+                 max_elements: int = None,
+                 prompt_builder: Callable = create_element_prompt) -> List[List[DocumentElement]]:
+    """
+    Greedily pack elements, in order, into batches that fit the token budgets
+
+    A batch is closed as soon as the next element would push it past the input
+    budget, the expected output budget or the element cap. An element that is
+    larger than a budget on its own is sent in a batch by itself.
+
+    Args:
+        elements: Elements to pack, in the order they should be sent
+        max_input_tokens: Input token budget per batch (default: config.BATCH_MAX_INPUT_TOKENS)
+        max_output_tokens: Expected output token budget per batch (default: config.BATCH_MAX_OUTPUT_TOKENS)
+        max_elements: Maximum number of elements per batch (default: config.BATCH_SIZE)
+        prompt_builder: Function building the per-element prompt
+
+    Returns:
+        List of batches, each a list of elements
+    """
+    return pack_sections([elements], max_input_tokens, max_output_tokens, max_elements, prompt_builder)
+
+
+def pack_sections(sections: List[List[DocumentElement]],
+                  max_input_tokens: int = None,
+                  max_output_tokens: int = None,
+                  max_elements: int = None,
+                  prompt_builder: Callable = create_element_prompt) -> List[List[DocumentElement]]:
+    """
+    Pack sections of consecutive elements into batches, splitting a section only if it cannot fit in one
+
+    Sections are taken in order. A section that does not fit in what is left of the
+    current batch starts a new one if the current batch is at least SECTION_MIN_FILL
+    full; otherwise, and for sections larger than a whole batch, elements are packed
+    greedily like pack_batches. The batch holding the end of a section stays open, so
+    short sections after it still share that batch.
+
+    Args:
+        sections: Lists of elements, in the order they should be sent
+        max_input_tokens: Input token budget per batch (default: config.BATCH_MAX_INPUT_TOKENS)
+        max_output_tokens: Expected output token budget per batch (default: config.BATCH_MAX_OUTPUT_TOKENS)
+        max_elements: Maximum number of elements per batch (default: config.BATCH_SIZE)
+        prompt_builder: Function building the per-element prompt
+
+    Returns:
+        List of batches, each a list of elements
+    """
+    max_input_tokens = max_input_tokens or config.BATCH_MAX_INPUT_TOKENS
+    max_output_tokens = max_output_tokens or config.BATCH_MAX_OUTPUT_TOKENS
+    max_elements = max_elements or config.BATCH_SIZE
+
+    batches = []
+    current_batch = []
+    current_input = 0
+    current_output = 0
+
+    for section in sections:
+        sizes = [estimate_element_tokens(element, prompt_builder) for element in section]
+
+        # Start the section in a fresh batch if it does not fit in the current one but fits in
+        # a batch of its own, and the current batch is full enough to be worth a call
+        section_input = sum(input_tokens for input_tokens, _ in sizes)
+        section_output = sum(output_tokens for _, output_tokens in sizes)
+        fits_alone = (section_input <= max_input_tokens and section_output <= max_output_tokens
+                      and len(section) <= max_elements)
+        fill = max(current_input / max_input_tokens, current_output / max_output_tokens,
+                   len(current_batch) / max_elements)
+        if current_batch and fits_alone and fill >= SECTION_MIN_FILL and (
+            current_input + section_input > max_input_tokens
+            or current_output + section_output > max_output_tokens
+            or len(current_batch) + len(section) > max_elements
+        ):
+            batches.append(current_batch)
+            current_batch = []
+            current_input = 0
+            current_output = 0
+
+        for element, (input_tokens, output_tokens) in zip(section, sizes):
+            if current_batch and (
+                current_input + input_tokens > max_input_tokens
+                or current_output + output_tokens > max_output_tokens
+                or len(current_batch) >= max_elements
+            ):
+                batches.append(current_batch)
+                current_batch = []
+                current_input = 0
+                current_output = 0
+
+            if output_tokens > max_output_tokens:
+                logger.warning(f"Element of type {element.type} is expected to need ~{output_tokens} output tokens, "
+                               f"more than the batch budget of {max_output_tokens}")
+
+            current_batch.append(element)
+            current_input += input_tokens
+            current_output += output_tokens
+
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+
+def find_sections(elements) -> Dict[int, Tuple[int, Optional[str]]]:
+    """
+    Assign each element to its section: the consecutive elements under one heading
+
+    Every heading_N element starts a section titled with its text. Headers, footers,
+    footnotes and endnotes get a section per type. An element whose paragraph index
+    does not come after the previous one starts a section too, since that is where the
+    next document begins when several documents are processed together.
+
+    Args:
+        elements: All elements of the document(s) in document order, headings included
+
+    Returns:
+        dict: (section number, heading text or None) by element id
+    """
+    sections = {}
+    number = 0
+    title = None
+    group = None
+    previous_index = None
+
+    for element in elements:
+        if element.type == "media":
+            continue
+        element_group = element.type if element.type in STORY_TYPES else "body"
+        if element.type.startswith("heading_"):
+            number += 1
+            title = element.text.strip()
+        elif element_group != group or (previous_index is not None and element.index <= previous_index):
+            number += 1
+            title = None
+        group = element_group
+        previous_index = element.index
+        sections[element.id] = (number, title)
+
+    return sections
+
+
+def split_sections(elements: List[DocumentElement], sections: Dict[int, Tuple[int, Optional[str]]]):
+    """
+    Split elements into runs that belong to the same section
+
+    Args:
+        elements: Elements in document order
+        sections: Sections by element id, see find_sections
+
+    Returns:
+        List of sections, each a list of elements
+    """
+    runs = []
+    current = None
+    for element in elements:
+        section = sections.get(element.id)
+        if not runs or section != current:
+            runs.append([])
+            current = section
+        runs[-1].append(element)
+    return runs
+
+
+def pack_document_elements(elements: List[DocumentElement],
+                           prompt_builder: Callable = create_element_prompt,
+                           sections: Dict[int, Tuple[int, Optional[str]]] = None) -> List[List[DocumentElement]]:
+    """
+    Pack the elements of a document into batches
+
+    Element types are mixed within a batch when config.PACK_ACROSS_TYPES is set. This is
+    safe because every element carries its own type-specific instructions in its prompt.
+    Otherwise each element type is packed separately. With config.SECTION_CHUNKING and
+    sections given, the elements under one heading are kept in the same batch where
+    they fit (see pack_sections).
+
+    Args:
+        elements: Elements to pack, in document order
+        prompt_builder: Function building the per-element prompt
+        sections: Sections by element id, see find_sections
+
+    Returns:
+        List of batches, each a list of elements
+    """
+    if config.PACK_ACROSS_TYPES:
+        groups = [elements]
+    else:
+        elements_by_type = {}
+        for element in elements:
+            elements_by_type.setdefault(element.type, []).append(element)
+        groups = list(elements_by_type.values())
+
+    batches = []
+    for group in groups:
+        if config.SECTION_CHUNKING and sections:
+            batches.extend(pack_sections(split_sections(group, sections), prompt_builder=prompt_builder))
+        else:
+            batches.extend(pack_batches(group, prompt_builder=prompt_builder))
+    return batches
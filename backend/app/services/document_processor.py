@@ -1,17 +1,28 @@
 import asyncio
 import logging
-from typing import List, Dict, Any, Tuple, Set
-import math
+from typing import List, Dict, Tuple
 
 from app.utils.config import config
-from app.services.openai_processor import process_with_openai
-from app.services.prompt_generation import create_element_prompt
+from app.services.openai_processor import process_with_openai, response_cache, response_cache_key
+from app.services.prompt_generation import (
+    create_element_prompt, create_element_note, create_compact_element_prompt, create_batch_system_prompt
+)
+from app.services.response_cache import ResponseCache, make_cache_key
+from app.services.batching import pack_document_elements, find_sections
+from app.services.batch_protocol import ELEMENT_START, ELEMENT_END, wrap_element, parse_batch_response
+from app.services.elements import DocumentElement
+from app.services.metrics import batch_seconds, batch_size, fallback_elements
 
 logger = logging.getLogger(__name__)
 
-# Constants for batch processing
-ELEMENT_START = "[ELEMENT_START]"
-ELEMENT_END = "[ELEMENT_END]"
+# Per-element cache of simplified text, so edited documents only re-send changed elements
+element_cache = ResponseCache(
+    config.CACHE_PATH,
+    max_entries=config.ELEMENT_CACHE_MAX_ENTRIES,
+    ttl_seconds=config.CACHE_TTL_SECONDS,
+    table="elements",
+    enabled=config.CACHE_ENABLED
+)
 
 
 class DocumentProcessor:
@@ -30,28 +41,58 @@ class DocumentProcessor:
         self.keywords_to_keep = set(keywords_to_keep or [])
         self.highlighted_words = set(highlighted_words or [])
         
-        # Semaphore for limiting concurrent batch processing
-        self.batch_semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_REQUESTS)
+        # Fingerprint of everything besides the element itself that affects the output
+        self.system_prompt_fingerprint = make_cache_key(
+            system_prompt,
+            config.AZURE_OPENAI_DEPLOYMENT_NAME,
+            config.TEMPERATURE,
+            config.MAX_TOKENS,
+            "compact" if config.COMPACT_BATCH_PROMPTS else "full"
+        )
+        
+        # Section (number, heading text) of each element, named in batch prompts for context
+        self.sections = {}
+        
+        # System prompt of compact batches, the same for every batch so its prefix can be cached
+        self.batch_system_prompt = create_batch_system_prompt(system_prompt)
+    
+    def element_cache_key(self, element):
+        """
+        Build the per-element cache key
+        
+        Args:
+            element (DocumentElement): The document element
+            
+        Returns:
+            str: Cache key from the normalized text, element type, highlighted phrases, system prompt and generation settings
+        """
+        normalized_text = " ".join(element.text.split())
+        return make_cache_key(
+            normalized_text,
+            element.type,
+            sorted(element.highlighted_phrases),
+            self.system_prompt_fingerprint
+        )
     
     async def process_element(self, element):
         """
         Process a single document element
         
         Args:
-            element (dict): The document element to process
+            element (DocumentElement): The document element to process
             
         Returns:
             str: The processed text for the element
         """
         # Skip processing for certain element types
-        if element["type"].startswith("heading_") or element["type"] in ["toc_entry", "caption"]:
-            return element["text"]
+        if element.type.startswith("heading_") or element.type in ["toc_entry", "caption"]:
+            return element.text
             
         # Skip empty elements
-        if not element["text"].strip():
-            return element["text"]
+        if not element.text.strip():
+            return element.text
             
-        element_text = element["text"]
+        element_text = element.text
         
         # Create a context-aware prompt based on element type
         user_prompt = create_element_prompt(element, element_text)
@@ -63,119 +104,230 @@ class DocumentProcessor:
             None  # No semaphore
         )
         
-        return processed_text if processed_text else element["text"]
+        return processed_text if processed_text else element.text
         
-    async def process_element_batch(self, elements: List[Dict[str, Any]], 
-                                   start_idx: int, batch_size: int, 
-                                   batch_num: int, total_batches: int,
-                                   element_type: str) -> List[Tuple[int, str]]:
+    async def process_element_batch(self, batch_elements: List[DocumentElement],
+                                   batch_num: int, total_batches: int) -> List[Tuple[int, str]]:
         """
         Process a batch of document elements in a single API call
         
+        Failed calls are retried inside process_with_openai. If the batch still fails
+        it is split in half, and elements missing from the reply are re-sent on their
+        own, before falling back to the original text.
+        
         Args:
-            elements: List of document elements to process
-            start_idx: Starting index in the elements list
-            batch_size: Maximum number of elements to process in this batch
+            batch_elements: The document elements in this batch
             batch_num: Current batch number (1-based)
             total_batches: Total number of batches
-            element_type: Type of element being processed
             
         Returns:
-            List of tuples containing (element_index, processed_text)
+            List of tuples containing (element_id, processed_text)
         """
-        # Use the semaphore to limit concurrent batch processing
-        async with self.batch_semaphore:
-            batch_elements = []
-            batch_indices = []
-            batch_prompts = []
-            
-            # Prepare batch of elements
-            for i in range(start_idx, min(start_idx + batch_size, len(elements))):
-                element = elements[i]
-                
-                # Skip processing for certain element types
-                if element["type"].startswith("heading_") or element["type"] in ["toc_entry", "caption"]:
-                    continue
-                    
-                # Skip empty elements
-                if not element["text"].strip():
-                    continue
-                    
-                # Create a context-aware prompt
-                element_prompt = create_element_prompt(element, element["text"])
-                
-                batch_indices.append(i)
-                batch_elements.append(element)
-                batch_prompts.append(f"{ELEMENT_START}{element_prompt}{ELEMENT_END}")
-            
-            # If no elements to process, return empty list
-            if not batch_prompts:
-                logger.info(f"[Batch {batch_num}/{total_batches}] {element_type}: No elements to process")
-                return []
+        elements = []
+        
+        # Prepare batch of elements
+        for element in batch_elements:
+            # Skip processing for certain element types
+            if element.type.startswith("heading_") or element.type in ["toc_entry", "caption"]:
+                continue
                 
-            # Combine all prompts into one
-            combined_prompt = "\n\n".join(batch_prompts)
+            # Skip empty elements
+            if not element.text.strip():
+                continue
             
-            try:
-                logger.info(f"▶️ [Batch {batch_num}/{total_batches}] Starting {element_type} batch with {len(batch_prompts)} elements")
-                
-                # Process the batch with OpenAI
-                response = await process_with_openai(
-                    system_prompt=f"{self.system_prompt}\nImportant: Maintain the element markers {ELEMENT_START} and {ELEMENT_END} in your response.",
-                    user_prompt=f"Simplify each text segment between the markers:\n\n{combined_prompt}",
-                    semaphore=None
-                )
-                    
-                # Extract individual responses from the combined response
-                results = []
-                current_text = response
-                
-                for i, idx in enumerate(batch_indices):
-                    if ELEMENT_START in current_text and ELEMENT_END in current_text:
-                        start = current_text.find(ELEMENT_START) + len(ELEMENT_START)
-                        end = current_text.find(ELEMENT_END)
-                        
-                        if start >= 0 and end >= 0:
-                            processed_text = current_text[start:end].strip()
-                            results.append((idx, processed_text))
-                            current_text = current_text[end + len(ELEMENT_END):]
-                        else:
-                            # Fallback to original text if markers are not found
-                            results.append((idx, elements[idx]["text"]))
-                    else:
-                        # Fallback to original text if markers are not found
-                        results.append((idx, elements[idx]["text"]))
-                
-                logger.info(f"✅ [Batch {batch_num}/{total_batches}] Completed {element_type} batch: {len(results)} elements processed")
-                return results
-                
-            except Exception as e:
-                logger.error(f"❌ [Batch {batch_num}/{total_batches}] Error processing {element_type} batch: {str(e)}")
-                # Return original text for failed elements
-                return [(idx, elements[idx]["text"]) for idx in batch_indices]
+            elements.append(element)
+        
+        # If no elements to process, return empty list
+        if not elements:
+            logger.info(f"[Batch {batch_num}/{total_batches}] No elements to process")
+            return []
+        
+        # Describe the batch contents for logging, e.g. "paragraph x7, list_item x3"
+        type_counts = {}
+        for element in elements:
+            type_counts[element.type] = type_counts.get(element.type, 0) + 1
+        batch_label = ", ".join(f"{element_type} x{count}" for element_type, count in type_counts.items())
+        
+        log_prefix = f"[Batch {batch_num}/{total_batches}]"
+        logger.info(f"▶️ {log_prefix} Starting batch with {len(elements)} elements ({batch_label})")
+        
+        batch_size.observe(len(elements))
+        with batch_seconds.time():
+            simplified = await self._process_with_recovery(elements, log_prefix)
+        
+        # Fall back to the original text for anything that could not be recovered
+        results = [(element.id, simplified.get(element.id, element.text)) for element in elements]
+        
+        for element in elements:
+            if element.id not in simplified:
+                fallback_elements.inc(element_type=element.type)
+        
+        fallback_count = len(elements) - len(simplified)
+        if fallback_count:
+            logger.error(f"❌ {log_prefix} Kept original text for {fallback_count} of {len(elements)} elements")
+        logger.info(f"✅ {log_prefix} Completed batch: {len(results)} elements processed")
+        return results
     
-    async def process_document_elements(self, elements):
+    def build_batch_prompt(self, elements: List[DocumentElement]) -> Tuple[str, str]:
+        """
+        Build the system and user prompts of one batched call
+        
+        With config.COMPACT_BATCH_PROMPTS the batch instructions are part of a system
+        prompt shared by every batch, and each element is sent as its text with a note on
+        what sets it apart, if anything. Otherwise each element carries its full
+        create_element_prompt. Elements are numbered within the batch, and the heading of
+        each section is named before its first element.
+        
+        Args:
+            elements: The document elements of the batch
+            
+        Returns:
+            tuple: (system_prompt, user_prompt)
+        """
+        compact = config.COMPACT_BATCH_PROMPTS
+        parts = []
+        named_sections = False
+        previous_section = None
+        for batch_id, element in enumerate(elements, 1):
+            if config.SECTION_CHUNKING:
+                section = self.sections.get(element.id)
+                if section and section != previous_section and section[1]:
+                    parts.append(f"Section: {section[1]}")
+                    named_sections = True
+                previous_section = section
+            
+            if compact:
+                note = create_element_note(element)
+                if note:
+                    parts.append(f"Note: {note}")
+                parts.append(wrap_element(batch_id, element.text))
+            else:
+                parts.append(wrap_element(batch_id, create_element_prompt(element, element.text)))
+        
+        if compact:
+            return self.batch_system_prompt, "\n".join(parts)
+        
+        combined_prompt = "\n\n".join(parts)
+        system_prompt = (f"{self.system_prompt}\nImportant: Maintain the element markers "
+                         f"{ELEMENT_START.format(id='N')} and {ELEMENT_END} in your response, keeping each id unchanged.")
+        user_prompt = f"Simplify each text segment between the markers:\n\n{combined_prompt}"
+        if named_sections:
+            user_prompt = ("Simplify each text segment between the markers, in order. Section lines give "
+                           f"context only; do not include them in your response.\n\n{combined_prompt}")
+        return system_prompt, user_prompt
+    
+    async def _send_batch(self, elements: List[DocumentElement]) -> Dict[int, str]:
+        """
+        Send elements to the model in a single API call and parse the reply
+        
+        Args:
+            elements: The document elements to simplify
+            
+        Returns:
+            dict: Mapping of element IDs to simplified text, for the elements found in the reply
+        """
+        system_prompt, user_prompt = self.build_batch_prompt(elements)
+        
+        # Process the batch with OpenAI
+        response = await process_with_openai(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            semaphore=None
+        )
+            
+        # Map the reply back to elements by marker id
+        parsed = parse_batch_response(response, range(1, len(elements) + 1))
+        if parsed.missing or parsed.duplicated:
+            logger.warning(f"Batch reply was missing element ids {parsed.missing} "
+                           f"and had duplicated ids {parsed.duplicated}")
+        
+        simplified = {}
+        cache_entries = {}
+        for batch_id, processed_text in parsed.results.items():
+            if processed_text:
+                element = elements[batch_id - 1]
+                simplified[element.id] = processed_text
+                cache_entries[self.element_cache_key(element)] = processed_text
+        await asyncio.to_thread(element_cache.set_many, cache_entries)
+        
+        if len(simplified) < len(elements):
+            # Don't let an incomplete reply be served from the cache on the retry
+            await asyncio.to_thread(response_cache.delete, response_cache_key(system_prompt, user_prompt))
+        
+        return simplified
+    
+    async def _process_with_recovery(self, elements: List[DocumentElement], log_prefix: str,
+                                     depth: int = 0) -> Dict[int, str]:
+        """
+        Send a batch, then split it or re-send missing elements until BATCH_RECOVERY_DEPTH is reached
+        
+        Args:
+            elements: The document elements to simplify
+            log_prefix: Prefix for log messages, identifying the batch
+            depth: Number of recovery steps already taken
+            
+        Returns:
+            dict: Mapping of element IDs to simplified text, for the elements that succeeded
+        """
+        can_recover = depth < config.BATCH_RECOVERY_DEPTH
+        
+        try:
+            simplified = await self._send_batch(elements)
+        except Exception as e:
+            if not can_recover or len(elements) == 1:
+                logger.error(f"❌ {log_prefix} Error processing {len(elements)} elements: {str(e)}")
+                return {}
+            
+            simplified = {}
+        
+        missing = [element for element in elements if element.id not in simplified]
+        if not missing or not can_recover:
+            return simplified
+        
+        if len(missing) == len(elements) and len(elements) > 1:
+            # Nothing usable came back - try each half on its own
+            middle = len(elements) // 2
+            logger.warning(f"⚠️ {log_prefix} Splitting failed batch of {len(elements)} elements in half")
+            halves = await asyncio.gather(
+                self._process_with_recovery(elements[:middle], log_prefix, depth + 1),
+                self._process_with_recovery(elements[middle:], log_prefix, depth + 1)
+            )
+            for half in halves:
+                simplified.update(half)
+        else:
+            # Only re-send the elements whose markers were missing from the reply
+            logger.warning(f"⚠️ {log_prefix} Re-sending {len(missing)} of {len(elements)} elements missing from the reply")
+            simplified.update(await self._process_with_recovery(missing, log_prefix, depth + 1))
+        
+        return simplified
+    
+    async def process_document_elements(self, elements, progress_callback=None):
         """
         Process all document elements
         
         Args:
             elements (list): The document elements to process
+            progress_callback (callable, optional): Coroutine function called with a progress
+                event dict when processing starts and as soon as each batch completes
             
         Returns:
             dict: A mapping of element IDs to processed text
         """
         processed_elements = {}
         
-        # Group elements to process by type for batching similar elements
+        # Group elements to process by type
         elements_by_type = {}
         for element in elements:
-            element_type = element["type"]
+            element_type = element.type
             if element_type not in elements_by_type:
                 elements_by_type[element_type] = []
             elements_by_type[element_type].append(element)
         
         logger.info(f"Processing {len(elements)} elements in groups by type...")
         
+        # IDs of elements that still need to be sent to the model
+        pending_ids = set()
+        
         # Process each type of element
         for element_type, type_elements in elements_by_type.items():
             total_elements = len(type_elements)
@@ -186,50 +338,98 @@ class DocumentProcessor:
                 # For media elements, just store the element ID with no text
                 if element_type == "media":
                     for element in type_elements:
-                        processed_elements[element["id"]] = None
+                        processed_elements[element.id] = None
                     logger.info(f"✅ Preserved {total_elements} media elements (no processing needed)")
                 else:
                     # For headings and TOC entries, preserve original text
-                    processed_texts = [element["text"] for element in type_elements]
+                    processed_texts = [element.text for element in type_elements]
                     for element, processed_text in zip(type_elements, processed_texts):
-                        processed_elements[element["id"]] = processed_text
+                        processed_elements[element.id] = processed_text
                     logger.info(f"✅ Processed all {total_elements} elements of type: {element_type} (no batching needed)")
                 continue
             
-            # For other element types, use batch processing
-            results = [None] * total_elements
-            
-            # Calculate total number of batches
-            total_batches = math.ceil(total_elements / config.BATCH_SIZE)
-            logger.info(f"🔄 Processing {element_type} in {total_batches} batches (size: {config.BATCH_SIZE}, concurrent: {config.MAX_CONCURRENT_REQUESTS})")
+            # Serve unchanged elements from the element cache and only batch the misses.
+            # The lookup is one bulk query, run off the event loop.
+            cache_keys = [self.element_cache_key(element) for element in type_elements]
+            cached_texts = await asyncio.to_thread(element_cache.get_many, cache_keys)
+            cached_count = 0
+            for element, cache_key in zip(type_elements, cache_keys):
+                cached_text = cached_texts.get(cache_key)
+                if cached_text is not None:
+                    processed_elements[element.id] = cached_text
+                    cached_count += 1
+                else:
+                    pending_ids.add(element.id)
             
-            # Create tasks for parallel batch processing
-            batch_tasks = []
-            for batch_idx in range(total_batches):
-                batch_num = batch_idx + 1  # 1-based batch numbering for readability
-                start_idx = batch_idx * config.BATCH_SIZE
-                
-                # Create a task for each batch
-                task = asyncio.create_task(self.process_element_batch(
-                    type_elements, start_idx, config.BATCH_SIZE,
-                    batch_num, total_batches, element_type
-                ))
-                batch_tasks.append((batch_num, task))
-            
-            # Wait for all batches to complete
-            for batch_num, task in batch_tasks:
-                batch_results = await task
-                
-                # Store results
-                for idx, processed_text in batch_results:
-                    results[idx] = processed_text
+            if cached_count:
+                logger.info(f"♻️ Reused {cached_count} cached {element_type} elements")
+        
+        # Pack the remaining elements, in document order, into token-bounded batches,
+        # keeping the elements under one heading together where they fit
+        self.sections.update(find_sections(elements))
+        pending_elements = [element for element in elements if element.id in pending_ids]
+        prompt_builder = create_compact_element_prompt if config.COMPACT_BATCH_PROMPTS else create_element_prompt
+        batches = pack_document_elements(
+            pending_elements, prompt_builder=prompt_builder, sections=self.sections
+        ) if pending_elements else []
+        total_batches = len(batches)
+        
+        if progress_callback:
+            # Everything not waiting on the model is already final
+            await progress_callback({
+                "event": "started",
+                "total_elements": len(elements),
+                "total_batches": total_batches,
+                "elements": [
+                    {"id": element_id, "text": processed_text}
+                    for element_id, processed_text in processed_elements.items()
+                    if processed_text is not None
+                ]
+            })
+        
+        if not pending_ids:
+            logger.info("✅ All elements served from cache or preserved")
+            return processed_elements
+        
+        logger.info(f"🔄 Processing {len(pending_elements)} elements in {total_batches} batches "
+                    f"(max size: {config.BATCH_SIZE}, concurrent: {config.MAX_CONCURRENT_REQUESTS})")
+        
+        async def run_batch(batch_elements, batch_num):
+            batch_results = await self.process_element_batch(batch_elements, batch_num, total_batches)
             
-            # Fill in any missing results with original text
-            for i, element in enumerate(type_elements):
-                if results[i] is None:
-                    results[i] = element["text"]
-                processed_elements[element["id"]] = results[i]
+            # Report the batch as soon as it is done, not in submission order
+            if progress_callback:
+                await progress_callback({
+                    "event": "batch",
+                    "batch": batch_num,
+                    "total_batches": total_batches,
+                    "elements": [
+                        {"id": element_id, "text": processed_text}
+                        for element_id, processed_text in batch_results
+                    ]
+                })
+            return batch_results
+        
+        # Create tasks for parallel batch processing
+        batch_tasks = []
+        for batch_idx, batch_elements in enumerate(batches):
+            batch_num = batch_idx + 1  # 1-based batch numbering for readability
+            task = asyncio.create_task(run_batch(batch_elements, batch_num))
+            batch_tasks.append((batch_num, task))
+        
+        # Wait for all batches to complete
+        for batch_num, task in batch_tasks:
+            batch_results = await task
             
-            logger.info(f"✅ Completed all {total_batches} batches of {element_type}")
+            # Store results
+            for element_id, processed_text in batch_results:
+                processed_elements[element_id] = processed_text
+        
+        # Fill in any missing results with original text
+        for element in pending_elements:
+            if processed_elements.get(element.id) is None:
+                processed_elements[element.id] = element.text
+        
+        logger.info(f"✅ Completed all {total_batches} batches")
         
         return processed_elements 
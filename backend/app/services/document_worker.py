@@ -0,0 +1,124 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import docx
+
+from app.utils.config import config
+from app.utils.logger import init_logger
+from app.services.extraction import extract_document_structure
+from app.services.formatting import rebuild_document
+from app.services.readability import score_elements
+
+logger = logging.getLogger(__name__)
+
+# Process pool for CPU-bound document work, created on first use
+_pool = None
+
+
+def get_document_pool():
+    """
+    Return the shared process pool for document parsing, rebuilding and saving
+
+    Workers are spawned rather than forked, since the server process runs threads
+    (the event loop's executor, SQLite connections) that must not be copied.
+
+    Returns:
+        ProcessPoolExecutor: The pool
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=config.DOCUMENT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_logger
+        )
+        logger.info(f"🧵 Started document process pool with {config.DOCUMENT_WORKERS} workers")
+    return _pool
+
+
+def shutdown_document_pool():
+    """Stop the process pool, if it was started"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_document_task(function, *args):
+    """
+    Run a CPU-bound document function without blocking the event loop
+
+    Uses the process pool, or a thread when config.DOCUMENT_WORKERS is 0.
+
+    Args:
+        function: Module-level function to run; its arguments and result must be picklable
+        *args: Arguments for the function
+
+    Returns:
+        The function's result
+    """
+    if not config.DOCUMENT_WORKERS:
+        return await asyncio.to_thread(function, *args)
+    return await asyncio.get_running_loop().run_in_executor(get_document_pool(), function, *args)
+
+
+def _open_document(source):
+    """Open a document from a path or from its bytes"""
+    if isinstance(source, (bytes, bytearray)):
+        return docx.Document(io.BytesIO(source))
+    return docx.Document(source)
+
+
+def load_document_elements(source, highlighted_words, keywords_to_keep):
+    """
+    Parse a document and extract its elements, detached from the document
+
+    Runs in a worker process.
+
+    Args:
+        source (str or bytes): Path to the document, or its content
+        highlighted_words (set): Highlighted words collected so far
+        keywords_to_keep (list): Keywords that should be preserved
+
+    Returns:
+        tuple: (elements, highlighted_words) - the elements hold no XML handles,
+        and highlighted_words includes the phrases found in the document
+    """
+    doc = _open_document(source)
+    elements = extract_document_structure(doc, highlighted_words, keywords_to_keep=keywords_to_keep)
+
+    for element in elements:
+        if element.type == "media":
+            element.xml_element = None
+
+    return elements, highlighted_words
+
+
+def build_simplified_document(source, elements, processed_elements):
+    """
+    Parse the original document again, write the processed text into it, serialize it and score it
+
+    Runs in a worker process. The detached elements address their paragraphs by index.
+
+    Args:
+        source (str or bytes): Path to the original document, or its content
+        elements (list): Elements returned by load_document_elements
+        processed_elements (dict): Processed text by element id
+
+    Returns:
+        tuple: (simplified_text, readability, document_bytes, scoring_seconds) - readability is
+        a ReadabilityReport, scoring_seconds the part of the work spent scoring
+    """
+    doc = _open_document(source)
+    simplified_text = rebuild_document(doc, elements, processed_elements)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+
+    started = time.perf_counter()
+    readability = score_elements(elements, processed_elements)
+    return simplified_text, readability, buffer.getvalue(), time.perf_counter() - started
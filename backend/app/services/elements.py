@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from typing import Any, FrozenSet, Optional, Tuple
+
+# Shared by every element without highlighted text
+NO_PHRASES = frozenset()
+
+
+@dataclass
+class RunData:
+    """Text and formatting of one run in a paragraph"""
+    __slots__ = ("text", "bold", "italic", "underline", "highlight", "font_size", "font_name", "color")
+
+    text: str
+    bold: Optional[bool]
+    italic: Optional[bool]
+    underline: Any
+    highlight: bool
+    font_size: Optional[float]
+    font_name: Optional[str]
+    color: Optional[str]  # Hex RGB, e.g. "FF0000"
+
+
+@dataclass
+class ParagraphFormat:
+    """Paragraph-level formatting of an element"""
+    __slots__ = ("alignment", "left_indent", "right_indent", "first_line_indent", "line_spacing",
+                 "keep_together", "keep_with_next", "page_break_before", "has_math")
+
+    alignment: Any
+    left_indent: float
+    right_indent: float
+    first_line_indent: float
+    line_spacing: Any
+    keep_together: Optional[bool]
+    keep_with_next: Optional[bool]
+    page_break_before: Optional[bool]
+    has_math: bool
+
+
+@dataclass
+class ListInfo:
+    """Marker type ("bullet" or "number") and nesting level of a list item"""
+    __slots__ = ("type", "level")
+
+    type: str
+    level: int
+
+
+@dataclass
+class DocumentElement:
+    """A paragraph of text extracted from a document, with its structure and formatting"""
+    __slots__ = ("id", "index", "type", "text", "style", "format", "runs", "highlighted_phrases", "list_info")
+
+    id: int
+    index: int  # Position of the paragraph in iter_story_paragraphs order
+    type: str
+    text: str
+    style: str
+    format: ParagraphFormat
+    runs: Tuple[RunData, ...]
+    highlighted_phrases: FrozenSet[str]
+    list_info: Optional[ListInfo]
+
+
+@dataclass
+class MediaElement:
+    """An image, chart or other media found in a document, kept as is"""
+    __slots__ = ("id", "index", "type", "media_type", "rel_id", "target", "xml_element")
+
+    id: int
+    index: Optional[int]  # Paragraph holding the media, None for media found through relationships
+    type: str
+    media_type: str
+    rel_id: Optional[str]
+    target: Optional[str]
+    xml_element: Any
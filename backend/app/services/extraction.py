@@ -1,24 +1,94 @@
 import re
-import uuid
+import sys
 import logging
+from itertools import count
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.part import PartFactory, XmlPart
+from docx.oxml.ns import qn
+from docx.parts.story import StoryPart
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+
+from app.services.elements import RunData, ParagraphFormat, ListInfo, DocumentElement, MediaElement, NO_PHRASES
 
 logger = logging.getLogger(__name__)
 
+W_P = qn("w:p")
+W_R = qn("w:r")
+W_HYPERLINK = qn("w:hyperlink")
+W_TC = qn("w:tc")
+W_TXBX_CONTENT = qn("w:txbxContent")
+W_DRAWING = qn("w:drawing")
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+# python-docx loads footnotes and endnotes as opaque parts. As story parts their XML
+# is parsed, so their paragraphs can be read and rewritten, and is saved back.
+PartFactory.part_type_for.setdefault(CT.WML_FOOTNOTES, StoryPart)
+PartFactory.part_type_for.setdefault(CT.WML_ENDNOTES, StoryPart)
+
+# Parts holding text outside the body, in the order their paragraphs are enumerated
+STORY_PARTS = ((RT.HEADER, "header"), (RT.FOOTER, "footer"), (RT.FOOTNOTES, "footnote"), (RT.ENDNOTES, "endnote"))
+
+
+class _StoryContainer:
+    """Parent of the paragraphs of a header, footer or notes part, for the proxies that look up their part"""
+
+    def __init__(self, part):
+        self.part = part
+
+
+def iter_story_paragraphs(doc):
+    """
+    Yield every paragraph of the document's stories in a fixed order
+    
+    The body comes first, with the paragraphs of tables and text boxes in document
+    order, then the headers, footers, footnotes and endnotes. Extraction and rebuild
+    both number paragraphs by this order, so parsing the same document again finds
+    each paragraph at the same index. Fallback copies of text boxes (mc:Fallback)
+    are skipped, as Word shows the mc:Choice content they duplicate.
+    
+    Args:
+        doc: The Word document
+        
+    Yields:
+        tuple: (story, paragraph XML element, parent for its Paragraph proxy) - story is
+        "body", "header", "footer", "footnote" or "endnote"
+    """
+    stories = [("body", doc.element.body, doc._body)]
+    for reltype, story in STORY_PARTS:
+        parts = {rel.target_part for rel in doc.part.rels.values() if not rel.is_external and rel.reltype == reltype}
+        for part in sorted(parts, key=lambda part: str(part.partname)):
+            if isinstance(part, XmlPart):
+                stories.append((story, part.element, _StoryContainer(part)))
+    
+    for story, root, parent in stories:
+        for p in root.iter(W_P):
+            if next(p.iterancestors(MC_FALLBACK), None) is None:
+                yield story, p, parent
+
 
 def extract_document_structure(doc, highlighted_words=None, keywords_to_keep=None):
     """
     Extract document structure including styles, headings, lists, etc.
     Returns a structured representation that preserves formatting.
     
+    Every story of the document is walked once: the body with its tables and text
+    boxes, headers, footers, footnotes and endnotes (see iter_story_paragraphs). Each
+    paragraph's text, runs, formatting, drawings and math are collected together from
+    its XML element, and only one paragraph proxy is created per paragraph. Paragraphs
+    outside plain body text get their own element types, e.g. "table_cell" or "footnote".
+    Elements get integer ids that are unique within the document, and style and font
+    names are interned.
+    
     Args:
         doc: The Word document to process
         highlighted_words: Set to collect highlighted words (modified in-place)
         keywords_to_keep: List of keywords that should be preserved
         
     Returns:
-        list: A list of document elements with their structure and formatting
+        list: DocumentElement and MediaElement objects, text elements first
     """
-    highlighted_words = highlighted_words or set()
+    highlighted_words = highlighted_words if highlighted_words is not None else set()
     keywords_to_keep = keywords_to_keep or []
     
     # Don't automatically add keywords_to_keep to highlighted_words
@@ -34,50 +104,92 @@ def extract_document_structure(doc, highlighted_words=None, keywords_to_keep=Non
     # Track media elements in the document
     media_elements = []
     
-    # Process all paragraphs as structured elements
-    for i, paragraph in enumerate(doc.paragraphs):
-        if not paragraph.text.strip():
+    # Integer element ids, unique within this document
+    next_id = count()
+    
+    # Style names resolved once per style id rather than once per paragraph
+    style_names = {}
+    
+    # Walk the paragraphs of every story once, numbering them in iter_story_paragraphs order
+    for i, (story, p, parent) in enumerate(iter_story_paragraphs(doc)):
+        # Record drawings here so image-only paragraphs are kept intact
+        for shape in _iter_own_drawings(p):
+            media_element = MediaElement(
+                id=next(next_id),
+                index=i,  # Associate with paragraph index
+                type="media",
+                media_type="inline_shape",
+                rel_id=None,
+                target=None,
+                xml_element=shape
+            )
+            media_elements.append(media_element)
+        
+        # Paragraph text is the run texts plus hyperlink texts, so each run's text is read once
+        run_texts = []
+        text_parts = []
+        for child in p.iterchildren(W_R, W_HYPERLINK):
+            child_text = child.text
+            text_parts.append(child_text)
+            if child.tag == W_R:
+                run_texts.append((child, child_text))
+        
+        text = "".join(text_parts)
+        if not text.strip():
             continue  # Skip empty paragraphs but maintain them in the document
+        
+        paragraph = Paragraph(p, parent)
             
         # Determine paragraph type based on style
-        style_name = paragraph.style.name.lower()
+        style_id = p.style
+        if style_id not in style_names:
+            style = paragraph.style
+            style_names[style_id] = sys.intern(style.name.lower()) if style is not None and style.name else ""
+        style_name = style_names[style_id]
         
         # Extract formatting information
         format_info = _extract_paragraph_format(paragraph)
         
         # Determine element type
-        element_type = _determine_element_type(paragraph, style_name)
+        element_type = _story_element_type(_determine_element_type(paragraph, style_name, text), story, p)
         
         # Extract and process runs with their formatting
         runs_data = []
         highlighted_phrases = set()
         highlighted_text = ""
+        previous_highlighted = False
         
-        for j, run in enumerate(paragraph.runs):
-            run_data = {
-                "text": run.text,
-                "bold": run.bold,
-                "italic": run.italic,
-                "underline": run.underline,
-                "highlight": run.font.highlight_color is not None,
-                "font_size": run.font.size.pt if run.font.size else None,
-                "font_name": run.font.name if run.font.name else None,
-                "color": _extract_color(run)
-            }
+        for r, run_text in run_texts:
+            run = Run(r, paragraph)
+            font = run.font  # One font proxy per run instead of one per property
+            font_size = font.size
+            is_highlighted = font.highlight_color is not None
+            font_name = font.name
+            run_data = RunData(
+                text=run_text,
+                bold=font.bold,
+                italic=font.italic,
+                underline=run.underline,
+                highlight=is_highlighted,
+                font_size=font_size.pt if font_size else None,
+                font_name=sys.intern(font_name) if font_name else None,
+                color=_extract_color(font)
+            )
             
-            if run.font.highlight_color:
-                if j > 0 and paragraph.runs[j-1].font.highlight_color:
-                    highlighted_text += run.text if run.text else " "
+            if is_highlighted:
+                if previous_highlighted:
+                    highlighted_text += run_text if run_text else " "
                 else:
                     if highlighted_text:
                         highlighted_phrases.add(highlighted_text)
                         highlighted_words.add(highlighted_text)
-                    highlighted_text = run.text if run.text else " "
+                    highlighted_text = run_text if run_text else " "
             elif highlighted_text:
                 highlighted_phrases.add(highlighted_text)
                 highlighted_words.add(highlighted_text)
                 highlighted_text = ""
             
+            previous_highlighted = is_highlighted
             runs_data.append(run_data)
         
         # Add any remaining highlighted text
@@ -87,112 +199,111 @@ def extract_document_structure(doc, highlighted_words=None, keywords_to_keep=Non
             highlighted_text = ""
         
         # Create a document element preserving structure and formatting
-        element = {
-            "id": str(uuid.uuid4()),
-            "index": i,
-            "type": element_type,
-            "text": paragraph.text,
-            "style": style_name,
-            "format": format_info,
-            "runs": runs_data,
-            "highlighted_phrases": highlighted_phrases,
-            "list_info": _extract_list_info(paragraph) if element_type == "list_item" else None
-        }
+        element = DocumentElement(
+            id=next(next_id),
+            index=i,
+            type=element_type,
+            text=text,
+            style=style_name,
+            format=format_info,
+            runs=tuple(runs_data),
+            highlighted_phrases=frozenset(highlighted_phrases) if highlighted_phrases else NO_PHRASES,
+            list_info=_extract_list_info(paragraph, text) if element_type == "list_item" else None
+        )
         
         document_elements.append(element)
     
-    # Extract inline shapes and media elements
-    for i, paragraph in enumerate(doc.paragraphs):
-        # Check for inline shapes in the paragraph
-        for shape in paragraph._element.xpath('.//w:drawing'):
-            media_element = {
-                "id": str(uuid.uuid4()),
-                "type": "media",
-                "index": i,  # Associate with paragraph index
-                "media_type": "inline_shape",
-                "xml_element": shape
-            }
-            media_elements.append(media_element)
-    
     # Extract all document parts that might contain media
     for rel_id, rel in doc.part.rels.items():
         # Check for images, charts, and other media
         if any(media_type in rel.target_ref for media_type in 
               ['image', 'media', 'chart', 'diagram', 'drawing']):
-            media_element = {
-                "id": str(uuid.uuid4()),
-                "type": "media",
-                "media_type": "embedded_media",
-                "rel_id": rel_id,
-                "target": rel.target_ref
-            }
+            media_element = MediaElement(
+                id=next(next_id),
+                index=None,
+                type="media",
+                media_type="embedded_media",
+                rel_id=rel_id,
+                target=rel.target_ref,
+                xml_element=None
+            )
             media_elements.append(media_element)
     
-    # Check for any shapes in the document
-    if hasattr(doc, 'inline_shapes') and doc.inline_shapes:
-        for i, shape in enumerate(doc.inline_shapes):
-            # Find the paragraph containing this shape
-            for p_idx, paragraph in enumerate(doc.paragraphs):
-                if any(run._element.xpath('.//w:drawing') for run in paragraph.runs):
-                    media_element = {
-                        "id": str(uuid.uuid4()),
-                        "type": "media",
-                        "index": p_idx,  # Associate with paragraph index
-                        "media_type": "inline_shape",
-                        "shape_index": i
-                    }
-                    media_elements.append(media_element)
-                    break
-    
     # Add media elements to the document elements list
     document_elements.extend(media_elements)
     
     logger.info(f"📋 Extracted {len(document_elements)} document elements (including {len(media_elements)} media elements)")
     return document_elements
 
+def _iter_own_drawings(p):
+    """Yield the drawings in a paragraph's runs, leaving out those of the paragraphs in its text boxes"""
+    for child in p.iterchildren(W_R, W_HYPERLINK):
+        for shape in child.iter(W_DRAWING):
+            ancestor = shape.getparent()
+            while ancestor is not child and ancestor.tag != W_TXBX_CONTENT:
+                ancestor = ancestor.getparent()
+            if ancestor is child:
+                yield shape
+
+
 def _extract_paragraph_format(paragraph):
     """Extract paragraph formatting information"""
-    return {
-        "alignment": paragraph.alignment,
-        "left_indent": paragraph.paragraph_format.left_indent.pt if paragraph.paragraph_format.left_indent else 0,
-        "right_indent": paragraph.paragraph_format.right_indent.pt if paragraph.paragraph_format.right_indent else 0,
-        "first_line_indent": paragraph.paragraph_format.first_line_indent.pt if paragraph.paragraph_format.first_line_indent else 0,
-        "line_spacing": paragraph.paragraph_format.line_spacing,
-        "keep_together": paragraph.paragraph_format.keep_together,
-        "keep_with_next": paragraph.paragraph_format.keep_with_next,
-        "page_break_before": paragraph.paragraph_format.page_break_before,
-        "has_math": bool(paragraph._element.xpath(".//m:oMath"))
-    }
-
-def _extract_color(run):
-    """Extract run color information"""
-    if not run.font.color.rgb:
-        return None
-    return run.font.color.rgb
+    paragraph_format = paragraph.paragraph_format
+    return ParagraphFormat(
+        alignment=paragraph.alignment,
+        left_indent=paragraph_format.left_indent.pt if paragraph_format.left_indent else 0,
+        right_indent=paragraph_format.right_indent.pt if paragraph_format.right_indent else 0,
+        first_line_indent=paragraph_format.first_line_indent.pt if paragraph_format.first_line_indent else 0,
+        line_spacing=paragraph_format.line_spacing,
+        keep_together=paragraph_format.keep_together,
+        keep_with_next=paragraph_format.keep_with_next,
+        page_break_before=paragraph_format.page_break_before,
+        has_math=next(paragraph._element.iter(qn("m:oMath")), None) is not None
+    )
+
+def _extract_color(font):
+    """Extract a run's explicit RGB color as a hex string, e.g. "FF0000" """
+    rgb = font.color.rgb
+    return str(rgb) if rgb is not None else None
 
-def _extract_list_info(paragraph):
+def _extract_list_info(paragraph, text):
     """Extract list information from a paragraph"""
-    list_info = {}
-    
     # Look for indentation and bullet/number markers
-    text = paragraph.text.strip()
+    text = text.strip()
     if text.startswith('•') or text.startswith('-') or text.startswith('*'):
-        list_info["type"] = "bullet"
-        list_info["level"] = 0  # Default level
+        list_type = "bullet"
     elif re.match(r'^\d+\.', text) or re.match(r'^[a-zA-Z]\.', text):
-        list_info["type"] = "number"
-        list_info["level"] = 0  # Default level
+        list_type = "number"
+    else:
+        return None
     
-    # If we identified a list item, adjust level based on indentation
-    if list_info.get("type"):
-        if paragraph.paragraph_format.left_indent:
-            # Estimate list level based on indentation
-            indent = paragraph.paragraph_format.left_indent.pt
-            list_info["level"] = int(indent / 36)  # Rough estimate: ~36pt per level
+    # Estimate list level based on indentation
+    level = 0  # Default level
+    left_indent = paragraph.paragraph_format.left_indent
+    if left_indent:
+        level = int(left_indent.pt / 36)  # Rough estimate: ~36pt per level
     
-    return list_info
+    return ListInfo(type=list_type, level=level)
+
+def _story_element_type(element_type, story, p):
+    """
+    Refine a paragraph's element type by where it sits
+    
+    Header and footer paragraphs are typed by their story, since their "Header" and
+    "Footer" styles would otherwise pass for headings. Other paragraphs keep heading
+    and list types, and plain paragraphs become "table_cell" or "text_box" by their
+    nearest container, or "footnote" or "endnote" in the notes.
+    """
+    if story in ("header", "footer"):
+        return story if element_type != "list_item" else element_type
+    if element_type != "paragraph":
+        return element_type
+    container = next(p.iterancestors(W_TC, W_TXBX_CONTENT), None)
+    if container is not None:
+        return "table_cell" if container.tag == W_TC else "text_box"
+    return story if story != "body" else element_type
 
-def _determine_element_type(paragraph, style_name):
+def _determine_element_type(paragraph, style_name, text):
     """Determine the element type based on paragraph style and content"""
     # Check for headings
     if "heading" in style_name or "title" in style_name or "header" in style_name:
@@ -203,10 +314,10 @@ def _determine_element_type(paragraph, style_name):
                 if digit in style_name:
                     level = int(digit)
                     break
-        return f"heading_{level}"
+        return sys.intern(f"heading_{level}")
     
     # Check for list items
-    text = paragraph.text.strip()
+    text = text.strip()
     if text.startswith('•') or text.startswith('-') or text.startswith('*'):
         return "list_item"
     if re.match(r'^\d+\.', text) or re.match(r'^[a-zA-Z]\.', text):
@@ -1,15 +1,64 @@
 import logging
 import re
+from difflib import SequenceMatcher
 from docx.enum.text import WD_COLOR_INDEX
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 import copy
 
+from app.services.extraction import iter_story_paragraphs
+
 logger = logging.getLogger(__name__)
 
+W_R = qn("w:r")
+W_HYPERLINK = qn("w:hyperlink")
+
+# A note's own number, at the start of the footnote or endnote text
+_NOTE_MARKS = (qn("w:footnoteRef"), qn("w:endnoteRef"))
+
+# References in the text to a footnote or endnote
+_NOTE_REFERENCES = (qn("w:footnoteReference"), qn("w:endnoteReference"))
+
+# Words and the text between them
+_WORD_PATTERN = re.compile(r"\w+")
+_SEGMENT_PATTERN = re.compile(r"\w+|\W+")
+
+# Bullet or number marker at the start of a list item
+_LIST_MARKER_PATTERN = re.compile(r'^(\s*[-•*]|\s*\d+\.|\s*[a-zA-Z]\.)\s+')
+
+# Formatting carried over to the simplified text: (bold, italic, underline, highlight)
+PLAIN = (False, False, False, False)
+
+
+def compile_highlight_pattern(phrases):
+    """
+    Compile highlighted phrases into one regex alternation, longest phrase first
+    
+    Trying longer phrases first means a phrase that contains another one wins
+    at the same position, and matches never overlap.
+    
+    Args:
+        phrases: Highlighted phrases
+        
+    Returns:
+        re.Pattern or None: The compiled pattern, or None if there is nothing to match
+    """
+    phrases = sorted({phrase for phrase in phrases if phrase and phrase.strip()}, key=lambda p: (-len(p), p))
+    if not phrases:
+        return None
+    return re.compile("|".join(re.escape(phrase) for phrase in phrases))
+
 
 def rebuild_document(doc, elements, processed_elements):
     """
     Rebuild the document with processed elements
     
+    Each element's paragraph is addressed by its index in iter_story_paragraphs order.
+    Paragraphs whose processed text is identical to the original, and paragraphs
+    without an element, are left untouched. Footnote and endnote marks survive the
+    rewrite of their paragraph, and each note reference stays after the word it followed.
+    
     Args:
         doc: The Word document to rebuild
         elements: The original document elements
@@ -20,64 +69,158 @@ def rebuild_document(doc, elements, processed_elements):
     """
     logger.info("🔄 Rebuilding document with simplified text...")
     
+    # One highlight matcher per distinct set of highlighted phrases. A matcher holding
+    # phrases of other paragraphs could match a longer phrase over this paragraph's own.
+    highlight_patterns = {}
+    
     # Separate media elements from text elements
-    text_elements = [e for e in elements if e["type"] != "media"]
-    media_elements = [e for e in elements if e["type"] == "media"]
+    text_elements = [e for e in elements if e.type != "media"]
+    media_elements = [e for e in elements if e.type == "media"]
     
     logger.info(f"Found {len(text_elements)} text elements and {len(media_elements)} media elements")
     
-    # Create a set of paragraph indexes that contain media elements
-    media_paragraph_indexes = set()
-    for media_element in media_elements:
-        if "index" in media_element:
-            media_paragraph_indexes.add(media_element["index"])
+    # Paragraphs containing media elements are kept as they are
+    media_paragraph_indexes = {e.index for e in media_elements if e.index is not None}
     
     logger.info(f"Found {len(media_paragraph_indexes)} paragraphs containing media elements")
     
-    # Create a mapping of element indexes to original paragraphs
-    paragraph_map = {}
-    for i, para in enumerate(doc.paragraphs):
-        paragraph_map[i] = para
+    # Only built once an element's text has changed
+    paragraphs = None
     
-    # Only clear paragraphs that don't contain media elements
-    for i, paragraph in enumerate(doc.paragraphs):
-        if i not in media_paragraph_indexes:
-            paragraph.clear()
-    
-    # Rebuild each paragraph with its processed text
-    simplified_full_text = ""
+    simplified_lines = []
+    rewritten = 0
     
     for element in text_elements:
-        element_id = element["id"]
-        original_index = element["index"]
-        
         # Skip paragraphs that contain media elements
-        if original_index in media_paragraph_indexes:
-            simplified_full_text += element["text"] + "\n"
+        if element.index in media_paragraph_indexes:
+            simplified_lines.append(element.text)
             continue
         
-        # Get the processed text for this element
-        processed_text = processed_elements.get(element_id, element["text"])
+        # Get the processed text for this element, using the original text if there is none
+        processed_text = processed_elements.get(element.id)
+        if processed_text is None:
+            processed_text = element.text
+        simplified_lines.append(processed_text)
         
-        # Ensure processed_text is not None before concatenating
-        if processed_text is not None:
-            simplified_full_text += processed_text + "\n"
-        else:
-            simplified_full_text += element["text"] + "\n"
-            processed_text = element["text"]  # Use original text if processed text is None
+        # Nothing changed - keep the paragraph and its original formatting
+        if processed_text == element.text:
+            continue
         
-        # Get the original paragraph
-        paragraph = paragraph_map.get(original_index)
-        if not paragraph:
+        if paragraphs is None:
+            paragraphs = [(p, parent) for _, p, parent in iter_story_paragraphs(doc)]
+        if element.index >= len(paragraphs):
             continue
+        paragraph = Paragraph(*paragraphs[element.index])
         
         # Apply text and restore formatting
-        restore_paragraph_formatting(paragraph, element, processed_text)
+        note_marks, note_references = _detach_note_runs(paragraph)
+        paragraph.clear()
+        paragraph._element.extend(note_marks)
+        phrases = element.highlighted_phrases
+        if phrases and phrases not in highlight_patterns:
+            highlight_patterns[phrases] = compile_highlight_pattern(phrases)
+        restore_paragraph_formatting(paragraph, element, processed_text, highlight_patterns.get(phrases))
+        _place_note_references(paragraph, element.text, note_references)
+        rewritten += 1
+    
+    logger.info(f"✅ Document rebuilt with {len(text_elements)} text elements ({rewritten} rewritten) "
+                f"and {len(media_elements)} preserved media elements")
+    return "".join(line + "\n" for line in simplified_lines)
+
+def _detach_note_runs(paragraph):
+    """
+    Find the runs of a paragraph holding footnote or endnote marks, to keep them when it is cleared
+    
+    Only the paragraph's own runs are searched, not those of paragraphs in its text boxes.
+    
+    Returns:
+        tuple: (marks, references) - runs with a note's own number, which go back before
+        the new text, and (offset in the paragraph text, run) pairs for runs referencing a note
+    """
+    marks = []
+    references = []
+    offset = 0
+    for child in paragraph._element.iterchildren(W_R, W_HYPERLINK):
+        for r in [child] if child.tag == W_R else child.iterchildren(W_R):
+            if next(r.iter(*_NOTE_MARKS), None) is not None:
+                marks.append(r)
+            elif next(r.iter(*_NOTE_REFERENCES), None) is not None:
+                references.append((offset, r))
+            offset += len(r.text)
+    return marks, references
+
+def _place_note_references(paragraph, original_text, references):
+    """
+    Put footnote and endnote references back into a rewritten paragraph, each after the word it followed
+    
+    The words of the original and the rewritten text are aligned with difflib. A
+    reference after the paragraph's last word stays at its end. A reference whose
+    word was dropped follows the nearest earlier word that was kept, or ends the
+    paragraph if there is none.
+    
+    Args:
+        paragraph: The rewritten Word paragraph
+        original_text: The paragraph's original text
+        references: (offset in original_text, run) pairs from _detach_note_runs
+    """
+    if not references:
+        return
+    
+    runs = list(paragraph._element.iterchildren(W_R))
+    new_text = "".join(r.text for r in runs)
+    original_words = list(_WORD_PATTERN.finditer(original_text))
+    new_words = list(_WORD_PATTERN.finditer(new_text))
+    matcher = SequenceMatcher(None, [m.group().lower() for m in original_words],
+                              [m.group().lower() for m in new_words], autojunk=False)
+    aligned = {}
+    for original_start, new_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            aligned[original_start + offset] = new_start + offset
+    
+    placements = []
+    for offset, reference in references:
+        # The last original word before the reference, or the nearest earlier one that was kept
+        word = sum(1 for m in original_words if m.end() <= offset) - 1
+        following = word
+        while following >= 0 and following not in aligned:
+            following -= 1
+        if word < 0:
+            position = 0
+        elif following < 0 or word == len(original_words) - 1:
+            position = len(new_text)
+        else:
+            position = new_words[aligned[following]].end()
+            # Keep the punctuation between the word and the reference, e.g. "claim.[1]"
+            gap = original_text[original_words[word].end():offset] if following == word else ""
+            if gap and new_text.startswith(gap, position):
+                position += len(gap)
+        placements.append((position, reference))
     
-    logger.info(f"✅ Document rebuilt with {len(text_elements)} text elements and {len(media_elements)} preserved media elements")
-    return simplified_full_text
+    for position, reference in sorted(placements, key=lambda placement: placement[0]):
+        # Insert before the first run with text at or after the position, splitting the run it falls in
+        index = len(runs)
+        start = 0
+        for i, r in enumerate(runs):
+            text = r.text
+            if text and start + len(text) > position:
+                if start < position:
+                    rest = copy.deepcopy(r)
+                    Run(r, paragraph).text = text[:position - start]
+                    Run(rest, paragraph).text = text[position - start:]
+                    r.addnext(rest)
+                    runs.insert(i + 1, rest)
+                    index = i + 1
+                else:
+                    index = i
+                break
+            start += len(text)
+        if index < len(runs):
+            runs[index].addprevious(reference)
+        else:
+            paragraph._element.append(reference)
+        runs.insert(index, reference)
 
-def restore_paragraph_formatting(paragraph, element, processed_text):
+def restore_paragraph_formatting(paragraph, element, processed_text, highlight_pattern=None):
     """
     Restore formatting to a paragraph based on the original element
     
@@ -85,118 +228,91 @@ def restore_paragraph_formatting(paragraph, element, processed_text):
         paragraph: The Word paragraph to format
         element: The original document element
         processed_text: The processed text for this element
+        highlight_pattern: Compiled matcher for the element's highlighted phrases
+            (default: compiled from them)
     """
     # Set paragraph text
     if not processed_text:
         return
         
     # Determine if the element had any highlighted text
-    highlighted_phrases = element["highlighted_phrases"]
+    highlighted_phrases = element.highlighted_phrases
+    runs = element.runs
     
     # If it's a heading, preserve full formatting
-    if element["type"].startswith("heading_") or element["type"] in ["toc_entry", "caption"]:
+    if element.type.startswith("heading_") or element.type in ["toc_entry", "caption"]:
         # Set paragraph alignment
-        if element["format"]["alignment"] is not None:
-            paragraph.alignment = element["format"]["alignment"]
+        if element.format.alignment is not None:
+            paragraph.alignment = element.format.alignment
             
         # Create a single run with the paragraph's text
         run = paragraph.add_run(processed_text)
         
         # Apply formatting from original runs
-        if element["runs"] and len(element["runs"]) > 0:
-            for run_data in element["runs"]:
-                if run_data["bold"]:
-                    run.bold = True
-                    break
+        if any(run_data.bold for run_data in runs):
+            run.bold = True
                 
         return
         
     # For list items, keep the original list marker formatting
-    if element["type"] == "list_item":
-        # Extract list marker if present
-        list_marker = ""
-        text = processed_text
-        
+    if element.type == "list_item":
         # Check for bullet or number markers
-        match = re.match(r'^(\s*[-•*]|\s*\d+\.|\s*[a-zA-Z]\.)\s+', processed_text)
+        match = _LIST_MARKER_PATTERN.match(processed_text)
         if match:
-            list_marker = match.group(1)
-            text = processed_text[len(match.group(0)):]
-            
             # Add the list marker with original formatting
-            run = paragraph.add_run(list_marker + " ")
-            paragraph.alignment = element["format"]["alignment"]
-            processed_text = text  # Continue with the rest of the text
+            paragraph.add_run(match.group(1) + " ")
+            paragraph.alignment = element.format.alignment
+            processed_text = processed_text[match.end():]  # Continue with the rest of the text
     
     # For regular paragraphs or the remaining text in list items
     # Try to map original formatting to the simplified text
     
     # Check if we can do word-by-word formatting mapping
-    if len(element["runs"]) > 1 and not all(r["bold"] == element["runs"][0]["bold"] and 
-                                          r["italic"] == element["runs"][0]["italic"] and
-                                          r["underline"] == element["runs"][0]["underline"] 
-                                          for r in element["runs"]):
+    if len(runs) > 1 and not all(r.bold == runs[0].bold and 
+                                 r.italic == runs[0].italic and
+                                 r.underline == runs[0].underline 
+                                 for r in runs):
         # Complex case - mixed formatting within the paragraph
         apply_complex_formatting(paragraph, element, processed_text)
+        return
+    
+    # Simple case - consistent formatting or no special formatting, computed once for the element
+    bold = bool(runs) and all(r.bold for r in runs)
+    italic = bool(runs) and all(r.italic for r in runs)
+    underline = bool(runs) and all(r.underline for r in runs)
+    
+    # Set paragraph alignment
+    if element.format.alignment is not None:
+        paragraph.alignment = element.format.alignment
+    
+    if highlighted_phrases and highlight_pattern is None:
+        highlight_pattern = compile_highlight_pattern(highlighted_phrases)
+    
+    # Split the text into plain and highlighted parts in one pass. Only phrases
+    # that were highlighted in this paragraph are highlighted again.
+    parts = []
+    if highlight_pattern is not None and highlighted_phrases:
+        position = 0
+        for match in highlight_pattern.finditer(processed_text):
+            if match.start() > position:
+                parts.append((processed_text[position:match.start()], False))
+            parts.append((match.group(), True))
+            position = match.end()
+        if position < len(processed_text):
+            parts.append((processed_text[position:], False))
     else:
-        # Simple case - consistent formatting or no special formatting
-        if not highlighted_phrases:
-            # Set paragraph alignment
-            if element["format"]["alignment"] is not None:
-                paragraph.alignment = element["format"]["alignment"]
-                
-            # Create a single run with the paragraph's text
-            run = paragraph.add_run(processed_text)
-            
-            # Apply consistent formatting if present
-            if element["runs"] and all(r["bold"] for r in element["runs"]):
-                run.bold = True
-            if element["runs"] and all(r["italic"] for r in element["runs"]):
-                run.italic = True
-            if element["runs"] and all(r["underline"] for r in element["runs"]):
-                run.underline = True
-        else:
-            # Handle text with highlights
-            text_to_write = processed_text
-            
-            # Mark highlighted phrases for later processing
-            for phrase in highlighted_phrases:
-                if phrase in processed_text:
-                    text_to_write = text_to_write.replace(phrase, f"[highlight]{phrase}[/highlight]")
-            
-            # Process text with highlights
-            parts = text_to_write.split("[highlight]")
-            
-            # Set paragraph alignment
-            if element["format"]["alignment"] is not None:
-                paragraph.alignment = element["format"]["alignment"]
-                
-            for part in parts:
-                if "[/highlight]" in part:
-                    highlighted, rest = part.split("[/highlight]")
-                    run = paragraph.add_run(highlighted)
-                    run.font.highlight_color = WD_COLOR_INDEX.YELLOW
-                    
-                    # Apply consistent formatting if present
-                    if element["runs"] and all(r["bold"] for r in element["runs"]):
-                        run.bold = True
-                    if element["runs"] and all(r["italic"] for r in element["runs"]):
-                        run.italic = True
-                    
-                    if rest:
-                        run = paragraph.add_run(rest)
-                        # Apply consistent formatting if present
-                        if element["runs"] and all(r["bold"] for r in element["runs"]):
-                            run.bold = True
-                        if element["runs"] and all(r["italic"] for r in element["runs"]):
-                            run.italic = True
-                else:
-                    run = paragraph.add_run(part)
-                    # Apply consistent formatting if present
-                    if element["runs"] and all(r["bold"] for r in element["runs"]):
-                        run.bold = True
-                    if element["runs"] and all(r["italic"] for r in element["runs"]):
-                        run.italic = True
+        parts.append((processed_text, False))
+    
+    for text, highlighted in parts:
+        run = paragraph.add_run(text)
+        if highlighted:
+            run.font.highlight_color = WD_COLOR_INDEX.YELLOW
+        if bold:
+            run.bold = True
+        if italic:
+            run.italic = True
+        if underline:
+            run.underline = True
 
 def apply_complex_formatting(paragraph, element, processed_text):
     """
@@ -208,63 +324,102 @@ def apply_complex_formatting(paragraph, element, processed_text):
         processed_text: The processed text for this element
     """
     # Set paragraph alignment
-    if element["format"]["alignment"] is not None:
-        paragraph.alignment = element["format"]["alignment"]
+    if element.format.alignment is not None:
+        paragraph.alignment = element.format.alignment
         
-    # Build a mapping of formatting styles in the original text
-    original_text = element["text"]
+    original_text = element.text
     
     # If the simplified text is too different from the original, fall back to simpler formatting
     if len(processed_text) < 0.5 * len(original_text) or len(processed_text) > 1.5 * len(original_text):
         # Create a single run with default formatting
-        run = paragraph.add_run(processed_text)
+        paragraph.add_run(processed_text)
         return
     
-    # Try to identify key words and their formatting from the original
-    formatted_words = {}
+    # One run per stretch of text sharing the same formatting
+    for text, (bold, italic, underline, highlight) in transfer_formatting(element.runs, processed_text):
+        run = paragraph.add_run(text)
+        if bold:
+            run.bold = True
+        if italic:
+            run.italic = True
+        if underline:
+            run.underline = True
+        if highlight:
+            run.font.highlight_color = WD_COLOR_INDEX.YELLOW
+
+
+def transfer_formatting(runs, processed_text):
+    """
+    Carry word-level formatting from the original runs over to the processed text
     
-    for run_data in element["runs"]:
-        text = run_data["text"]
-        if not text:
+    The words of both texts are aligned with difflib, and each processed word that
+    lines up with an original word takes that word's formatting. A word the alignment
+    could not place, e.g. because it moved, takes the formatting of the same word
+    elsewhere in the original if it is a substantial word (more than 3 characters).
+    Whitespace and punctuation take the formatting of the words around them when
+    both agree. Neighbouring segments with the same formatting are then merged.
+    
+    Args:
+        runs: The original runs (RunData)
+        processed_text: The processed text
+        
+    Returns:
+        list: (text, (bold, italic, underline, highlight)) tuples covering processed_text in order
+    """
+    # Original words with the formatting of the run they came from
+    original_words = []
+    original_formats = []
+    for run_data in runs:
+        if not run_data.text:
             continue
-            
-        # Clean and normalize the text for better matching
-        clean_text = text.strip().lower()
-        if not clean_text:
+        run_format = (bool(run_data.bold), bool(run_data.italic),
+                      bool(run_data.underline), bool(run_data.highlight))
+        for word in _WORD_PATTERN.findall(run_data.text):
+            original_words.append(word.lower())
+            original_formats.append(run_format)
+    
+    segments = _SEGMENT_PATTERN.findall(processed_text)
+    word_positions = [i for i, segment in enumerate(segments) if _WORD_PATTERN.match(segment)]
+    processed_words = [segments[i].lower() for i in word_positions]
+    
+    # Align the two word sequences
+    formats = [None] * len(segments)
+    matcher = SequenceMatcher(None, original_words, processed_words, autojunk=False)
+    for original_start, processed_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            formats[word_positions[processed_start + offset]] = original_formats[original_start + offset]
+    
+    # Fall back to word lookup for substantial words the alignment could not place
+    formatted_words = None
+    for i in word_positions:
+        if formats[i] is not None:
             continue
-            
-        # Store formatting for each word
-        for word in re.findall(r'\b\w+\b', clean_text):
-            if len(word) > 3:  # Only track substantial words
-                formatted_words[word] = {
-                    "bold": run_data["bold"],
-                    "italic": run_data["italic"],
-                    "underline": run_data["underline"],
-                    "highlight": run_data["highlight"]
-                }
-    
-    # Now try to apply this formatting to words in the processed text
-    
-    # Split the processed text into words and non-word segments
-    segments = re.findall(r'(\b\w+\b|\W+)', processed_text)
-    
-    for segment in segments:
-        # Check if this is a word we should format
-        clean_segment = segment.strip().lower()
-        
-        if clean_segment in formatted_words and len(clean_segment) > 3:
-            # This word had special formatting in the original
-            run = paragraph.add_run(segment)
-            format_info = formatted_words[clean_segment]
-            
-            if format_info["bold"]:
-                run.bold = True
-            if format_info["italic"]:
-                run.italic = True
-            if format_info["underline"]:
-                run.underline = True
-            if format_info["highlight"]:
-                run.font.highlight_color = WD_COLOR_INDEX.YELLOW
-        else:
-            # No special formatting for this segment
-            run = paragraph.add_run(segment) 
+        if formatted_words is None:
+            formatted_words = {}
+            for word, word_format in zip(original_words, original_formats):
+                if len(word) > 3 and word_format != PLAIN:
+                    formatted_words.setdefault(word, word_format)
+        word = segments[i].lower()
+        formats[i] = formatted_words.get(word, PLAIN) if len(word) > 3 else PLAIN
+    
+    # Separators between two words with the same formatting share it
+    for i, segment_format in enumerate(formats):
+        if segment_format is None:
+            before = formats[i - 1] if i > 0 else None
+            after = formats[i + 1] if i + 1 < len(formats) else None
+            formats[i] = before if before is not None and before == after else PLAIN
+    
+    # Merge neighbouring segments with the same formatting
+    merged = []
+    parts = []
+    current_format = None
+    for segment, segment_format in zip(segments, formats):
+        if segment_format != current_format and parts:
+            merged.append(("".join(parts), current_format))
+            parts = []
+        parts.append(segment)
+        current_format = segment_format
+    if parts:
+        merged.append(("".join(parts), current_format))
+    
+    return merged
@@ -0,0 +1,302 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.utils.config import config
+from app.services.simplification import simplify_document
+
+logger = logging.getLogger(__name__)
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+    pass
+
+
+class JobStore:
+    """SQLite-backed store for document simplification jobs"""
+
+    def __init__(self, path):
+        """
+        Initialize the store
+
+        Args:
+            path (str): Path to the SQLite database file
+        """
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the database on first use and make sure the table exists"""
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # output_path holds the output's name in output_storage (older rows: a path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, "
+                "status TEXT NOT NULL, "
+                "filename TEXT NOT NULL, "
+                "input_path TEXT NOT NULL, "
+                "prompt_config TEXT NOT NULL, "
+                "completed_batches INTEGER NOT NULL DEFAULT 0, "
+                "total_batches INTEGER, "
+                "output_path TEXT, "
+                "readability_score REAL, "
+                "error TEXT, "
+                "created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def create(self, filename, input_path, prompt_config) -> str:
+        """
+        Record a new queued job
+
+        Args:
+            filename (str): Original name of the uploaded file
+            input_path (str): Path to the stored upload
+            prompt_config (dict): Prompt configuration for the job
+
+        Returns:
+            str: The new job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT INTO jobs (id, status, filename, input_path, prompt_config, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, filename, input_path, json.dumps(prompt_config), now, now)
+            )
+            connection.commit()
+        return job_id
+
+    def get(self, job_id) -> Optional[dict]:
+        """
+        Look up a job
+
+        Args:
+            job_id (str): Job id
+
+        Returns:
+            dict or None: The job's columns, or None if it does not exist
+        """
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["prompt_config"] = json.loads(job["prompt_config"])
+        return job
+
+    def update(self, job_id, **fields) -> None:
+        """
+        Update columns of a job
+
+        Args:
+            job_id (str): Job id
+            **fields: Column values to set
+        """
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            connection.commit()
+
+    def increment_progress(self, job_id) -> None:
+        """Record one more completed batch for a job"""
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "UPDATE jobs SET completed_batches = completed_batches + 1, updated_at = ? WHERE id = ?",
+                (time.time(), job_id)
+            )
+            connection.commit()
+
+    def unfinished(self) -> list:
+        """
+        Return the ids of queued or running jobs, oldest first
+
+        Returns:
+            list: Job ids
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+
+class JobManager:
+    """
+    Bounded pool of workers running document simplification jobs in the background
+
+    The store does blocking SQLite work, so it is only called through asyncio.to_thread.
+    """
+
+    def __init__(self, store, workers=2, max_queued=100):
+        """
+        Initialize the manager
+
+        Args:
+            store (JobStore): Where job state is persisted
+            workers (int): Number of documents simplified at the same time
+            max_queued (int): Maximum number of jobs waiting for a worker
+        """
+        self.store = store
+        self.workers = workers
+        self.max_queued = max_queued
+
+        self._queue = None
+        # Ids of the jobs in the queue, in queue order
+        self._waiting = []
+        self._tasks = []
+
+    async def start(self) -> None:
+        """Start the workers and re-queue jobs left unfinished by a previous process"""
+        # Created here so the queue belongs to the running event loop
+        self._queue = asyncio.Queue()
+        self._waiting = []
+
+        for job_id in await asyncio.to_thread(self.store.unfinished):
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if os.path.exists(job["input_path"]):
+                logger.info(f"🔁 Re-queuing job {job_id} ({job['filename']}) after restart")
+                await asyncio.to_thread(self.store.update, job_id, status=QUEUED, completed_batches=0,
+                                        total_batches=None)
+                self._enqueue(job_id)
+            else:
+                await asyncio.to_thread(self.store.update, job_id, status=FAILED,
+                                        error="Input file was lost when the server restarted")
+
+        self._tasks = [asyncio.create_task(self._worker(i + 1)) for i in range(self.workers)]
+        logger.info(f"Started {self.workers} job workers")
+
+    async def stop(self) -> None:
+        """Cancel the workers; running jobs stay marked as running and resume on the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _enqueue(self, job_id) -> None:
+        """Put a job at the end of the queue"""
+        self._waiting.append(job_id)
+        self._queue.put_nowait(job_id)
+
+    async def submit(self, filename, input_path, prompt_config) -> str:
+        """
+        Queue a document for simplification
+
+        Args:
+            filename (str): Original name of the uploaded file
+            input_path (str): Path to the stored upload, removed once the job finishes
+            prompt_config (dict): Prompt configuration for the job
+
+        Returns:
+            str: The job id
+
+        Raises:
+            QueueFullError: If max_queued jobs are already waiting
+        """
+        if self._queue is None:
+            raise RuntimeError("Job manager has not been started")
+        if len(self._waiting) >= self.max_queued:
+            raise QueueFullError(f"Job queue is full ({self.max_queued} jobs waiting)")
+
+        job_id = await asyncio.to_thread(self.store.create, filename, input_path, prompt_config)
+        self._enqueue(job_id)
+        logger.info(f"📥 Queued job {job_id} ({filename}), {len(self._waiting)} waiting")
+        return job_id
+
+    def queue_position(self, job_id) -> Optional[int]:
+        """Return the 1-based position of a queued job, or None if it is not waiting"""
+        try:
+            return self._waiting.index(job_id) + 1
+        except ValueError:
+            return None
+
+    async def _worker(self, worker_num) -> None:
+        """Take jobs off the queue and run them one at a time"""
+        while True:
+            job_id = await self._queue.get()
+            self._waiting.remove(job_id)
+            try:
+                await self._run_job(job_id, worker_num)
+            except Exception as e:
+                logger.error(f"❌ [Worker {worker_num}] Unexpected error in job {job_id}: {str(e)}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id, worker_num) -> None:
+        """Run the simplification pipeline for one job and record the outcome"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["status"] not in (QUEUED, RUNNING):
+            return
+
+        logger.info(f"▶️ [Worker {worker_num}] Starting job {job_id} ({job['filename']})")
+        await asyncio.to_thread(self.store.update, job_id, status=RUNNING)
+
+        async def on_progress(event):
+            if event["event"] == "started":
+                await asyncio.to_thread(self.store.update, job_id, total_batches=event["total_batches"])
+            elif event["event"] == "batch":
+                await asyncio.to_thread(self.store.increment_progress, job_id)
+
+        try:
+            result = await simplify_document(
+                job["input_path"],
+                prompt_config=job["prompt_config"],
+                progress_callback=on_progress,
+                filename=job["filename"]
+            )
+            await asyncio.to_thread(
+                self.store.update,
+                job_id,
+                status=COMPLETED,
+                output_path=result.filename,
+                readability_score=result.readability_score
+            )
+            logger.info(f"✅ [Worker {worker_num}] Completed job {job_id}")
+        except asyncio.CancelledError:
+            # Server shutting down - leave the job running so it is re-queued on restart
+            raise
+        except Exception as e:
+            logger.error(f"❌ [Worker {worker_num}] Job {job_id} failed: {str(e)}", exc_info=True)
+            await asyncio.to_thread(self.store.update, job_id, status=FAILED, error=str(e))
+
+        try:
+            if os.path.exists(job["input_path"]):
+                os.remove(job["input_path"])
+        except Exception as e:
+            logger.error(f"Error removing job input file: {str(e)}")
+
+
+job_manager = JobManager(
+    JobStore(os.path.join(config.JOBS_DIR, "jobs.sqlite3")),
+    workers=config.JOB_WORKERS,
+    max_queued=config.JOB_QUEUE_MAX
+)
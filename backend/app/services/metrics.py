@@ -0,0 +1,240 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket upper bounds in seconds, from quick local stages up to whole documents
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Bucket upper bounds in seconds for model calls and batches, which take seconds to minutes
+LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """A named metric with optional labels, safe to update from any thread"""
+
+    type_name = None
+
+    # Starting value, so metrics without labels are exposed before their first update
+    initial_value = 0
+
+    def __init__(self, name, description, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labelnames and self.initial_value is not None:
+            self._values[()] = self.initial_value
+
+    def _key(self, labels) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        """Yield (suffix, label values, extra label, value) for every sample"""
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield "", key, None, value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, key, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as a number of tokens"""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, such as requests in flight"""
+
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in progress while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class CallbackGauge(_Metric):
+    """A gauge read from a function when the metrics are rendered"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, description, function: Callable[[], float]):
+        super().__init__(name, description)
+        self.function = function
+
+    def _samples(self):
+        yield "", (), None, self.function()
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+
+    type_name = "histogram"
+    initial_value = None
+
+    def __init__(self, name, description, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield "_bucket", key, ("le", _format_value(bound)), cumulative
+            yield "_sum", key, None, total
+            yield "_count", key, None, cumulative
+
+
+class MetricsRegistry:
+    """The metrics of the process, rendered together for the /metrics route"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, description, labelnames=()) -> Counter:
+        return self.register(Counter(name, description, labelnames))
+
+    def gauge(self, name, description, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, description, labelnames))
+
+    def callback_gauge(self, name, description, function) -> CallbackGauge:
+        return self.register(CallbackGauge(name, description, function))
+
+    def histogram(self, name, description, buckets, labelnames=()) -> Histogram:
+        return self.register(Histogram(name, description, buckets, labelnames))
+
+    def get(self, name) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+
+        Returns:
+            str: The exposition, ending with a newline
+        """
+        return "".join(metric.render() + "\n" for metric in self._metrics.values())
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "clear_text_stage_seconds",
+    "Time spent per document in each pipeline stage",
+    STAGE_BUCKETS, labelnames=("stage",)
+)
+documents_in_progress = registry.gauge(
+    "clear_text_documents_in_progress",
+    "Documents currently being simplified"
+)
+batch_seconds = registry.histogram(
+    "clear_text_batch_seconds",
+    "Time to simplify one batch of elements, including retries and recovery",
+    LATENCY_BUCKETS
+)
+batch_size = registry.histogram(
+    "clear_text_batch_elements",
+    "Elements sent to the model per batch",
+    (1, 2, 5, 10, 15, 20, 25, 30, 40, 50, 75, 100)
+)
+fallback_elements = registry.counter(
+    "clear_text_fallback_elements_total",
+    "Elements that kept their original text because the model gave no usable reply",
+    labelnames=("element_type",)
+)
+openai_request_seconds = registry.histogram(
+    "clear_text_openai_request_seconds",
+    "Latency of single Azure OpenAI calls, not counting waits for the rate limiter",
+    LATENCY_BUCKETS
+)
+openai_requests = registry.counter(
+    "clear_text_openai_requests_total",
+    "Completions requested, by result: ok, cached, retried or failed",
+    labelnames=("result",)
+)
+openai_tokens = registry.counter(
+    "clear_text_openai_tokens_total",
+    "Tokens reported by Azure OpenAI in response.usage, by kind: prompt, cached_prompt (part of prompt) or completion",
+    labelnames=("kind",)
+)
@@ -2,21 +2,61 @@ import asyncio
 import logging
 
 from app.utils.config import config
-from app.extensions.openai import async_openai_client
+from app.extensions.openai import get_async_openai_client
+from app.services.response_cache import ResponseCache, make_cache_key
+from app.services.rate_limiting import openai_limiter, is_retryable_error, get_retry_after, calculate_backoff
+from app.services.metrics import openai_request_seconds, openai_requests, openai_tokens
+from app.services.text_utils import estimate_tokens
 
 # Disable httpx logs
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
-async def process_with_openai(system_prompt, user_prompt, semaphore=None):
+# Persistent cache of completions, shared by document and text simplification
+response_cache = ResponseCache(
+    config.CACHE_PATH,
+    max_entries=config.CACHE_MAX_ENTRIES,
+    ttl_seconds=config.CACHE_TTL_SECONDS,
+    table="responses",
+    enabled=config.CACHE_ENABLED
+)
+
+
+def response_cache_key(system_prompt, user_prompt):
+    """
+    Build the response cache key for a prompt pair
+    
+    Identical prompts with identical deployment and sampling parameters share a cached completion.
+    
+    Args:
+        system_prompt (str): The system prompt for the AI
+        user_prompt (str): The user prompt for the AI
+        
+    Returns:
+        str: Cache key
+    """
+    return make_cache_key(
+        system_prompt,
+        user_prompt,
+        config.AZURE_OPENAI_DEPLOYMENT_NAME,
+        config.TEMPERATURE,
+        config.MAX_TOKENS
+    )
+
+
+async def process_with_openai(system_prompt, user_prompt, semaphore=None, use_cache=True):
     """
     Process a single text with OpenAI
     
+    Rate limits, timeouts and server errors are retried up to RATE_LIMIT_BACKOFF["max_retries"]
+    times, waiting as long as the server's Retry-After asks or backing off exponentially with jitter.
+    
     Args:
         system_prompt (str): The system prompt for the AI
         user_prompt (str): The user prompt for the AI
         semaphore (asyncio.Semaphore, optional): Not used, kept for compatibility
+        use_cache (bool): Whether to serve and store the response in the response cache
         
     Returns:
         str: The processed text
@@ -25,30 +65,74 @@ async def process_with_openai(system_prompt, user_prompt, semaphore=None):
         logger.warning("Empty or whitespace-only text received")
         return ""
 
-    try:
-        # Log API calls at debug level to reduce noise
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug("Calling Azure OpenAI API for text processing")
-        
-        # Make the API call directly
-        response = await async_openai_client.chat.completions.create(
-            model=config.AZURE_OPENAI_DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.7,
-            max_tokens=4096,
-        )
-        
-        # Log successful response only at debug level
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug("Successfully received API response")
-        
-        return response.choices[0].message.content
-            
-    except Exception as e:
-        # Log errors at error level
-        logger.error(f"Error during API call: {str(e)}")
-        raise
+    cache_key = None
+    if use_cache:
+        cache_key = response_cache_key(system_prompt, user_prompt)
+        cached_response = await asyncio.to_thread(response_cache.get, cache_key)
+        if cached_response is not None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Serving API response from cache")
+            openai_requests.inc(result="cached")
+            return cached_response
 
+    # Reserve quota for the prompt plus the expected completion
+    estimated_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    estimated_tokens += min(config.MAX_TOKENS, int(estimate_tokens(user_prompt) * config.OUTPUT_TOKEN_RATIO))
+    
+    max_retries = config.RATE_LIMIT_BACKOFF["max_retries"]
+    attempt = 0
+    
+    while True:
+        try:
+            # Log API calls at debug level to reduce noise
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Calling Azure OpenAI API for text processing")
+            
+            # Make the API call through the process-wide limiter
+            async with openai_limiter.acquire(estimated_tokens) as reservation:
+                with openai_request_seconds.time():
+                    response = await get_async_openai_client().chat.completions.create(
+                        model=config.AZURE_OPENAI_DEPLOYMENT_NAME,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt},
+                        ],
+                        temperature=config.TEMPERATURE,
+                        max_tokens=config.MAX_TOKENS,
+                    )
+                if response.usage:
+                    openai_limiter.record_usage(reservation, response.usage.total_tokens)
+                    openai_tokens.inc(response.usage.prompt_tokens or 0, kind="prompt")
+                    # Prompt tokens the provider served from its prompt cache, if it reports them
+                    prompt_details = getattr(response.usage, "prompt_tokens_details", None)
+                    openai_tokens.inc(getattr(prompt_details, "cached_tokens", None) or 0, kind="cached_prompt")
+                    openai_tokens.inc(response.usage.completion_tokens or 0, kind="completion")
+            openai_requests.inc(result="ok")
+            break
+                
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                # Log errors at error level
+                logger.error(f"Error during API call: {str(e)}")
+                openai_requests.inc(result="failed")
+                raise
+            
+            openai_requests.inc(result="retried")
+            # Wait outside the limiter so other calls can use the slot
+            wait = calculate_backoff(attempt, get_retry_after(e))
+            attempt += 1
+            logger.warning(f"API call failed ({str(e)}), retry {attempt}/{max_retries} in {wait:.1f}s")
+            await asyncio.sleep(wait)
+    
+    # Log successful response only at debug level
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Successfully received API response")
+    
+    choice = response.choices[0]
+    content = choice.message.content
+    
+    # Only cache complete responses - truncated ones would be served forever
+    if cache_key and content and choice.finish_reason == "stop":
+        await asyncio.to_thread(response_cache.set, cache_key, content)
+    
+    return content
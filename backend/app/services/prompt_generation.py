@@ -50,11 +50,29 @@ def create_system_prompt(
     return system_prompt
 
 
+def format_highlighted_phrases(phrases):
+    """
+    List the phrases an element must keep, for its prompt
+    
+    Args:
+        phrases: The element's highlighted phrases
+        
+    Returns:
+        str: The first five phrases quoted, followed by how many more there are
+    """
+    # Sorted so the prompt (and therefore its cache key) is stable across runs
+    highlighted = sorted(phrases)
+    phrases_text = ", ".join(f"'{phrase}'" for phrase in highlighted[:5])
+    if len(highlighted) > 5:
+        phrases_text += f", and {len(highlighted) - 5} more"
+    return phrases_text
+
+
 def create_element_prompt(element, text=None):
     """Create a prompt specifically tailored to the element type"""
-    element_type = element["type"]
+    element_type = element.type
     # Use the provided text if available, otherwise use the element's text
-    text = text or element["text"]
+    text = text or element.text
     
     # Base prompt for all elements
     prompt = f"Simplify the following text to grade 6 reading level:\n\n{text}\n\n"
@@ -62,29 +80,88 @@ def create_element_prompt(element, text=None):
     # Add element-specific instructions
     if element_type == "list_item":
         prompt += "This is a list item. Maintain the bullet point or numbering format. "
-        if element.get("list_info", {}).get("type") == "bullet":
+        list_type = element.list_info.type if element.list_info else None
+        if list_type == "bullet":
             prompt += "Preserve the bullet symbol at the beginning. "
-        elif element.get("list_info", {}).get("type") == "number":
+        elif list_type == "number":
             prompt += "Preserve the numbering at the beginning. "
+    elif element_type == "table_cell":
+        prompt += "This is the text of a table cell. Keep it about as short as the original, and leave labels, names, numbers and dates unchanged. "
+    elif element_type == "text_box":
+        prompt += "This is the text of a text box. Keep it about as short as the original. "
+    elif element_type in ("header", "footer"):
+        prompt += f"This is a page {element_type}. Keep it short, and leave names, numbers and dates unchanged. "
+    elif element_type in ("footnote", "endnote"):
+        prompt += f"This is a {element_type}. Leave citations, references and links unchanged. "
     
     # Add general reminders for all elements - using clear instruction markers to prevent them leaking into output
     prompt += "INSTRUCTIONS FOR AI (DO NOT INCLUDE IN RESPONSE): Keep the same general structure. Do not add or remove information. Simplify language only."
     
     # For elements with highlighted phrases, add a reminder to preserve them
-    if element["highlighted_phrases"]:
-        highlighted = list(element["highlighted_phrases"])
-        phrases_text = ", ".join([f"'{phrase}'" for phrase in highlighted[:5]])
-        if len(highlighted) > 5:
-            phrases_text += f", and {len(highlighted) - 5} more"
-        prompt += f"\n\nINSTRUCTIONS FOR AI (DO NOT INCLUDE IN RESPONSE): CRITICAL: You MUST preserve these exact phrases in your output - do not modify, replace, or remove them: {phrases_text}"
-    
-    # Stronger instruction for URL preservation
-    if element.get("urls"):
-        urls = list(element["urls"])
-        urls_text = ", ".join([f"'{url}'" for url in urls[:3]])
-        if len(urls) > 3:
-            urls_text += f", and {len(urls) - 3} more"
-        prompt += f"\n\nINSTRUCTIONS FOR AI (DO NOT INCLUDE IN RESPONSE): CRITICAL: Preserve these exact URLs in your output - do not modify or remove them: {urls_text}"
+    if element.highlighted_phrases:
+        prompt += f"\n\nINSTRUCTIONS FOR AI (DO NOT INCLUDE IN RESPONSE): CRITICAL: You MUST preserve these exact phrases in your output - do not modify, replace, or remove them: {format_highlighted_phrases(element.highlighted_phrases)}"
     
     return prompt
 
+
+# Batch instructions of the compact format. Sent once per call at the end of the system
+# prompt, so every batch starts with the same prefix and the provider can cache it.
+BATCH_INSTRUCTIONS = """BATCH FORMAT:
+The user message holds elements of a document, each between [ELEMENT_START id=N] and [ELEMENT_END].
+Reply with every element, in the same order, between the same markers with its id unchanged, holding only its simplified text.
+Simplify each element to grade 6 reading level. Keep the same general structure. Do not add or remove information. Simplify language only.
+Lines outside the markers are context and must never appear in your response:
+- "Section: ..." names the heading of the elements that follow it.
+- "Note: ..." applies to the next element only:
+  - "list item, bullet" or "list item, numbered": maintain the list format and preserve the bullet symbol or numbering at the beginning.
+  - "table cell" or "text box": keep it about as short as the original, and leave labels, names, numbers and dates unchanged.
+  - "page header" or "page footer": keep it short, and leave names, numbers and dates unchanged.
+  - "footnote" or "endnote": leave citations, references and links unchanged.
+  - "keep exactly: ...": CRITICAL: you MUST preserve these exact phrases - do not modify, replace, or remove them."""
+
+# Note for each element type that needs one in the compact format
+_TYPE_NOTES = {
+    "table_cell": "table cell",
+    "text_box": "text box",
+    "header": "page header",
+    "footer": "page footer",
+    "footnote": "footnote",
+    "endnote": "endnote",
+}
+
+
+def create_batch_system_prompt(system_prompt):
+    """The system prompt of a compact batch: the document's system prompt followed by BATCH_INSTRUCTIONS"""
+    return f"{system_prompt}\n\n{BATCH_INSTRUCTIONS}"
+
+
+def create_element_note(element):
+    """
+    Describe what sets an element apart from a plain paragraph, for the compact batch format
+    
+    Returns:
+        str or None: The text of the element's "Note:" line, or None if it needs none
+    """
+    notes = []
+    if element.type == "list_item":
+        list_type = element.list_info.type if element.list_info else None
+        notes.append({"bullet": "list item, bullet", "number": "list item, numbered"}.get(list_type, "list item"))
+    elif element.type in _TYPE_NOTES:
+        notes.append(_TYPE_NOTES[element.type])
+    
+    if element.highlighted_phrases:
+        notes.append(f"keep exactly: {format_highlighted_phrases(element.highlighted_phrases)}")
+    
+    return "; ".join(notes) if notes else None
+
+
+def create_compact_element_prompt(element, text=None):
+    """
+    An element's part of a compact batch prompt, without its markers: its note line, if any, and its text
+    
+    The type-specific instructions of create_element_prompt are in BATCH_INSTRUCTIONS
+    instead, so each element only carries what differs from a plain paragraph.
+    """
+    text = text or element.text
+    note = create_element_note(element)
+    return f"Note: {note}\n{text}" if note else text
@@ -1,66 +1,287 @@
 import asyncio
 import logging
+import random
 import time
+from collections import deque
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 from app.utils.config import config
+from app.services.metrics import registry
 
 logger = logging.getLogger(__name__)
 
-class RateLimitError(Exception):
-    """Custom error for rate limit handling"""
-    def __init__(self, wait_time: int, message: str = "Rate limit exceeded"):
-        self.wait_time = wait_time
-        self.message = message
-        super().__init__(self.message)
+# Length of the sliding window used for per-minute accounting
+WINDOW_SECONDS = 60
 
-# Track last request time to enforce rate limits
-_last_request_time = 0
-_request_lock = asyncio.Lock()
 
-@asynccontextmanager
-async def handle_rate_limit():
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check if an exception is a 429 / rate limit error from the OpenAI client"""
+    from openai import RateLimitError
+
+    return isinstance(error, RateLimitError) or getattr(error, "status_code", None) == 429
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Check if an API call that raised this exception is worth retrying"""
+    from openai import APIConnectionError, APITimeoutError
+
+    if is_rate_limit_error(error):
+        return True
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and status_code >= 500
+
+
+def get_retry_after(error: Exception):
     """
-    Async context manager for rate limiting
-    
-    Usage:
-        async with handle_rate_limit():
-            # Make API call here
+    Read the wait requested by the server from the Retry-After headers of an API error
+
+    Args:
+        error (Exception): The exception raised by the OpenAI client
+
+    Returns:
+        float or None: Seconds to wait, or None if the server did not say
     """
-    global _last_request_time
-    
-    async with _request_lock:
-        # Ensure minimum delay between requests
-        current_time = time.time()
-        time_since_last_request = current_time - _last_request_time
-        
-        if time_since_last_request < config.REQUEST_DELAY and _last_request_time > 0:
-            delay = config.REQUEST_DELAY - time_since_last_request
-            if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(f"Rate limiting: waiting {delay:.2f}s between requests")
-            await asyncio.sleep(delay)
-        
-        # Update last request time
-        _last_request_time = time.time()
-    
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
     try:
-        # Yield control back to the caller
-        yield
-    
-    except Exception as e:
-        # Check if this is a rate limit error (based on OpenAI error messages)
-        if "429" in str(e) or "too many requests" in str(e).lower() or "rate limit" in str(e).lower():
-            raise RateLimitError(
-                wait_time=config.RATE_LIMIT_BACKOFF["initial_wait"],
-                message=f"Rate limit exceeded: {str(e)}"
-            )
-        # Re-raise other exceptions
-        raise
-
-# Helper to calculate backoff time for retries
-def calculate_backoff(current_retry: int, last_wait: int) -> int:
-    """Calculate next wait time using exponential backoff"""
-    return min(
-        last_wait * config.RATE_LIMIT_BACKOFF["multiplier"],
-        config.RATE_LIMIT_BACKOFF["max_wait"]
-    )
\ No newline at end of file
+        return float(retry_after)
+    except ValueError:
+        pass
+
+    # Retry-After may also be an HTTP date
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def calculate_backoff(attempt: int, retry_after=None) -> float:
+    """
+    Calculate how long to wait before retrying a failed API call
+
+    The server's Retry-After is honoured when present, plus up to a second of jitter
+    so that concurrent callers do not retry in lockstep. Otherwise the wait grows
+    exponentially per RATE_LIMIT_BACKOFF, with "equal jitter" (half fixed, half random).
+
+    Args:
+        attempt (int): Number of the retry about to be made (0-based)
+        retry_after (float, optional): Seconds requested by the server
+
+    Returns:
+        float: Seconds to wait
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+
+    backoff = config.RATE_LIMIT_BACKOFF
+    wait = min(backoff["initial_wait"] * backoff["multiplier"] ** attempt, backoff["max_wait"])
+    return wait / 2 + random.uniform(0, wait / 2)
+
+
+class AdaptiveLimiter:
+    """
+    Process-wide limiter for Azure OpenAI calls
+
+    Concurrency adapts AIMD-style: every successful call grows the limit by
+    1/limit (about +1 per round of calls), while a 429 halves it and a call
+    slower than the latency target shrinks it by a smaller factor. Calls also
+    wait until the sliding one-minute window has room under the deployment's
+    request-per-minute and token-per-minute quotas.
+    """
+
+    def __init__(self, min_concurrency=1, max_concurrency=10, initial_concurrency=None,
+                 requests_per_minute=None, tokens_per_minute=None, latency_target=None):
+        """
+        Initialize the limiter
+
+        Args:
+            min_concurrency (int): Lowest concurrency the limit can shrink to
+            max_concurrency (int): Highest concurrency the limit can grow to
+            initial_concurrency (int, optional): Starting limit (default: max_concurrency)
+            requests_per_minute (int, optional): Request quota, None for no limit
+            tokens_per_minute (int, optional): Token quota, None for no limit
+            latency_target (float, optional): Calls slower than this many seconds reduce concurrency
+        """
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(initial_concurrency or max_concurrency)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.latency_target = latency_target
+
+        self.in_flight = 0
+        self.total_requests = 0
+        self.rate_limited_requests = 0
+
+        # Sliding window of [timestamp, tokens] entries, one per request
+        self._window = deque()
+        self._window_tokens = 0
+        self._last_decrease = 0.0
+        self._condition = None
+
+    def _get_condition(self):
+        """Create the condition lazily so it belongs to the running event loop"""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _prune_window(self, now):
+        """Drop window entries older than one minute"""
+        while self._window and now - self._window[0][0] >= WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+
+    def _quota_wait(self, tokens, now):
+        """Return how long to wait before the window has room for a request of the given size"""
+        self._prune_window(now)
+        if not self._window:
+            return 0.0
+
+        over_requests = self.requests_per_minute and len(self._window) >= self.requests_per_minute
+        over_tokens = self.tokens_per_minute and self._window_tokens + tokens > self.tokens_per_minute
+        if not (over_requests or over_tokens):
+            return 0.0
+
+        # Wait for the oldest entry to leave the window, then check again
+        return max(0.05, WINDOW_SECONDS - (now - self._window[0][0]))
+
+    @asynccontextmanager
+    async def acquire(self, estimated_tokens=0):
+        """
+        Wait for a concurrency slot and quota, then hold the slot for the duration of a call
+
+        Usage:
+            async with limiter.acquire(estimated_tokens) as reservation:
+                response = ...  # Make API call here
+                limiter.record_usage(reservation, response.usage.total_tokens)
+
+        Args:
+            estimated_tokens (int): Tokens the call is expected to use, reconciled later with record_usage
+
+        Yields:
+            list: The window entry reserved for this call
+        """
+        condition = self._get_condition()
+        async with condition:
+            while True:
+                if self.in_flight < max(self.min_concurrency, int(self.limit)):
+                    wait = self._quota_wait(estimated_tokens, time.monotonic())
+                    if wait <= 0:
+                        break
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Rate limiting: waiting {wait:.2f}s for per-minute quota")
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await condition.wait()
+
+            self.in_flight += 1
+            self.total_requests += 1
+            reservation = [time.monotonic(), estimated_tokens]
+            self._window.append(reservation)
+            self._window_tokens += estimated_tokens
+
+        started = time.monotonic()
+        try:
+            yield reservation
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.record_rate_limited()
+            raise
+        else:
+            self.record_latency(time.monotonic() - started)
+        finally:
+            async with condition:
+                self.in_flight -= 1
+                condition.notify_all()
+
+    def record_usage(self, reservation, tokens):
+        """Replace a call's estimated token count with the actual usage reported by the API"""
+        if tokens is None:
+            return
+        # Only adjust the running total while the entry is still in the window
+        if self._window and reservation[0] >= self._window[0][0]:
+            self._window_tokens += tokens - reservation[1]
+        reservation[1] = tokens
+
+    def record_latency(self, latency):
+        """Additive increase on a successful call, or a gentle decrease if it was slow"""
+        if self.latency_target and latency > self.latency_target:
+            self._decrease(0.9, f"slow response ({latency:.1f}s)")
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def record_rate_limited(self):
+        """Multiplicative decrease after a 429"""
+        self.rate_limited_requests += 1
+        self._decrease(0.5, "429 Too Many Requests")
+
+    def _decrease(self, factor, reason):
+        """Shrink the limit, at most once per cooldown so a burst of failures only counts once"""
+        now = time.monotonic()
+        if now - self._last_decrease < config.RATE_LIMIT_DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(self.min_concurrency, self.limit * factor)
+        logger.warning(f"Reducing Azure OpenAI concurrency from {previous:.1f} to {self.limit:.1f} after {reason}")
+
+    def stats(self) -> dict:
+        """
+        Return the current limit and per-minute usage
+
+        Returns:
+            dict: Limiter statistics
+        """
+        self._prune_window(time.monotonic())
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "requests_last_minute": len(self._window),
+            "tokens_last_minute": self._window_tokens,
+            "requests_per_minute_limit": self.requests_per_minute,
+            "tokens_per_minute_limit": self.tokens_per_minute,
+            "total_requests": self.total_requests,
+            "rate_limited_requests": self.rate_limited_requests
+        }
+
+
+# Shared by every request in the process
+openai_limiter = AdaptiveLimiter(
+    min_concurrency=config.MIN_CONCURRENT_REQUESTS,
+    max_concurrency=config.MAX_CONCURRENT_REQUESTS,
+    initial_concurrency=config.INITIAL_CONCURRENT_REQUESTS,
+    requests_per_minute=config.REQUESTS_PER_MINUTE,
+    tokens_per_minute=config.TOKENS_PER_MINUTE,
+    latency_target=config.LATENCY_TARGET_SECONDS
+)
+
+registry.callback_gauge(
+    "clear_text_openai_requests_in_flight",
+    "Azure OpenAI calls currently holding a limiter slot",
+    lambda: openai_limiter.in_flight
+)
+registry.callback_gauge(
+    "clear_text_openai_concurrency_limit",
+    "Current adaptive limit on concurrent Azure OpenAI calls",
+    lambda: openai_limiter.limit
+)
\ No newline at end of file
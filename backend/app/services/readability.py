@@ -0,0 +1,243 @@
+import logging
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from app.services.text_utils import get_nltk, split_sentences
+
+logger = logging.getLogger(__name__)
+
+# Words for readability purposes: letters with inner apostrophes, or numbers
+_WORD_PATTERN = re.compile(r"[A-Za-z]+(?:['’][A-Za-z]+)*|\d+(?:[.,]\d+)*")
+_VOWEL_GROUP_PATTERN = re.compile(r"[aeiouy]+")
+
+# Element types besides headings that are not prose and are left out of the scores
+UNSCORED_TYPES = ("toc_entry", "caption", "header", "footer")
+
+# Column order of the per-text count matrix. The matrices are numpy arrays; numpy is
+# imported by the scoring functions, so starting the app does not load it.
+SENTENCES, WORDS, SYLLABLES, POLYSYLLABLES = range(4)
+
+# Syllables per word. Seeded from the CMU Pronouncing Dictionary when its NLTK data
+# is installed, and filled in with the heuristic count for every other word seen.
+_syllables = None
+
+
+class ReadabilityScores(NamedTuple):
+    """Readability of a piece of text"""
+    grade_level: float  # Flesch-Kincaid grade level
+    reading_ease: float  # Flesch Reading Ease, 0-100, higher is easier
+    smog: float  # SMOG grade
+    sentences: int
+    words: int
+
+
+class SectionReadability(NamedTuple):
+    """Readability of the elements between two headings"""
+    title: Optional[str]  # Heading text, None for the text before the first heading
+    element_ids: List[int]
+    scores: ReadabilityScores
+
+
+class ReadabilityReport(NamedTuple):
+    """Readability of a document, per section and per element"""
+    document: ReadabilityScores
+    sections: List[SectionReadability]
+    elements: Dict[int, ReadabilityScores]
+
+
+def _get_syllable_dictionary():
+    """Load the CMU Pronouncing Dictionary on first use, without downloading it"""
+    global _syllables
+    if _syllables is None:
+        _syllables = {}
+        nltk = get_nltk()
+        try:
+            if nltk is None:
+                raise LookupError("nltk is not installed")
+            for word, pronunciations in nltk.corpus.cmudict.dict().items():
+                # Stressed phonemes (ending in a digit) are vowels, one per syllable
+                _syllables[word] = sum(phoneme[-1].isdigit() for phoneme in pronunciations[0])
+            logger.info(f"📖 Loaded {len(_syllables)} syllable counts from cmudict")
+        except LookupError:
+            logger.info("cmudict is not installed - counting syllables heuristically")
+    return _syllables
+
+
+def _estimate_syllables(word: str) -> int:
+    """Heuristic syllable count for a lowercase word: vowel groups, less silent endings"""
+    if word[0].isdigit():
+        return 1
+
+    count = len(_VOWEL_GROUP_PATTERN.findall(word))
+    if count > 1 and word.endswith("e") and not word.endswith(("le", "ee", "ye")):
+        count -= 1
+    if count > 1 and word.endswith(("es", "ed")) and len(word) > 3 and word[-3] not in "aeiouytdscgxz":
+        count -= 1
+    return max(1, count)
+
+
+def count_syllables(word: str) -> int:
+    """
+    Count the syllables in a word
+
+    Args:
+        word (str): The word
+
+    Returns:
+        int: Number of syllables (at least 1)
+    """
+    syllables = _get_syllable_dictionary()
+    word = word.lower().replace("’", "'")
+    count = syllables.get(word)
+    if count is None:
+        count = syllables[word] = _estimate_syllables(word)
+    return count
+
+
+def count_text(text: str):
+    """
+    Count the sentences, words, syllables and polysyllabic words of a text
+
+    Args:
+        text (str): Text to count
+
+    Returns:
+        tuple: (sentences, words, syllables, polysyllables)
+    """
+    words = _WORD_PATTERN.findall(text or "")
+    if not words:
+        return 0, 0, 0, 0
+
+    syllables = [count_syllables(word) for word in words]
+    sentences = max(1, len(split_sentences(text)))
+    return sentences, len(words), sum(syllables), sum(1 for count in syllables if count >= 3)
+
+
+def _scores_from_counts(counts) -> List[ReadabilityScores]:
+    """
+    Compute Flesch-Kincaid, Flesch Reading Ease and SMOG for every row of a count matrix at once
+
+    Args:
+        counts: numpy array of shape (n, 4) with columns SENTENCES, WORDS, SYLLABLES, POLYSYLLABLES
+
+    Returns:
+        list: ReadabilityScores per row. Rows without words score 0 grade and 100 reading ease.
+    """
+    import numpy as np
+
+    sentences = counts[:, SENTENCES]
+    words = counts[:, WORDS]
+    has_words = words > 0
+
+    words_per_sentence = np.divide(words, sentences, out=np.zeros(len(counts)), where=has_words)
+    syllables_per_word = np.divide(counts[:, SYLLABLES], words, out=np.zeros(len(counts)), where=has_words)
+    polysyllables_per_sentence = np.divide(counts[:, POLYSYLLABLES], sentences, out=np.zeros(len(counts)),
+                                           where=has_words)
+
+    grade_level = np.where(has_words, 0.39 * words_per_sentence + 11.8 * syllables_per_word - 15.59, 0.0)
+    reading_ease = np.where(has_words, 206.835 - 1.015 * words_per_sentence - 84.6 * syllables_per_word, 100.0)
+    smog = np.where(has_words, 1.0430 * np.sqrt(polysyllables_per_sentence * 30) + 3.1291, 0.0)
+
+    # Grades below zero carry no extra meaning
+    grade_level = np.maximum(grade_level, 0.0)
+
+    return [
+        ReadabilityScores(
+            grade_level=float(grade_level[i]),
+            reading_ease=float(reading_ease[i]),
+            smog=float(smog[i]),
+            sentences=int(sentences[i]),
+            words=int(words[i])
+        )
+        for i in range(len(counts))
+    ]
+
+
+def score_texts(texts: Iterable[str]) -> List[ReadabilityScores]:
+    """
+    Score several texts in one batched pass
+
+    Args:
+        texts: Texts to score
+
+    Returns:
+        list: ReadabilityScores per text, in order
+    """
+    import numpy as np
+
+    counts = np.array([count_text(text) for text in texts], dtype=float).reshape(-1, 4)
+    return _scores_from_counts(counts)
+
+
+def score_text(text: str) -> float:
+    """
+    Calculate a readability score for the given text (Flesch-Kincaid Grade Level)
+
+    Args:
+        text (str): Text to score
+
+    Returns:
+        float: Readability score (higher scores indicate higher complexity)
+    """
+    return score_texts([text])[0].grade_level
+
+
+def score_elements(elements, texts: Optional[Dict[int, str]] = None) -> ReadabilityReport:
+    """
+    Score a document per element, per section and as a whole in one batched pass
+
+    Headings start a new section and give it its title. Headings, TOC entries and
+    captions are not scored themselves, since they are not sentences.
+
+    Args:
+        elements: Document elements in document order; media elements are ignored
+        texts: Text to score per element id, e.g. the simplified text (default: element.text)
+
+    Returns:
+        ReadabilityReport: Document, section and element scores
+    """
+    import numpy as np
+
+    texts = texts or {}
+
+    scored = []
+    section_of_element = []
+    section_titles = [None]
+    section_elements = [[]]
+
+    for element in elements:
+        if element.type == "media":
+            continue
+        text = texts.get(element.id) or element.text
+        if element.type.startswith("heading_") or element.type in UNSCORED_TYPES:
+            if element.type.startswith("heading_"):
+                section_titles.append(text)
+                section_elements.append([])
+            continue
+        scored.append((element.id, text))
+        section_of_element.append(len(section_titles) - 1)
+        section_elements[-1].append(element.id)
+
+    counts = np.array([count_text(text) for _, text in scored], dtype=float).reshape(-1, 4)
+
+    # Sum the counts per section and for the whole document, then score all rows together
+    section_counts = np.zeros((len(section_titles), 4))
+    np.add.at(section_counts, np.array(section_of_element, dtype=int), counts)
+    totals = counts.sum(axis=0, keepdims=True)
+
+    scores = _scores_from_counts(np.vstack([totals, section_counts, counts]))
+    document_scores = scores[0]
+    section_scores = scores[1:1 + len(section_titles)]
+    element_scores = scores[1 + len(section_titles):]
+
+    sections = [
+        SectionReadability(title=title, element_ids=ids, scores=section_score)
+        for title, ids, section_score in zip(section_titles, section_elements, section_scores)
+        if ids
+    ]
+
+    return ReadabilityReport(
+        document=document_scores,
+        sections=sections,
+        elements={element_id: element_score for (element_id, _), element_score in zip(scored, element_scores)}
+    )
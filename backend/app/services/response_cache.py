@@ -0,0 +1,283 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Keys per statement in bulk lookups, below SQLite's limit on query parameters
+BULK_CHUNK_SIZE = 500
+
+
+def make_cache_key(*parts) -> str:
+    """
+    Build a content-addressed cache key from the given parts
+
+    Args:
+        *parts: JSON-serializable values identifying the cached content
+
+    Returns:
+        str: Hex SHA-256 digest of the parts
+    """
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed key/value cache with LRU eviction and TTL expiry"""
+
+    def __init__(self, path, max_entries=10000, ttl_seconds=None, table="responses", enabled=True):
+        """
+        Initialize the cache
+
+        Args:
+            path (str): Path to the SQLite database file
+            max_entries (int): Maximum number of entries kept before evicting the least recently used
+            ttl_seconds (int, optional): Entries older than this are treated as expired
+            table (str): Table name, so several caches can share one database file
+            enabled (bool): When False, every lookup misses and nothing is stored
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the database on first use and make sure the table exists"""
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "last_accessed REAL NOT NULL)"
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_last_accessed "
+                f"ON {self.table} (last_accessed)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def get(self, key) -> Optional[str]:
+        """
+        Look up a cached value
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            str or None: The cached value, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute(
+                    f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+
+                now = time.time()
+                if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                    # Expired entry - drop it and treat as a miss
+                    connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    connection.commit()
+                    row = None
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                connection.execute(
+                    f"UPDATE {self.table} SET last_accessed = ? WHERE key = ?", (now, key)
+                )
+                connection.commit()
+                self.hits += 1
+                return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading from response cache: {str(e)}")
+            self.misses += 1
+            return None
+
+    def set(self, key, value) -> None:
+        """
+        Store a value, evicting the least recently used entries if the cache is full
+
+        Args:
+            key (str): Cache key
+            value (str): Value to store
+        """
+        if not self.enabled or value is None:
+            return
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                now = time.time()
+                connection.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+
+                self._evict(connection, now)
+                connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing to response cache: {str(e)}")
+
+    def get_many(self, keys) -> dict:
+        """
+        Look up several cached values with one query per chunk of keys and a single commit
+
+        Args:
+            keys (list): Cache keys
+
+        Returns:
+            dict: Cached values by key, for the keys that hit
+        """
+        if not self.enabled or not keys:
+            return {}
+
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        try:
+            with self._lock:
+                connection = self._connect()
+                now = time.time()
+                for start in range(0, len(keys), BULK_CHUNK_SIZE):
+                    chunk = keys[start:start + BULK_CHUNK_SIZE]
+                    placeholders = ", ".join("?" * len(chunk))
+                    for key, value, created_at in connection.execute(
+                        f"SELECT key, value, created_at FROM {self.table} WHERE key IN ({placeholders})", chunk
+                    ):
+                        # Expired entries are treated as misses and removed on the next write
+                        if not self.ttl_seconds or now - created_at <= self.ttl_seconds:
+                            found[key] = value
+
+                if found:
+                    connection.executemany(
+                        f"UPDATE {self.table} SET last_accessed = ? WHERE key = ?",
+                        [(now, key) for key in found]
+                    )
+                    connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading from response cache: {str(e)}")
+            found = {}
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items) -> None:
+        """
+        Store several values in one transaction
+
+        Args:
+            items (dict): Values by key
+        """
+        if not self.enabled or not items:
+            return
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                now = time.time()
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(key, value, now, now) for key, value in items.items() if value is not None]
+                )
+                self._evict(connection, now)
+                connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing to response cache: {str(e)}")
+
+    def delete(self, key) -> None:
+        """
+        Remove a single entry, e.g. a response that turned out to be unusable
+
+        Args:
+            key (str): Cache key
+        """
+        if not self.enabled:
+            return
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error deleting from response cache: {str(e)}")
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters"""
+        with self._lock:
+            if self.enabled:
+                connection = self._connect()
+                connection.execute(f"DELETE FROM {self.table}")
+                connection.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def _evict(self, connection, now) -> None:
+        """Drop expired entries, then the least recently used ones beyond max_entries"""
+        if self.ttl_seconds:
+            connection.execute(
+                f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+
+        count = connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count > self.max_entries:
+            connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY last_accessed ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counters for this process and the current number of entries
+
+        Returns:
+            dict: Cache statistics
+        """
+        entries = 0
+        if self.enabled:
+            try:
+                with self._lock:
+                    entries = self._connect().execute(
+                        f"SELECT COUNT(*) FROM {self.table}"
+                    ).fetchone()[0]
+            except sqlite3.Error as e:
+                logger.error(f"Error reading response cache size: {str(e)}")
+
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
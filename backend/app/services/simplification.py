@@ -1,33 +1,76 @@
+import asyncio
+import dataclasses
 import logging
 import os
-import docx
-from datetime import datetime
+import time
+from typing import Dict, List, NamedTuple, Optional
 
 from app.utils.config import config
-from app.utils.folders import ensure_directory_exists
 from app.services.document_processor import DocumentProcessor
-from app.services.extraction import extract_document_structure
-from app.services.formatting import rebuild_document
-from app.services.text_utils import score_text
+from app.services.document_worker import run_document_task, load_document_elements, build_simplified_document
+from app.services.readability import ReadabilityReport, score_text
 from app.services.openai_processor import process_with_openai
 from app.services.prompt_generation import create_system_prompt
+from app.services.storage import output_storage
+from app.services.metrics import documents_in_progress, stage_seconds
 
 logger = logging.getLogger(__name__)
 
 
-async def simplify_document(docx_path, system_prompt=None, prompt_config=None):
+class SimplificationResult(NamedTuple):
+    """Outcome of simplifying a document"""
+    filename: str  # Key of the simplified document in output_storage
+    simplified_text: str  # Text of the rebuilt document, one element per line
+    readability_score: float  # Flesch-Kincaid grade level of the whole document
+    readability: ReadabilityReport  # Scores per element, section and document
+    elements: List  # Extracted elements in document order, holding the original text
+    processed_elements: Dict[int, str]  # Simplified text by element id
+    timings: Dict[str, float]  # Seconds per stage: upload, extraction, simplification, rebuild, scoring, storage, total
+    document_bytes: bytes  # Content of the simplified document
+
+
+class BatchDocumentResult(NamedTuple):
+    """Outcome of one document of a batch"""
+    filename: str  # Name of the source document
+    result: Optional[SimplificationResult]  # None if the document failed
+    error: Optional[str] = None
+
+
+def _read_file(file):
+    """Read a whole binary file object from the start"""
+    file.seek(0)
+    return file.read()
+
+
+async def simplify_document(docx_path, system_prompt=None, prompt_config=None, progress_callback=None,
+                            filename=None):
     """
     Simplify a document using the pipeline with improved structure preservation
     
     Args:
-        docx_path (str): Path to the Word document to simplify
+        docx_path (str or file): Path to the Word document to simplify, or a binary file object holding it
         system_prompt (str, optional): System prompt for the AI model. If None, created from config.
         prompt_config (dict, optional): Custom configuration. If None, loaded from config file.
+        progress_callback (callable, optional): Coroutine function receiving progress events
+            from DocumentProcessor.process_document_elements
+        filename (str, optional): Original name of the document, used to name the output
+            (default: the name of docx_path)
         
     Returns:
-        tuple: (output_path, readability_score)
+        SimplificationResult: Stored output name, simplified text, scores and stage timings
     """
+    with documents_in_progress.track():
+        return await _simplify_document(docx_path, system_prompt, prompt_config, progress_callback, filename)
+
+
+def _prepare_prompt(system_prompt, prompt_config):
+    """
+    Resolve the prompt configuration and create the system prompt if not provided
     
+    Returns:
+        tuple: (system_prompt, prompt_config, highlighted_words) - highlighted_words holds
+        the keywords the prompt asks to keep or replace
+    """
     if not prompt_config:
         prompt_config = config.PROMPT_CONFIG
     
@@ -54,43 +97,233 @@ async def simplify_document(docx_path, system_prompt=None, prompt_config=None):
     else:
         logger.info("ℹ️ Using provided system prompt")
     
-    logger.info(f"🔄 Processing document: {docx_path}")
+    return system_prompt, prompt_config, highlighted_words
+
+
+async def _load_document(docx_path, prompt_config, highlighted_words, timings):
+    """
+    Read a document's content if needed and extract its elements in a worker process
+    
+    Returns:
+        tuple: (source, elements, highlighted_words) - source is what the worker reads the
+        document from again for the rebuild, highlighted_words includes the document's phrases
+    """
+    # Parsing, rebuilding and serializing run in worker processes, which read a path
+    # themselves or receive the content of an uploaded file
+    if hasattr(docx_path, "read"):
+        stage_started = time.perf_counter()
+        source = await asyncio.to_thread(_read_file, docx_path)
+        timings["upload"] = time.perf_counter() - stage_started
+    else:
+        source = docx_path
+    
+    # Extract document structure. Extraction adds to the set it is given, and with
+    # DOCUMENT_WORKERS=0 documents load concurrently in threads, so each gets its own copy.
+    stage_started = time.perf_counter()
+    elements, found_words = await run_document_task(
+        load_document_elements, source, set(highlighted_words), prompt_config.get("keywords_to_keep", [])
+    )
+    timings["extraction"] = time.perf_counter() - stage_started
+    
+    return source, elements, highlighted_words | found_words
+
+
+async def _finish_document(source, filename, elements, processed_elements, timings, started):
+    """
+    Rebuild, score and store a processed document
+    
+    Returns:
+        SimplificationResult: The finished document
+    """
+    # Rebuild the document and score it
+    stage_started = time.perf_counter()
+    simplified_text, readability, document_bytes, scoring_seconds = await run_document_task(
+        build_simplified_document, source, elements, processed_elements
+    )
+    timings["rebuild"] = time.perf_counter() - stage_started - scoring_seconds
+    timings["scoring"] = scoring_seconds
+    
+    # Store it under a content-hash name, so identical outputs share one object
+    stage_started = time.perf_counter()
+    output_filename = await asyncio.to_thread(output_storage.put, filename, document_bytes)
+    timings["storage"] = time.perf_counter() - stage_started
+    timings["total"] = time.perf_counter() - started
+    
+    # Readability scores per element, per section and for the whole document
+    readability_score = readability.document.grade_level
+    hard_sections = [section for section in readability.sections
+                     if section.scores.grade_level > config.TARGET_GRADE_LEVEL]
+    if hard_sections:
+        logger.info(f"📊 {len(hard_sections)} of {len(readability.sections)} sections are above grade "
+                    f"{config.TARGET_GRADE_LEVEL}, hardest: "
+                    f"{max(hard_sections, key=lambda section: section.scores.grade_level).title!r}")
+    logger.info(f"✅ Processing completed. Readability score: {readability_score:.2f}")
+    logger.info(f"📄 Simplified document stored as: {output_filename}")
+    logger.info("⏱️ Stage timings: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+    
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+    
+    return SimplificationResult(
+        filename=output_filename,
+        simplified_text=simplified_text,
+        readability_score=readability_score,
+        readability=readability,
+        elements=elements,
+        processed_elements=processed_elements,
+        timings=timings,
+        document_bytes=document_bytes
+    )
+
+
+async def _simplify_document(docx_path, system_prompt, prompt_config, progress_callback, filename):
+    """Run the pipeline for simplify_document"""
+    started = time.perf_counter()
+    timings = {}
+    
+    system_prompt, prompt_config, highlighted_words = _prepare_prompt(system_prompt, prompt_config)
     
-    # Generate output filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = os.path.basename(docx_path)
-    filename_without_ext = os.path.splitext(filename)[0]
-    output_docx = f"test_runs/{filename_without_ext}_{timestamp}.docx"
+    filename = os.path.basename(filename or docx_path)
+    logger.info(f"🔄 Processing document: {filename}")
     
-    # Load the document
-    doc = docx.Document(docx_path)
+    source, elements, highlighted_words = await _load_document(docx_path, prompt_config, highlighted_words, timings)
     
     # Create a document processor
     processor = DocumentProcessor(system_prompt, 
                                  keywords_to_keep=prompt_config.get("keywords_to_keep", []), 
                                  highlighted_words=highlighted_words)
     
-    # Extract document structure
-    elements = extract_document_structure(doc, highlighted_words, 
-                                          keywords_to_keep=prompt_config.get("keywords_to_keep", []))
-    
     # Process document elements
-    processed_elements = await processor.process_document_elements(elements)
+    stage_started = time.perf_counter()
+    processed_elements = await processor.process_document_elements(elements, progress_callback=progress_callback)
+    timings["simplification"] = time.perf_counter() - stage_started
     
-    # Rebuild the document
-    simplified_text = rebuild_document(doc, elements, processed_elements)
+    return await _finish_document(source, filename, elements, processed_elements, timings, started)
+
+async def simplify_documents(documents, system_prompt=None, prompt_config=None, on_result=None):
+    """
+    Simplify many documents with one shared scheduler
     
-    # Save processed file
-    ensure_directory_exists("test_runs")
-    logger.info(f"💾 Saving processed file to: {output_docx}")
-    doc.save(output_docx)
+    The elements of all documents go through a single DocumentProcessor, so batches
+    are packed across document boundaries and every batch competes for the same
+    rate limiter. Each document is rebuilt and stored as soon as its last element
+    comes back, while batches of other documents are still running. A document that
+    fails to load or rebuild is reported without stopping the others.
     
-    # Calculate readability score
-    readability_score = score_text(simplified_text)
-    logger.info(f"✅ Processing completed. Readability score: {readability_score:.2f}")
-    logger.info(f"📄 Simplified document saved to: {output_docx}")
+    Args:
+        documents (list): (path, filename) pairs; filename is the original name of the document
+        system_prompt (str, optional): System prompt for the AI model. If None, created from config.
+        prompt_config (dict, optional): Custom configuration. If None, loaded from config file.
+        on_result (callable, optional): Coroutine function called with (position, BatchDocumentResult)
+            as each document finishes
+        
+    Returns:
+        list: BatchDocumentResult per document, in the order given
+    """
+    started = time.perf_counter()
+    system_prompt, prompt_config, prompt_words = _prepare_prompt(system_prompt, prompt_config)
+    logger.info(f"🔄 Processing {len(documents)} documents with a shared scheduler")
+    
+    results = [None] * len(documents)
+    finish_tasks = []
+    
+    async def report(position, outcome):
+        results[position] = outcome
+        documents_in_progress.dec()
+        if outcome.error:
+            logger.error(f"❌ {outcome.filename} failed: {outcome.error}")
+        if on_result:
+            await on_result(position, outcome)
+    
+    async def load(position):
+        path, filename = documents[position]
+        timings = {}
+        try:
+            loaded = await _load_document(path, prompt_config, prompt_words, timings)
+        except Exception as e:
+            await report(position, BatchDocumentResult(filename, None, f"Error reading document: {str(e)}"))
+            return None
+        return loaded, timings
+    
+    documents_in_progress.inc(len(documents))
+    try:
+        loaded = await asyncio.gather(*(load(position) for position in range(len(documents))))
+        
+        # Element ids are only unique within a document, so renumber them for the shared
+        # processor: a document's elements get ids offset past those of the documents before it
+        shared_elements = []
+        document_of = {}
+        pending = {}
+        offsets = {}
+        offset = 0
+        for position, document in enumerate(loaded):
+            if document is None:
+                continue
+            (_, elements, _), _ = document
+            offsets[position] = offset
+            pending[position] = set()
+            for element in elements:
+                shared_id = offset + element.id
+                shared_elements.append(dataclasses.replace(element, id=shared_id))
+                document_of[shared_id] = position
+                if element.type != "media":
+                    pending[position].add(shared_id)
+            offset += max((element.id for element in elements), default=-1) + 1
+        
+        processed = {}
+        simplification_started = time.perf_counter()
+        
+        async def finish(position):
+            (source, elements, _), timings = loaded[position]
+            filename = documents[position][1]
+            timings["simplification"] = time.perf_counter() - simplification_started
+            processed_elements = {
+                element.id: processed.get(offsets[position] + element.id)
+                for element in elements
+            }
+            try:
+                result = await _finish_document(source, filename, elements, processed_elements, timings, started)
+            except Exception as e:
+                await report(position, BatchDocumentResult(filename, None, f"Error rebuilding document: {str(e)}"))
+            else:
+                await report(position, BatchDocumentResult(filename, result))
+        
+        def start_finished():
+            for position in [position for position, ids in pending.items() if not ids]:
+                del pending[position]
+                finish_tasks.append(asyncio.create_task(finish(position)))
+        
+        async def on_progress(event):
+            # Cached and preserved elements arrive with "started", simplified ones per batch
+            for item in event.get("elements", []):
+                processed[item["id"]] = item["text"]
+                position = document_of[item["id"]]
+                if position in pending:
+                    pending[position].discard(item["id"])
+            start_finished()
+        
+        start_finished()
+        
+        if shared_elements:
+            processor = DocumentProcessor(system_prompt,
+                                          keywords_to_keep=prompt_config.get("keywords_to_keep", []),
+                                          highlighted_words=prompt_words)
+            processed.update(await processor.process_document_elements(shared_elements, progress_callback=on_progress))
+        
+        # Whatever did not come back through a progress event is final now
+        for ids in pending.values():
+            ids.clear()
+        start_finished()
+        await asyncio.gather(*finish_tasks)
+    except BaseException:
+        for task in finish_tasks:
+            task.cancel()
+        documents_in_progress.dec(sum(1 for outcome in results if outcome is None))
+        raise
     
-    return output_docx, readability_score
+    completed = sum(1 for outcome in results if outcome.result is not None)
+    logger.info(f"✅ Processed {completed} of {len(documents)} documents in {time.perf_counter() - started:.2f}s")
+    return results
 
 async def simplify_text(text, system_prompt):
     """
@@ -0,0 +1,514 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional
+
+from app.utils.config import config
+
+logger = logging.getLogger(__name__)
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Minimum seconds between garbage collection runs triggered by new outputs
+GC_INTERVAL_SECONDS = 60
+
+# Error codes an S3-compatible service uses for a missing object
+_MISSING_CODES = ("404", "NoSuchKey", "NotFound")
+
+
+class StoredObject(NamedTuple):
+    """A stored output as listed by a storage backend"""
+    key: str
+    size: int
+    modified: float  # Unix time the object was last stored
+
+
+def content_hash(data: bytes) -> str:
+    """
+    Hash a document by its content
+
+    A docx file is a zip archive whose entries carry the time they were written, so
+    for archives the hash covers entry names and uncompressed data, not the raw bytes.
+
+    Args:
+        data (bytes): The document
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                content = archive.read(info)
+                digest.update(f"{info.filename}\0{len(content)}\0".encode("utf-8"))
+                digest.update(content)
+    except zipfile.BadZipFile:
+        digest.update(data)
+    return digest.hexdigest()
+
+
+# Characters replaced in the source document's name when building a key
+_UNSAFE_KEY_CHARACTERS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def make_output_key(filename: str, data: bytes) -> str:
+    """
+    Name an output after its source document and its content, so storing the
+    same output again reuses the existing object
+
+    Args:
+        filename (str): Name of the source document
+        data (bytes): The output document
+
+    Returns:
+        str: Key such as "report_1f3a9c0b5d7e2f41.docx"
+    """
+    # Uploads may carry a client path from any platform, so split on both separators.
+    # Only safe characters are kept, since the key is also sent in Content-Disposition.
+    stem, extension = os.path.splitext(re.split(r"[\\/]", filename)[-1])
+    stem = _UNSAFE_KEY_CHARACTERS.sub("_", stem).lstrip(".") or "document"
+    extension = _UNSAFE_KEY_CHARACTERS.sub("", extension)
+    return f"{stem}_{content_hash(data)[:16]}{extension if len(extension) > 1 else '.docx'}"
+
+
+def is_valid_key(key: str) -> bool:
+    """Keys are plain file names, so a request can never reach outside the storage"""
+    return bool(key) and key not in (".", "..") and "/" not in key and "\\" not in key and "\0" not in key
+
+
+class OutputStorage(ABC):
+    """
+    Base class for where simplified documents are kept
+
+    Objects older than ttl_seconds are treated as missing and removed by garbage
+    collection, which also removes the least recently stored objects while the
+    total size is above max_bytes. Subclasses implement the object operations.
+    """
+
+    # Minimum seconds between garbage collection runs triggered by put()
+    gc_interval = GC_INTERVAL_SECONDS
+
+    def __init__(self, ttl_seconds=None, max_bytes=None):
+        """
+        Initialize the storage
+
+        Args:
+            ttl_seconds (int, optional): Age after which outputs expire
+            max_bytes (int, optional): Total size kept before the oldest outputs are removed
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._last_collected = 0.0
+        self._gc_lock = threading.Lock()
+
+    @abstractmethod
+    def _stat(self, key) -> Optional[StoredObject]:
+        """Size and time stored of an object, or None if it does not exist"""
+
+    @abstractmethod
+    def _read(self, key) -> Optional[bytes]:
+        """Content of an object, or None if it does not exist"""
+
+    @abstractmethod
+    def _write(self, key, data):
+        """Store an object, replacing any with the same key"""
+
+    @abstractmethod
+    def _touch(self, key):
+        """Mark an existing object as just stored"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove an object, if it exists"""
+
+    @abstractmethod
+    def list(self) -> List[StoredObject]:
+        """List all objects, least recently stored or used first"""
+
+    def _is_expired(self, stored, now=None) -> bool:
+        return self.ttl_seconds is not None and (now or time.time()) - stored.modified > self.ttl_seconds
+
+    def put(self, filename, data) -> str:
+        """
+        Store an output document under a content-hash name. Blocking.
+
+        Args:
+            filename (str): Name of the source document
+            data (bytes): The output document
+
+        Returns:
+            str: Key to retrieve the output with
+        """
+        key = make_output_key(filename, data)
+        stored = self._stat(key)
+        if stored is not None and not self._is_expired(stored):
+            logger.info(f"♻️ Output already stored as {key}")
+            self._touch(key)
+        else:
+            self._write(key, data)
+            logger.info(f"💾 Stored output as {key} ({len(data)} bytes)")
+
+        self._maybe_collect()
+        return key
+
+    def get(self, key) -> Optional[bytes]:
+        """
+        Read an output document. Blocking.
+
+        Args:
+            key (str): Key returned by put()
+
+        Returns:
+            bytes or None: The document, or None if it does not exist or has expired
+        """
+        if not is_valid_key(key):
+            return None
+        stored = self._stat(key)
+        if stored is None or self._is_expired(stored):
+            return None
+        return self._read(key)
+
+    def local_path(self, key) -> Optional[str]:
+        """Path of an unexpired output on the local disk, for backends that keep files there"""
+        return None
+
+    def _maybe_collect(self):
+        """Collect garbage unless that happened within the last gc_interval seconds"""
+        now = time.time()
+        if now - self._last_collected >= self.gc_interval:
+            self._last_collected = now
+            self.collect_garbage(now)
+
+    def collect_garbage(self, now=None) -> int:
+        """
+        Remove expired outputs, then the least recently stored ones while above the size cap
+
+        The most recent output is always kept, even when it alone exceeds the cap.
+
+        Args:
+            now (float, optional): Current Unix time
+
+        Returns:
+            int: Number of outputs removed
+        """
+        with self._gc_lock:
+            now = now or time.time()
+            removed = []
+            kept = []
+            for stored in self.list():
+                (removed if self._is_expired(stored, now) else kept).append(stored)
+
+            if self.max_bytes is not None:
+                total = sum(stored.size for stored in kept)
+                while total > self.max_bytes and len(kept) > 1:
+                    stored = kept.pop(0)
+                    removed.append(stored)
+                    total -= stored.size
+
+            for stored in removed:
+                self.delete(stored.key)
+            if removed:
+                logger.info(f"🧹 Removed {len(removed)} expired or excess outputs")
+            return len(removed)
+
+
+class LocalStorage(OutputStorage):
+    """Outputs kept as files in a directory"""
+
+    def __init__(self, directory, ttl_seconds=None, max_bytes=None):
+        super().__init__(ttl_seconds, max_bytes)
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _stat(self, key):
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(key, stat.st_size, stat.st_mtime)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write beside the target and rename, so a download never sees a partial file
+        temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self._path(key))
+
+    def _touch(self, key):
+        os.utime(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        objects = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    objects.append(StoredObject(entry.name, stat.st_size, stat.st_mtime))
+        return sorted(objects, key=lambda stored: stored.modified)
+
+    def local_path(self, key):
+        if not is_valid_key(key):
+            return None
+        stored = self._stat(key)
+        if stored is None or self._is_expired(stored):
+            return None
+        return self._path(key)
+
+
+class MemoryStorage(OutputStorage):
+    """Outputs kept in process memory, evicting the least recently used past the size cap"""
+
+    # Eviction is cheap here and memory is the scarce resource, so collect on every put
+    gc_interval = 0
+
+    def __init__(self, ttl_seconds=None, max_bytes=None):
+        super().__init__(ttl_seconds, max_bytes)
+        self._objects = OrderedDict()  # key -> (data, stored_at), least recently used first
+        self._lock = threading.Lock()
+
+    def _stat(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+        return StoredObject(key, len(entry[0]), entry[1]) if entry else None
+
+    def _read(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+            if entry is None:
+                return None
+            self._objects.move_to_end(key)
+            return entry[0]
+
+    def _write(self, key, data):
+        with self._lock:
+            self._objects[key] = (data, time.time())
+            self._objects.move_to_end(key)
+
+    def _touch(self, key):
+        with self._lock:
+            data, _ = self._objects[key]
+            self._objects[key] = (data, time.time())
+            self._objects.move_to_end(key)
+
+    def delete(self, key):
+        with self._lock:
+            self._objects.pop(key, None)
+
+    def list(self):
+        with self._lock:
+            return [StoredObject(key, len(data), stored_at) for key, (data, stored_at) in self._objects.items()]
+
+
+class BlobStorage(OutputStorage):
+    """
+    Outputs kept in an S3-compatible object store
+
+    Uses the boto3 S3 client API. The client is created on first use, so boto3 is only
+    needed when this backend is configured; pass a client, such as LocalBlobClient, to
+    use another implementation.
+    """
+
+    def __init__(self, bucket, prefix="", client=None, endpoint_url=None, ttl_seconds=None, max_bytes=None):
+        super().__init__(ttl_seconds, max_bytes)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self._client = client
+
+    def _get_client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    def _object_key(self, key):
+        return f"{self.prefix}{key}"
+
+    def _stat(self, key):
+        try:
+            head = self._get_client().head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if _is_missing(e):
+                return None
+            raise
+        return StoredObject(key, head["ContentLength"], head["LastModified"].timestamp())
+
+    def _read(self, key):
+        try:
+            response = self._get_client().get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if _is_missing(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def _write(self, key, data):
+        self._get_client().put_object(
+            Bucket=self.bucket, Key=self._object_key(key), Body=data, ContentType=DOCX_MEDIA_TYPE
+        )
+
+    def _touch(self, key):
+        # Copying an object onto itself with new metadata refreshes its LastModified
+        object_key = self._object_key(key)
+        self._get_client().copy_object(
+            Bucket=self.bucket, Key=object_key, CopySource={"Bucket": self.bucket, "Key": object_key},
+            MetadataDirective="REPLACE", ContentType=DOCX_MEDIA_TYPE
+        )
+
+    def delete(self, key):
+        self._get_client().delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def list(self):
+        client = self._get_client()
+        objects = []
+        request = {"Bucket": self.bucket, "Prefix": self.prefix}
+        while True:
+            response = client.list_objects_v2(**request)
+            for item in response.get("Contents", []):
+                objects.append(StoredObject(
+                    item["Key"][len(self.prefix):], item["Size"], item["LastModified"].timestamp()
+                ))
+            if not response.get("IsTruncated"):
+                break
+            request["ContinuationToken"] = response["NextContinuationToken"]
+        return sorted(objects, key=lambda stored: stored.modified)
+
+
+def _is_missing(error) -> bool:
+    """Whether an S3 client error means the object does not exist"""
+    response = getattr(error, "response", None) or {}
+    return str(response.get("Error", {}).get("Code")) in _MISSING_CODES
+
+
+class BlobNotFoundError(Exception):
+    """Missing object, shaped like the botocore ClientError an S3 client raises"""
+
+    def __init__(self, key):
+        super().__init__(f"No such key: {key}")
+        self.response = {"Error": {"Code": "NoSuchKey", "Message": str(self)}}
+
+
+class LocalBlobClient:
+    """
+    Stand-in for the boto3 S3 client on the local disk, one directory per bucket
+
+    Implements only the calls BlobStorage makes, so the blob backend can run and be
+    tested without an object store.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def _stat(self, bucket, key):
+        try:
+            return os.stat(self._path(bucket, key))
+        except FileNotFoundError:
+            raise BlobNotFoundError(key) from None
+
+    def head_object(self, Bucket, Key):
+        stat = self._stat(Bucket, Key)
+        return {"ContentLength": stat.st_size,
+                "LastModified": datetime.fromtimestamp(stat.st_mtime, timezone.utc)}
+
+    def get_object(self, Bucket, Key):
+        head = self.head_object(Bucket, Key)
+        with open(self._path(Bucket, Key), "rb") as f:
+            return {"Body": io.BytesIO(f.read()), **head}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(Body)
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        source = self._path(CopySource["Bucket"], CopySource["Key"])
+        self._stat(CopySource["Bucket"], CopySource["Key"])
+        destination = self._path(Bucket, Key)
+        if source == destination:
+            os.utime(destination)
+        else:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copyfile(source, destination)
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        try:
+            os.remove(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        bucket_dir = os.path.join(self.root, Bucket)
+        contents = []
+        for directory, _, files in os.walk(bucket_dir):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, bucket_dir).replace(os.sep, "/")
+                if key.startswith(Prefix):
+                    stat = os.stat(path)
+                    contents.append({"Key": key, "Size": stat.st_size,
+                                     "LastModified": datetime.fromtimestamp(stat.st_mtime, timezone.utc)})
+        return {"Contents": sorted(contents, key=lambda item: item["Key"]), "IsTruncated": False}
+
+
+def create_output_storage():
+    """
+    Create the output storage selected by config.OUTPUT_STORAGE
+
+    Returns:
+        OutputStorage: Local disk ("local"), process memory ("memory") or an
+        S3-compatible object store ("blob")
+    """
+    limits = {"ttl_seconds": config.OUTPUT_TTL_SECONDS, "max_bytes": config.OUTPUT_MAX_BYTES}
+
+    if config.OUTPUT_STORAGE == "memory":
+        return MemoryStorage(**limits)
+    if config.OUTPUT_STORAGE == "blob":
+        endpoint_url = config.OUTPUT_BLOB_ENDPOINT_URL
+        # A file:// endpoint stands in for the object store with a local directory
+        if endpoint_url and endpoint_url.startswith("file://"):
+            client = LocalBlobClient(endpoint_url[len("file://"):])
+            return BlobStorage(config.OUTPUT_BLOB_BUCKET, config.OUTPUT_BLOB_PREFIX, client=client, **limits)
+        return BlobStorage(config.OUTPUT_BLOB_BUCKET, config.OUTPUT_BLOB_PREFIX, endpoint_url=endpoint_url,
+                           **limits)
+    if config.OUTPUT_STORAGE != "local":
+        raise ValueError(f"Unknown OUTPUT_STORAGE: {config.OUTPUT_STORAGE!r}")
+    return LocalStorage(config.OUTPUT_DIR, **limits)
+
+
+output_storage = create_output_storage()
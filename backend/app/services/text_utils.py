@@ -1,36 +1,133 @@
+import hashlib
+import logging
+import math
+import os
 import re
-import nltk
-from nltk.tokenize import sent_tokenize
 
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+from app.utils.config import config
 
+logger = logging.getLogger(__name__)
 
-def score_text(text: str) -> float:
+# Average characters per token for English text, used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+# Encoding used to count tokens, and where tiktoken downloads its file from. tiktoken
+# caches the file under the SHA-1 of that URL.
+TOKEN_ENCODING = "cl100k_base"
+TOKEN_ENCODING_URL = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+
+# Lazily loaded tiktoken encoding (False once loading has failed)
+_token_encoding = None
+
+# Lazily loaded NLTK punkt sentence tokenizer (False once it is known to be unavailable)
+_sentence_tokenizer = None
+
+# Fallback sentence boundary: whitespace after end punctuation (and an optional closing
+# quote or bracket), followed by what looks like the start of a new sentence
+_SENTENCE_BOUNDARY = re.compile(r"(?:(?<=[.!?])|(?<=[.!?][\"'”’)\]]))\s+(?=[\"'“‘(\[]?[A-Z0-9])")
+
+# Abbreviations the fallback splitter does not end a sentence on
+_ABBREVIATIONS = {"dr.", "mr.", "mrs.", "ms.", "st.", "no.", "vs.", "etc.", "e.g.", "i.e.", "approx.", "dept."}
+
+
+def get_nltk():
+    """
+    Import NLTK on first use, with NLTK_DATA_DIR searched first for its data
+    
+    Returns:
+        module or None: The nltk module, or None if it is not installed
+    """
+    try:
+        import nltk
+    except ImportError:
+        return None
+    if config.NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, config.NLTK_DATA_DIR)
+    return nltk
+
+
+def _get_sentence_tokenizer():
+    """Load the punkt sentence tokenizer on first use, or return None if its data is not installed"""
+    global _sentence_tokenizer
+    if _sentence_tokenizer is None:
+        _sentence_tokenizer = False
+        nltk = get_nltk()
+        if nltk is not None:
+            try:
+                nltk.sent_tokenize("Checking that punkt is installed.")
+                _sentence_tokenizer = nltk.sent_tokenize
+            except LookupError:
+                logger.info("NLTK punkt data is not installed - splitting sentences with a regular expression")
+    return _sentence_tokenizer or None
+
+
+def _get_token_encoding():
     """
-    Calculate a readability score for the given text (Flesch-Kincaid Grade Level)
+    Load the tiktoken encoding on first use from TIKTOKEN_CACHE_DIR, or return None if it is unavailable
+    
+    tiktoken downloads encoding files it has not cached, which would block the event
+    loop until the connection times out on machines without internet access. The
+    encoding is only loaded when its file is already in the cache, so nothing is fetched.
+    """
+    global _token_encoding
+    if _token_encoding is None:
+        _token_encoding = False
+        cache_file = os.path.join(config.TIKTOKEN_CACHE_DIR, hashlib.sha1(TOKEN_ENCODING_URL.encode()).hexdigest())
+        if not os.path.exists(cache_file):
+            logger.info("tiktoken data is not installed - estimating tokens from text length")
+            return None
+        try:
+            os.environ["TIKTOKEN_CACHE_DIR"] = config.TIKTOKEN_CACHE_DIR
+            import tiktoken
+            _token_encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            # tiktoken missing or its cached file unusable - use the heuristic
+            logger.info(f"tiktoken is unavailable ({e}) - estimating tokens from text length")
+    return _token_encoding or None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of model tokens in a text, locally and without an API call
     
     Args:
-        text (str): Text to score
+        text (str): Text to measure
         
     Returns:
-        float: Readability score (higher scores indicate higher complexity)
+        int: Estimated token count
     """
-    # Remove extra whitespace and normalize
-    text = re.sub(r'\s+', ' ', text).strip()
-    
     if not text:
-        return 0.0
-        
-    # Count characters, words, and sentences
-    num_chars = len(text)
-    num_words = len(text.split())
-    num_sentences = max(1, len(sent_tokenize(text)))  # Avoid division by zero
+        return 0
     
-    # Calculate Flesch-Kincaid Grade Level
-    score = (4.71 * (num_chars / num_words)) + (0.5 * (num_words / num_sentences)) - 21.43
+    encoding = _get_token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
     
-    # Clamp score to non-negative values
-    return max(0, score) 
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str) -> list:
+    """
+    Split text into sentences
+    
+    Uses NLTK's punkt tokenizer when its data is installed locally, and a regular
+    expression otherwise. Nothing is downloaded.
+    
+    Args:
+        text (str): Text to split
+        
+    Returns:
+        list: The sentences
+    """
+    tokenizer = _get_sentence_tokenizer()
+    if tokenizer is not None:
+        return tokenizer(text)
+    sentences = []
+    for part in _SENTENCE_BOUNDARY.split(text.strip()):
+        if not part:
+            continue
+        if sentences and sentences[-1].rsplit(None, 1)[-1].lower() in _ABBREVIATIONS:
+            sentences[-1] += " " + part
+        else:
+            sentences.append(part)
+    return sentences
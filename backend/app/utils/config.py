@@ -11,16 +11,131 @@ class Config:
     AZURE_OPENAI_API_VERSION = os.environ.get("AZURE_OPENAI_API_VERSION")
     AZURE_OPENAI_DEPLOYMENT_NAME = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME")
 
-    # Number of batches to process in parallel
-    MAX_CONCURRENT_REQUESTS = 10
+    # Process-wide concurrency for Azure OpenAI calls, shared by all requests.
+    # The limit starts at INITIAL, halves on 429s and grows back towards MAX.
+    MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", 10))
+    MIN_CONCURRENT_REQUESTS = 1
+    INITIAL_CONCURRENT_REQUESTS = int(os.environ.get("INITIAL_CONCURRENT_REQUESTS", 8))
     
-    # Batch size for document processing
-    BATCH_SIZE = 10
+    # Deployment quotas, tracked over a sliding one-minute window. Set them to the
+    # quota of your deployment.
+    REQUESTS_PER_MINUTE = int(os.environ.get("REQUESTS_PER_MINUTE", 480))
+    TOKENS_PER_MINUTE = int(os.environ.get("TOKENS_PER_MINUTE", 80000))
+    
+    # Calls slower than this reduce concurrency slightly
+    LATENCY_TARGET_SECONDS = 60
+    
+    # Minimum seconds between two concurrency reductions
+    RATE_LIMIT_DECREASE_COOLDOWN = 2
+    
+    # Maximum number of elements packed into one batch
+    BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 10))
+    
+    # Token budgets used when packing elements into a batch. The output budget
+    # stays below MAX_TOKENS so that batches are not truncated.
+    BATCH_MAX_INPUT_TOKENS = 6000
+    BATCH_MAX_OUTPUT_TOKENS = 3000
+    
+    # Expected completion tokens per token of original element text
+    OUTPUT_TOKEN_RATIO = 1.2
+    
+    # Mix paragraphs, list items, etc. in the same batch
+    PACK_ACROSS_TYPES = True
+    
+    # Keep the elements under one heading together in a batch where they fit, and
+    # tell the model which section each element belongs to
+    SECTION_CHUNKING = True
+    
+    # Send batch instructions once in a system prompt shared by every batch, and each
+    # element as its text plus a short note, instead of a full prompt per element
+    COMPACT_BATCH_PROMPTS = True
+    
+    # How many times a failed batch may be split in half, or have its missing
+    # elements re-sent, before falling back to the original text
+    BATCH_RECOVERY_DEPTH = 3
+    
+    # Background job settings: documents simplified at once, jobs allowed to wait,
+    # and where job state and queued uploads are kept
+    JOB_WORKERS = 2
+    JOB_QUEUE_MAX = 100
+    JOBS_DIR = "jobs"
+    
+    # Most documents accepted by one request to the batch endpoint
+    BATCH_MAX_DOCUMENTS = 500
+    
+    # Worker processes for parsing, rebuilding and saving documents, so CPU-bound
+    # work stays off the event loop. 0 runs that work in a thread instead.
+    DOCUMENT_WORKERS = min(4, os.cpu_count() or 1)
+    
+    # Uploads up to this many bytes are processed from memory; larger ones are
+    # spooled to a temporary file
+    UPLOAD_SPOOL_MAX_SIZE = 10 * 1024 * 1024
+    
+    # Seconds between heartbeat events on the streaming endpoint
+    STREAM_HEARTBEAT_SECONDS = 15
+    
+    # NLTK data shipped with the app (e.g. tokenizers/punkt), searched before the
+    # default locations. Nothing is downloaded at runtime; without punkt, sentences
+    # are split with a regular expression.
+    NLTK_DATA_DIR = os.environ.get(
+        "NLTK_DATA_DIR", os.path.join(Path(__file__).resolve().parent.parent.parent, "nltk_data")
+    )
+    
+    # tiktoken's cache of encoding files shipped with the app. Only an encoding already
+    # cached here is used; without it, tokens are estimated from the text length.
+    TIKTOKEN_CACHE_DIR = os.environ.get(
+        "TIKTOKEN_CACHE_DIR", os.path.join(Path(__file__).resolve().parent.parent.parent, "tiktoken_cache")
+    )
+    
+    # Reading grade the simplified text should reach; sections above it are reported
+    TARGET_GRADE_LEVEL = 6
+    
+    # Where processed documents are kept: "local" (files in OUTPUT_DIR), "memory"
+    # (lost on restart) or "blob" (an S3-compatible object store)
+    OUTPUT_STORAGE = os.environ.get("OUTPUT_STORAGE", "local")
     
     # Output directory for processed documents
     OUTPUT_DIR = "test_runs"
     
-    # Rate limit backoff settings (kept for compatibility)
+    # Processed documents are removed after this many seconds, and the oldest ones
+    # once they take up more than OUTPUT_MAX_BYTES
+    OUTPUT_TTL_SECONDS = 7 * 24 * 60 * 60  # One week
+    OUTPUT_MAX_BYTES = 512 * 1024 * 1024
+    
+    # Object store for the "blob" output storage. None uses AWS S3; a file:// URL
+    # keeps the objects in a local directory instead.
+    OUTPUT_BLOB_BUCKET = os.environ.get("OUTPUT_BLOB_BUCKET", "clear-text-outputs")
+    OUTPUT_BLOB_PREFIX = os.environ.get("OUTPUT_BLOB_PREFIX", "outputs/")
+    OUTPUT_BLOB_ENDPOINT_URL = os.environ.get("OUTPUT_BLOB_ENDPOINT_URL")
+    
+    # Sampling parameters for Azure OpenAI completions
+    TEMPERATURE = 0.7
+    MAX_TOKENS = 4096
+    
+    # Persistent response cache settings
+    CACHE_ENABLED = True
+    CACHE_PATH = "cache/simplification_cache.sqlite3"
+    CACHE_MAX_ENTRIES = 10000
+    ELEMENT_CACHE_MAX_ENTRIES = 100000
+    CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # One week
+    
+    # Client for completions: "azure", "record" (Azure, appending every response to
+    # FAKE_OPENAI["replay_path"]) or "fake" (offline, for load tests; replays recorded
+    # responses and echoes every other element back)
+    OPENAI_CLIENT = os.environ.get("OPENAI_CLIENT", "azure")
+    
+    # Behaviour of the fake client: seconds per call plus up to jitter_seconds more,
+    # the fraction of calls failing with a 429, and of elements left out of replies
+    FAKE_OPENAI = {
+        "latency_seconds": 1.0,
+        "jitter_seconds": 0.5,
+        "error_rate": 0.0,
+        "drop_rate": 0.0,
+        "replay_path": "benchmarks/recordings/responses.jsonl"
+    }
+    
+    # Retry settings for failed Azure OpenAI calls (429s, timeouts, 5xx).
+    # A Retry-After header from the server takes precedence over these waits.
     RATE_LIMIT_BACKOFF = {
         "initial_wait": 10,
         "max_wait": 120,
@@ -1,4 +1,5 @@
 import logging
+import os
 import sys
 
 # Custom filter to only show errors, warnings and important INFO logs
@@ -47,7 +48,7 @@ def init_logger():
     
     # Add the handler to root logger
     root_logger.addHandler(stream_handler)
-    root_logger.setLevel(logging.INFO)
+    root_logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
     
     # Apply our custom filter to root logger
     boilerplate_filter = BoilerplateFilter()
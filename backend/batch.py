@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+# Setup logging
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+from app.services.simplification import simplify_documents
+from app.services.storage import output_storage
+from app.services.document_worker import shutdown_document_pool
+
+
+def collect_documents(paths):
+    """Expand directories to the .docx files in them, keeping files as given"""
+    documents = []
+    for path in paths:
+        if os.path.isdir(path):
+            documents.extend(sorted(glob.glob(os.path.join(path, "*.docx"))))
+        elif path.lower().endswith(".docx") and os.path.exists(path):
+            documents.append(path)
+        else:
+            print(f"Skipping {path}: not a .docx file or directory")
+    return documents
+
+
+async def main():
+    """
+    Simplify many docx files at once, with their elements batched together
+    Usage: python batch.py file.docx [more.docx | directory ...] [--manifest manifest.json]
+    """
+    parser = argparse.ArgumentParser(description="Simplify many docx files with one shared scheduler")
+    parser.add_argument("paths", nargs="+", help=".docx files, or directories holding them")
+    parser.add_argument("--manifest", help="where to write the JSON manifest (default: batch_manifest_<timestamp>.json)")
+    args = parser.parse_args()
+
+    paths = collect_documents(args.paths)
+    if not paths:
+        print("No .docx files to process.")
+        sys.exit(1)
+
+    manifest_path = args.manifest or f"batch_manifest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    print(f"Processing {len(paths)} documents...")
+    start_time = time.time()
+
+    async def on_result(position, outcome):
+        # Outputs are stored as each document finishes
+        if outcome.result:
+            print(f"[{time.time() - start_time:7.1f}s] ✅ {outcome.filename} -> {outcome.result.filename} "
+                  f"(readability {outcome.result.readability_score:.2f})")
+        else:
+            print(f"[{time.time() - start_time:7.1f}s] ❌ {outcome.filename}: {outcome.error}")
+
+    try:
+        outcomes = await simplify_documents(
+            [(os.path.abspath(path), os.path.basename(path)) for path in paths],
+            on_result=on_result
+        )
+    finally:
+        shutdown_document_pool()
+
+    processing_time = time.time() - start_time
+    manifest = {
+        "createdAt": datetime.now().isoformat(timespec="seconds"),
+        "totalSeconds": round(processing_time, 2),
+        "documents": [
+            {
+                "input": path,
+                "status": "completed" if outcome.result else "failed",
+                "filename": outcome.result.filename if outcome.result else None,
+                "path": output_storage.local_path(outcome.result.filename) if outcome.result else None,
+                "readabilityScore": round(outcome.result.readability_score, 2) if outcome.result else None,
+                "error": outcome.error
+            }
+            for path, outcome in zip(paths, outcomes)
+        ]
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    completed = sum(1 for outcome in outcomes if outcome.result)
+    print(f"\nBatch completed: {completed} of {len(paths)} documents in {processing_time:.2f} seconds")
+    print(f"- Manifest: {manifest_path}")
+    if completed < len(paths):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
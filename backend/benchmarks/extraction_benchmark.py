@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Benchmark extract_document_structure against the previous three-pass implementation
+
+Usage: python -m benchmarks.extraction_benchmark [--repeat N] [files...]
+
+Defaults to every document in test_documents/.
+"""
+import argparse
+import glob
+import io
+import logging
+import os
+import time
+import uuid
+
+import docx
+
+from app.services.extraction import (
+    extract_document_structure,
+    _extract_paragraph_format,
+    _extract_color,
+    _extract_list_info,
+    _determine_element_type
+)
+
+TEST_DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_documents")
+
+
+def legacy_extract_document_structure(doc, highlighted_words=None):
+    """The previous implementation: three walks over doc.paragraphs plus a shapes x paragraphs scan"""
+    highlighted_words = highlighted_words or set()
+    document_elements = []
+    media_elements = []
+
+    for i, paragraph in enumerate(doc.paragraphs):
+        if not paragraph.text.strip():
+            continue
+        style_name = paragraph.style.name.lower()
+        format_info = _extract_paragraph_format(paragraph)
+        element_type = _determine_element_type(paragraph, style_name, paragraph.text)
+        runs_data = []
+        highlighted_phrases = set()
+        highlighted_text = ""
+        for j, run in enumerate(paragraph.runs):
+            runs_data.append({
+                "text": run.text,
+                "bold": run.bold,
+                "italic": run.italic,
+                "underline": run.underline,
+                "highlight": run.font.highlight_color is not None,
+                "font_size": run.font.size.pt if run.font.size else None,
+                "font_name": run.font.name if run.font.name else None,
+                "color": _extract_color(run.font)
+            })
+            if run.font.highlight_color:
+                if j > 0 and paragraph.runs[j - 1].font.highlight_color:
+                    highlighted_text += run.text if run.text else " "
+                else:
+                    if highlighted_text:
+                        highlighted_phrases.add(highlighted_text)
+                    highlighted_text = run.text if run.text else " "
+            elif highlighted_text:
+                highlighted_phrases.add(highlighted_text)
+                highlighted_text = ""
+        if highlighted_text:
+            highlighted_phrases.add(highlighted_text)
+        document_elements.append({
+            "id": str(uuid.uuid4()),
+            "index": i,
+            "type": element_type,
+            "text": paragraph.text,
+            "style": style_name,
+            "format": format_info,
+            "runs": runs_data,
+            "highlighted_phrases": highlighted_phrases,
+            "list_info": _extract_list_info(paragraph, paragraph.text) if element_type == "list_item" else None
+        })
+
+    for i, paragraph in enumerate(doc.paragraphs):
+        for shape in paragraph._element.xpath('.//w:drawing'):
+            media_elements.append({"id": str(uuid.uuid4()), "type": "media", "index": i,
+                                   "media_type": "inline_shape", "xml_element": shape})
+
+    for rel_id, rel in doc.part.rels.items():
+        if any(media_type in rel.target_ref for media_type in ['image', 'media', 'chart', 'diagram', 'drawing']):
+            media_elements.append({"id": str(uuid.uuid4()), "type": "media", "media_type": "embedded_media",
+                                   "rel_id": rel_id, "target": rel.target_ref})
+
+    if doc.inline_shapes:
+        for i, shape in enumerate(doc.inline_shapes):
+            for p_idx, paragraph in enumerate(doc.paragraphs):
+                if any(run._element.xpath('.//w:drawing') for run in paragraph.runs):
+                    media_elements.append({"id": str(uuid.uuid4()), "type": "media", "index": p_idx,
+                                           "media_type": "inline_shape", "shape_index": i})
+                    break
+
+    document_elements.extend(media_elements)
+    return document_elements
+
+
+def _field(item, name):
+    """Read a field from a legacy dict or a typed element"""
+    return item[name] if isinstance(item, dict) else getattr(item, name, None)
+
+
+RUN_FIELDS = ("text", "bold", "italic", "underline", "highlight", "font_size", "font_name", "color")
+
+
+def _text_signature(elements):
+    """Comparable view of the text elements, ignoring ids"""
+    return [
+        (_field(e, "index"), _field(e, "type"), _field(e, "text"), _field(e, "style"),
+         [tuple(_field(r, name) for name in RUN_FIELDS) for r in _field(e, "runs")],
+         sorted(_field(e, "highlighted_phrases")))
+        for e in elements if _field(e, "type") != "media"
+    ]
+
+
+def _covers_legacy(legacy_elements, current_elements):
+    """
+    Whether the current extraction finds every legacy element, in order
+
+    The legacy implementation only read the body's top-level paragraphs. The current
+    one also reads tables, text boxes, headers, footers and notes, and numbers
+    paragraphs across all of them, so indexes are left out of the comparison.
+    """
+    current = iter(signature[1:] for signature in _text_signature(current_elements))
+    if not all(signature[1:] in current for signature in _text_signature(legacy_elements)):
+        return False
+    return len(_media_paragraphs(legacy_elements)) <= len(_media_paragraphs(current_elements))
+
+
+def _media_paragraphs(elements):
+    """Paragraph indexes protected because they contain media"""
+    return {
+        _field(e, "index") for e in elements
+        if _field(e, "type") == "media" and (not isinstance(e, dict) or "index" in e) and _field(e, "index") is not None
+    }
+
+
+def _time(function, data, repeat):
+    """Best-of-N time for parsing and extracting a document"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        doc = docx.Document(io.BytesIO(data))
+        start = time.perf_counter()
+        result = function(doc)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="docx files (default: test_documents/*.docx)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per document, best time is reported")
+    args = parser.parse_args()
+
+    # Keep the extraction log lines out of the report
+    logging.disable(logging.INFO)
+
+    files = args.files or sorted(glob.glob(os.path.join(TEST_DOCUMENTS_DIR, "*.docx")))
+    total_legacy = 0.0
+    total_current = 0.0
+
+    print(f"{'document':<45} {'elements':>8} {'legacy ms':>10} {'single-pass ms':>15} {'speedup':>8}  match")
+    for path in files:
+        with open(path, "rb") as f:
+            data = f.read()
+
+        legacy_time, legacy_elements = _time(legacy_extract_document_structure, data, args.repeat)
+        current_time, current_elements = _time(extract_document_structure, data, args.repeat)
+        total_legacy += legacy_time
+        total_current += current_time
+
+        match = _covers_legacy(legacy_elements, current_elements)
+
+        print(f"{os.path.basename(path):<45} {len(current_elements):>8} {legacy_time * 1000:>10.1f} "
+              f"{current_time * 1000:>15.1f} {legacy_time / current_time:>7.1f}x  {'yes' if match else 'NO'}")
+
+    print(f"{'total':<45} {'':>8} {total_legacy * 1000:>10.1f} {total_current * 1000:>15.1f} "
+          f"{total_legacy / total_current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare the memory used by extracted document elements before and after the move
+from dicts to slotted dataclasses
+
+Usage: python -m benchmarks.memory_benchmark [files...]
+
+Defaults to every document in test_documents/, largest last. Each document is
+extracted once with the previous dict-based implementation (legacy) and once with
+extract_document_structure (current). The parsed document is loaded before tracing
+starts, so the figures cover extraction alone: the peak while extracting, and what
+the element list keeps alive afterwards.
+"""
+import argparse
+import gc
+import glob
+import io
+import logging
+import os
+import tracemalloc
+
+import docx
+
+from app.services.extraction import extract_document_structure
+from benchmarks.extraction_benchmark import TEST_DOCUMENTS_DIR, legacy_extract_document_structure
+
+
+def measure(function, data):
+    """
+    Trace one extraction
+
+    Returns:
+        tuple: (number of elements, peak bytes, retained bytes)
+    """
+    doc = docx.Document(io.BytesIO(data))
+    gc.collect()
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    elements = function(doc)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return len(elements), peak - baseline, retained - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="docx files (default: test_documents/*.docx)")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    files = args.files or sorted(glob.glob(os.path.join(TEST_DOCUMENTS_DIR, "*.docx")), key=os.path.getsize)
+
+    print(f"{'document':<45} {'size KB':>8} {'implementation':>14} {'elements':>8} {'peak KB':>9} "
+          f"{'retained KB':>12} {'bytes/element':>14}")
+    for path in files:
+        with open(path, "rb") as f:
+            data = f.read()
+
+        for label, function in (("legacy", legacy_extract_document_structure), ("current", extract_document_structure)):
+            count, peak, retained = measure(function, data)
+            print(f"{os.path.basename(path):<45} {len(data) / 1024:>8.0f} {label:>14} {count:>8} {peak / 1024:>9.1f} "
+                  f"{retained / 1024:>12.1f} {retained / max(count, 1):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Compare the input tokens of the full and compact batch prompt formats
+
+Usage: python -m benchmarks.prompt_tokens_benchmark [files...]
+
+Defaults to every document in test_documents/. Each document is packed into batches
+and every batch prompt is built, without calling the model, once with a full prompt
+per element and once with COMPACT_BATCH_PROMPTS. Tokens are counted with the local
+estimate used for packing. "cacheable" is the part of the input the provider can serve
+from its prompt cache: the system prompt of every call after the first, when it is the
+same across calls and at least CACHE_MIN_PREFIX_TOKENS long.
+"""
+import argparse
+import glob
+import io
+import logging
+import os
+
+import docx
+
+from app.services.batching import find_sections, pack_document_elements
+from app.services.document_processor import DocumentProcessor
+from app.services.extraction import extract_document_structure
+from app.services.prompt_generation import create_compact_element_prompt, create_element_prompt, create_system_prompt
+from app.services.text_utils import estimate_tokens
+from app.utils.config import config
+from benchmarks.extraction_benchmark import TEST_DOCUMENTS_DIR
+
+# Shortest prompt prefix Azure OpenAI caches
+CACHE_MIN_PREFIX_TOKENS = 1024
+
+
+def _batched_elements(elements):
+    """The elements DocumentProcessor sends to the model, ignoring the element cache"""
+    return [
+        element for element in elements
+        if element.type != "media" and not element.type.startswith("heading_")
+        and element.type not in ("toc_entry", "caption") and element.text.strip()
+    ]
+
+
+def measure(elements, system_prompt, compact):
+    """
+    Pack and build every batch prompt of a document in one format
+
+    Returns:
+        tuple: (calls, input tokens, cacheable tokens)
+    """
+    config.COMPACT_BATCH_PROMPTS = compact
+    processor = DocumentProcessor(system_prompt)
+    processor.sections.update(find_sections(elements))
+    prompt_builder = create_compact_element_prompt if compact else create_element_prompt
+    batches = pack_document_elements(_batched_elements(elements), prompt_builder=prompt_builder,
+                                      sections=processor.sections)
+
+    input_tokens = 0
+    cacheable = 0
+    system_prompts = set()
+    for batch in batches:
+        batch_system_prompt, user_prompt = processor.build_batch_prompt(batch)
+        system_tokens = estimate_tokens(batch_system_prompt)
+        input_tokens += system_tokens + estimate_tokens(user_prompt)
+        if batch_system_prompt in system_prompts and system_tokens >= CACHE_MIN_PREFIX_TOKENS:
+            cacheable += system_tokens
+        system_prompts.add(batch_system_prompt)
+    return len(batches), input_tokens, cacheable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="docx files (default: test_documents/*.docx)")
+    args = parser.parse_args()
+
+    # Keep the extraction log lines out of the report
+    logging.disable(logging.INFO)
+
+    files = args.files or sorted(glob.glob(os.path.join(TEST_DOCUMENTS_DIR, "*.docx")))
+    system_prompt = create_system_prompt(
+        base_prompt=config.PROMPT_CONFIG["base_prompt"],
+        keywords_to_keep=config.PROMPT_CONFIG["keywords_to_keep"],
+        keywords_to_replace=config.PROMPT_CONFIG["keywords_to_replace"],
+        samples=config.PROMPT_CONFIG["examples"]
+    )
+    print(f"System prompt: {estimate_tokens(system_prompt)} tokens, "
+          f"{estimate_tokens(DocumentProcessor(system_prompt).batch_system_prompt)} with the compact batch instructions")
+
+    print(f"{'document':<45} {'elements':>8} {'full calls':>10} {'tokens':>8} {'compact calls':>13} {'tokens':>8} "
+          f"{'cacheable':>9} {'saved':>6}")
+    totals = [0, 0, 0, 0, 0]
+    compact_setting = config.COMPACT_BATCH_PROMPTS
+    try:
+        for path in files:
+            with open(path, "rb") as f:
+                elements = extract_document_structure(docx.Document(io.BytesIO(f.read())))
+            element_count = len(_batched_elements(elements))
+
+            full_calls, full_tokens, _ = measure(elements, system_prompt, compact=False)
+            compact_calls, compact_tokens, cacheable = measure(elements, system_prompt, compact=True)
+            for i, value in enumerate((full_calls, full_tokens, compact_calls, compact_tokens, cacheable)):
+                totals[i] += value
+
+            saved = 1 - compact_tokens / full_tokens if full_tokens else 0.0
+            print(f"{os.path.basename(path):<45} {element_count:>8} {full_calls:>10} {full_tokens:>8} "
+                  f"{compact_calls:>13} {compact_tokens:>8} {cacheable:>9} {saved:>6.0%}")
+    finally:
+        config.COMPACT_BATCH_PROMPTS = compact_setting
+
+    full_calls, full_tokens, compact_calls, compact_tokens, cacheable = totals
+    print(f"{'total':<45} {'':>8} {full_calls:>10} {full_tokens:>8} {compact_calls:>13} {compact_tokens:>8} "
+          f"{cacheable:>9} {1 - compact_tokens / full_tokens:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
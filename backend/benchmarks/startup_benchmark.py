@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Measure API cold start: `import main` time and time to the first /health response
+
+Usage: python -m benchmarks.startup_benchmark [--repeat N]
+
+Each measurement runs in a fresh interpreter. Time to first /health covers starting
+uvicorn, importing the app, running its startup and answering one request.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def time_import():
+    """Time `import main` in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_first_health(timeout=60):
+    """Start uvicorn and time until /health first answers"""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:api", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited before answering /health")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"/health did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def report(label, samples):
+    print(f"{label:<24} min {min(samples):.3f}s  median {statistics.median(samples):.3f}s  "
+          f"max {max(samples):.3f}s  ({len(samples)} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (default: 5)")
+    args = parser.parse_args()
+
+    report("import main", [time_import() for _ in range(args.repeat)])
+    report("time to first /health", [time_first_health() for _ in range(args.repeat)])
+
+
+if __name__ == "__main__":
+    main()
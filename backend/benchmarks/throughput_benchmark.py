@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Run the test_documents corpus through simplify_document against the offline fake client
+
+Usage: python -m benchmarks.throughput_benchmark [--concurrency 1 4 8] [--repeat N]
+           [--latency S] [--jitter S] [--error-rate R] [--drop-rate R] [--replay PATH]
+           [--ignore-quotas] [files...]
+
+For each concurrency level (documents simplified at once), every file is simplified
+--repeat times and the run reports documents per minute, p50/p95 document latency,
+model calls per document and peak RSS. No Azure quota is used: FakeAsyncOpenAI answers
+after the configured latency, and replays responses recorded with OPENAI_CLIENT=record.
+
+The response and element caches are disabled so every run makes the same calls, and
+outputs are kept in memory. The configured per-minute quotas still apply unless
+--ignore-quotas is given. Peak RSS of the server process covers the whole run so far,
+since levels run in the order given; workers shows the largest document worker.
+"""
+import os
+
+# Keep outputs in memory and document workers quiet; must be set before the app
+# reads its config and the workers start
+os.environ.setdefault("OUTPUT_STORAGE", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import resource
+import time
+
+from app.extensions.fake_openai import FakeAsyncOpenAI
+from app.extensions.openai import set_async_openai_client
+from app.services.document_processor import element_cache
+from app.services.document_worker import shutdown_document_pool
+from app.services.openai_processor import response_cache
+from app.services.rate_limiting import openai_limiter
+from app.services.simplification import simplify_document
+from benchmarks.extraction_benchmark import TEST_DOCUMENTS_DIR
+
+
+def _peak_rss_mb():
+    """Peak RSS of this process, and the largest peak among its live children (Linux only)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    workers = None
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        workers = max(workers or 0, int(line.split()[1]) / 1024)
+        except OSError:
+            pass
+    return own, workers
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run_level(paths, concurrency, client):
+    """
+    Simplify every path with at most `concurrency` documents in progress
+
+    Returns:
+        tuple: (wall seconds, per-document seconds, failures)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def run(path):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await simplify_document(path)
+            except Exception as e:
+                failures += 1
+                print(f"  {os.path.basename(path)} failed: {e}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    set_async_openai_client(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(run(path) for path in paths))
+    return time.perf_counter() - started, latencies, failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="documents to simplify (default: test_documents/*.docx)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8],
+                        help="documents in progress at once, one run per level (default: 1 4 8)")
+    parser.add_argument("--repeat", type=int, default=1, help="times each document is simplified per level")
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per model call (default: 1.0)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="up to this many extra seconds per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of simulated 429s")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of elements missing from replies")
+    parser.add_argument("--replay", help="recorded responses to replay (JSON Lines)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for simulated latency and failures")
+    parser.add_argument("--ignore-quotas", action="store_true",
+                        help="lift REQUESTS_PER_MINUTE and TOKENS_PER_MINUTE for the run")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    files = args.files or sorted(
+        os.path.join(TEST_DOCUMENTS_DIR, name) for name in os.listdir(TEST_DOCUMENTS_DIR) if name.endswith(".docx")
+    )
+    paths = [path for path in files for _ in range(args.repeat)]
+
+    response_cache.enabled = False
+    element_cache.enabled = False
+    if args.ignore_quotas:
+        openai_limiter.requests_per_minute = None
+        openai_limiter.tokens_per_minute = None
+
+    print(f"{len(files)} documents x {args.repeat}, model latency {args.latency}s + up to {args.jitter}s, "
+          f"error rate {args.error_rate}, drop rate {args.drop_rate}")
+    print(f"{'concurrency':>11} {'docs':>5} {'docs/min':>9} {'p50':>8} {'p95':>8} {'calls/doc':>10} "
+          f"{'errors':>7} {'peak RSS':>10} {'workers':>9}")
+
+    try:
+        for concurrency in args.concurrency:
+            client = FakeAsyncOpenAI(
+                latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                retry_after=args.retry_after, drop_rate=args.drop_rate,
+                # Rewrite every element, so rebuilding does the work a real reply causes
+                transform=str.upper, replay_path=args.replay, seed=args.seed
+            )
+            wall, latencies, failures = await run_level(paths, concurrency, client)
+            own_rss, worker_rss = _peak_rss_mb()
+
+            done = len(latencies)
+            p50 = f"{_percentile(latencies, 0.5):.2f}s" if done else "-"
+            p95 = f"{_percentile(latencies, 0.95):.2f}s" if done else "-"
+            print(f"{concurrency:>11} {done:>5} {done / wall * 60:>9.1f} {p50:>8} {p95:>8} "
+                  f"{client.calls / len(paths):>10.1f} {client.errors:>7} {own_rss:>8.0f}MB "
+                  f"{f'{worker_rss:.0f}MB' if worker_rss else '-':>9}")
+            if failures:
+                print(f"  {failures} documents failed")
+            if client.replayed:
+                print(f"  {client.replayed} of {client.calls} responses replayed")
+    finally:
+        shutdown_document_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
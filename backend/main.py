@@ -1,15 +1,29 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.utils.logger import init_logger
 from app.routes import service, text, document
+from app.services.jobs import job_manager
+from app.services.document_worker import shutdown_document_pool
 
 init_logger()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background job workers live as long as the server
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    shutdown_document_pool()
+
+
 api = FastAPI(
     title="Document Simplification API",
     description="API for simplifying documents using Azure OpenAI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 api.add_middleware(
@@ -58,7 +58,7 @@ async def main():
         
         # Process the document
         print("Starting document simplification...")
-        output_path, readability_score = await simplify_document(
+        result = await simplify_document(
             docx_path=input_path,
             system_prompt=system_prompt
         )
@@ -69,9 +69,11 @@ async def main():
         # Print results
         print("\nDocument simplification completed:")
         print(f"- Input file: {input_path}")
-        print(f"- Output file: {output_path}")
-        print(f"- Readability score: {readability_score}")
+        print(f"- Output file: {result.filename}")
+        print(f"- Readability score: {result.readability_score}")
         print(f"- Processing time: {processing_time:.2f} seconds")
+        for stage, seconds in result.timings.items():
+            print(f"  - {stage}: {seconds:.2f} seconds")
         
     except Exception as e:
         logger.error(f"Error processing document: {str(e)}", exc_info=True)
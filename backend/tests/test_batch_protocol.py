@@ -0,0 +1,54 @@
+from app.services.batch_protocol import parse_batch_response, wrap_element
+
+
+def test_reply_is_split_by_element_id():
+    reply = wrap_element(2, "Second") + "\n" + wrap_element(1, "First")
+
+    parsed = parse_batch_response(reply, [1, 2])
+
+    assert parsed.results == {1: "First", 2: "Second"}
+    assert parsed.missing == []
+    assert parsed.duplicated == []
+
+
+def test_missing_element_is_reported_without_shifting_the_others():
+    reply = wrap_element(1, "First") + wrap_element(3, "Third")
+
+    parsed = parse_batch_response(reply, [1, 2, 3])
+
+    assert parsed.results == {1: "First", 3: "Third"}
+    assert parsed.missing == [2]
+
+
+def test_duplicated_element_is_left_out_of_the_results():
+    reply = wrap_element(1, "First") + wrap_element(2, "Second") + wrap_element(2, "Second again")
+
+    parsed = parse_batch_response(reply, [1, 2])
+
+    assert parsed.results == {1: "First"}
+    assert parsed.duplicated == [2]
+    assert parsed.missing == []
+
+
+def test_element_without_end_marker_runs_up_to_the_next_start_marker():
+    reply = "[ELEMENT_START id=1]First [ELEMENT_START id=2]Second[ELEMENT_END]"
+
+    parsed = parse_batch_response(reply, [1, 2])
+
+    assert parsed.results == {1: "First", 2: "Second"}
+
+
+def test_truncated_last_element_is_missing():
+    reply = wrap_element(1, "First") + "[ELEMENT_START id=2]Sec"
+
+    parsed = parse_batch_response(reply, [1, 2])
+
+    assert parsed.results == {1: "First"}
+    assert parsed.missing == [2]
+
+
+def test_ids_that_were_not_sent_are_ignored():
+    parsed = parse_batch_response(wrap_element(1, "First") + wrap_element(9, "Extra"), [1])
+
+    assert parsed.results == {1: "First"}
+    assert parsed.missing == []
@@ -0,0 +1,42 @@
+from app.services.batching import pack_sections
+from app.services.elements import DocumentElement, NO_PHRASES
+
+# Token budgets that never bind, so batches are bounded by the element cap alone
+LARGE_BUDGET = 10 ** 6
+
+
+def _element(element_id):
+    return DocumentElement(id=element_id, index=element_id, type="paragraph", text=f"Paragraph {element_id}.",
+                           style="normal", format=None, runs=(), highlighted_phrases=NO_PHRASES, list_info=None)
+
+
+def _sections(*sizes):
+    """Sections of the given sizes, with element ids numbered across them from 1"""
+    sections = []
+    next_id = 1
+    for size in sizes:
+        sections.append([_element(element_id) for element_id in range(next_id, next_id + size)])
+        next_id += size
+    return sections
+
+
+def _pack(sections, max_elements):
+    batches = pack_sections(sections, LARGE_BUDGET, LARGE_BUDGET, max_elements,
+                            prompt_builder=lambda element, text: text)
+    return [[element.id for element in batch] for batch in batches]
+
+
+def test_section_that_does_not_fit_starts_a_new_batch_when_the_current_one_is_full_enough():
+    assert _pack(_sections(3, 2), max_elements=4) == [[1, 2, 3], [4, 5]]
+
+
+def test_section_is_split_when_the_current_batch_is_mostly_empty():
+    assert _pack(_sections(1, 4), max_elements=4) == [[1, 2, 3, 4], [5]]
+
+
+def test_sections_that_fit_together_share_a_batch():
+    assert _pack(_sections(2, 1, 1), max_elements=4) == [[1, 2, 3, 4]]
+
+
+def test_section_larger_than_a_batch_is_split_and_the_next_section_joins_its_end():
+    assert _pack(_sections(6, 1), max_elements=4) == [[1, 2, 3, 4], [5, 6, 7]]
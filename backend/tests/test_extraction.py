@@ -0,0 +1,33 @@
+import docx
+from docx.oxml import parse_xml
+
+from app.services.extraction import extract_document_structure
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+WP = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+WPS = "http://schemas.microsoft.com/office/word/2010/wordprocessingShape"
+
+
+def _text_box_paragraph(outer_text, inner_text):
+    """A paragraph holding a text box whose own paragraph holds an inline drawing"""
+    return parse_xml(
+        f'<w:p xmlns:w="{W}" xmlns:wp="{WP}" xmlns:a="{A}" xmlns:wps="{WPS}">'
+        f'<w:r><w:t>{outer_text}</w:t></w:r>'
+        '<w:r><w:drawing><wp:anchor><a:graphic><a:graphicData><wps:wsp><wps:txbx><w:txbxContent>'
+        f'<w:p><w:r><w:t>{inner_text}</w:t></w:r><w:r><w:drawing><wp:inline/></w:drawing></w:r></w:p>'
+        '</w:txbxContent></wps:txbx></wps:wsp></a:graphicData></a:graphic></wp:anchor></w:drawing></w:r>'
+        '</w:p>'
+    )
+
+
+def test_drawing_in_a_text_box_belongs_to_the_text_box_paragraph_only():
+    doc = docx.Document()
+    doc.element.body.insert(0, _text_box_paragraph("Outer text", "Inner text"))
+
+    elements = extract_document_structure(doc)
+
+    media_indexes = sorted(element.index for element in elements if element.type == "media")
+    text_indexes = {element.text: element.index for element in elements if element.type != "media"}
+    # The outer paragraph holds the text box drawing, the inner one the inline drawing
+    assert media_indexes == [text_indexes["Outer text"], text_indexes["Inner text"]]
@@ -0,0 +1,89 @@
+import docx
+from docx.enum.text import WD_COLOR_INDEX
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from app.services.extraction import extract_document_structure
+from app.services.formatting import rebuild_document
+
+
+def _highlighted_paragraph(doc, *parts):
+    """Add a paragraph from (text, highlighted) parts"""
+    paragraph = doc.add_paragraph()
+    for text, highlighted in parts:
+        run = paragraph.add_run(text)
+        if highlighted:
+            run.font.highlight_color = WD_COLOR_INDEX.YELLOW
+    return paragraph
+
+
+def _highlighted_texts(paragraph):
+    return [run.text for run in paragraph.runs if run.font.highlight_color is not None]
+
+
+def test_phrase_inside_a_longer_phrase_of_another_paragraph_stays_highlighted():
+    doc = docx.Document()
+    _highlighted_paragraph(doc, ("Send the ", False), ("claim form", True), (" today.", False))
+    _highlighted_paragraph(doc, ("Fill in the ", False), ("form", True), (" and sign it.", False))
+    elements = extract_document_structure(doc)
+    claim, form = elements
+
+    rebuild_document(doc, elements, {
+        claim.id: "Please send the claim form today.",
+        form.id: "Fill in the claim form and sign it.",
+    })
+
+    assert _highlighted_texts(doc.paragraphs[0]) == ["claim form"]
+    assert _highlighted_texts(doc.paragraphs[1]) == ["form"]
+
+
+def test_longest_phrase_of_a_paragraph_wins():
+    doc = docx.Document()
+    _highlighted_paragraph(doc, ("The ", False), ("claim form", True), (" is a ", False), ("form", True), (".", False))
+    elements = extract_document_structure(doc)
+
+    rebuild_document(doc, elements, {elements[0].id: "This claim form is a simple form."})
+
+    assert _highlighted_texts(doc.paragraphs[0]) == ["claim form", "form"]
+
+
+def _footnote_reference_run(note_id):
+    run = OxmlElement("w:r")
+    reference = OxmlElement("w:footnoteReference")
+    reference.set(qn("w:id"), str(note_id))
+    run.append(reference)
+    return run
+
+
+def _reference_positions(paragraph):
+    """Text of the paragraph with each footnote reference shown as [id]"""
+    parts = []
+    for r in paragraph._element.iter(qn("w:r")):
+        reference = next(r.iter(qn("w:footnoteReference")), None)
+        parts.append(f"[{reference.get(qn('w:id'))}]" if reference is not None else r.text)
+    return "".join(parts)
+
+
+def test_note_reference_stays_after_its_word():
+    doc = docx.Document()
+    paragraph = doc.add_paragraph("Workers must file a claim")
+    paragraph._element.append(_footnote_reference_run(1))
+    paragraph.add_run(" within six months of the injury.")
+    paragraph._element.append(_footnote_reference_run(2))
+    elements = extract_document_structure(doc)
+
+    rebuild_document(doc, elements, {elements[0].id: "You must file a claim within six months after you get hurt."})
+
+    assert _reference_positions(doc.paragraphs[0]) == "You must file a claim[1] within six months after you get hurt.[2]"
+
+
+def test_note_reference_of_a_dropped_word_follows_the_previous_kept_word():
+    doc = docx.Document()
+    paragraph = doc.add_paragraph("Benefits are paid weekly")
+    paragraph._element.append(_footnote_reference_run(1))
+    paragraph.add_run(" by the board.")
+    elements = extract_document_structure(doc)
+
+    rebuild_document(doc, elements, {elements[0].id: "Benefits are paid each week by the board."})
+
+    assert _reference_positions(doc.paragraphs[0]) == "Benefits are paid[1] each week by the board."
@@ -0,0 +1,34 @@
+import asyncio
+
+from app.services.jobs import COMPLETED, FAILED, QUEUED, RUNNING, JobManager, JobStore
+
+
+def _input(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"document")
+    return str(path)
+
+
+def test_start_requeues_unfinished_jobs_in_order(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    running = store.create("running.docx", _input(tmp_path, "running.docx"), {})
+    store.update(running, status=RUNNING, completed_batches=3, total_batches=5)
+    queued = store.create("queued.docx", _input(tmp_path, "queued.docx"), {})
+    lost = store.create("lost.docx", str(tmp_path / "missing.docx"), {})
+    done = store.create("done.docx", _input(tmp_path, "done.docx"), {})
+    store.update(done, status=COMPLETED)
+
+    # No workers, so the re-queued jobs stay in the queue
+    manager = JobManager(store, workers=0)
+    asyncio.run(manager.start())
+
+    assert store.get(running)["status"] == QUEUED
+    assert store.get(running)["completed_batches"] == 0
+    assert store.get(running)["total_batches"] is None
+    assert manager.queue_position(running) == 1
+    assert manager.queue_position(queued) == 2
+
+    assert store.get(lost)["status"] == FAILED
+    assert manager.queue_position(lost) is None
+    assert store.get(done)["status"] == COMPLETED
+    assert manager.queue_position(done) is None
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from app.extensions.fake_openai import FakeAPIError
+from app.services.rate_limiting import AdaptiveLimiter, is_rate_limit_error
+
+
+async def _call(limiter, error=None):
+    """Make one call through the limiter, failing with the given error"""
+    try:
+        async with limiter.acquire(estimated_tokens=100):
+            if error is not None:
+                raise error
+    except Exception:
+        pass
+
+
+def test_a_429_halves_the_concurrency_limit():
+    limiter = AdaptiveLimiter(min_concurrency=1, max_concurrency=16, initial_concurrency=8)
+
+    asyncio.run(_call(limiter, FakeAPIError(429)))
+
+    assert limiter.limit == 4
+    assert limiter.rate_limited_requests == 1
+    assert limiter.in_flight == 0
+
+
+def test_the_limit_never_drops_below_the_minimum():
+    limiter = AdaptiveLimiter(min_concurrency=2, max_concurrency=16, initial_concurrency=3)
+
+    asyncio.run(_call(limiter, FakeAPIError(429)))
+
+    assert limiter.limit == 2
+
+
+def test_other_errors_leave_the_limit_unchanged():
+    limiter = AdaptiveLimiter(min_concurrency=1, max_concurrency=16, initial_concurrency=8)
+
+    asyncio.run(_call(limiter, FakeAPIError(500)))
+    asyncio.run(_call(limiter, ValueError("prompt used 4290 tokens")))
+
+    assert limiter.limit == 8
+    assert limiter.rate_limited_requests == 0
+
+
+def test_successful_calls_grow_the_limit_up_to_the_maximum():
+    limiter = AdaptiveLimiter(min_concurrency=1, max_concurrency=5, initial_concurrency=4)
+
+    for _ in range(20):
+        asyncio.run(_call(limiter))
+
+    assert limiter.limit == 5
+
+
+@pytest.mark.parametrize("error, expected", [
+    (FakeAPIError(429), True),
+    (FakeAPIError(503), False),
+    (ValueError("request 4291 failed"), False),
+])
+def test_rate_limit_errors_are_recognised_by_status(error, expected):
+    assert is_rate_limit_error(error) is expected
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import response_cache as response_cache_module
+from app.services.response_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time for the cache, starting at 1000 seconds"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(response_cache_module, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", "A")
+    clock.value += 1
+    cache.set("b", "B")
+    clock.value += 1
+    assert cache.get("a") == "A"
+    clock.value += 1
+
+    cache.set("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+
+def test_expired_entry_is_a_miss(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    cache.set("a", "A")
+
+    clock.value += 30
+    assert cache.get("a") == "A"
+    clock.value += 31
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_entries_are_dropped_on_write(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    cache.set_many({"a": "A", "b": "B"})
+
+    clock.value += 61
+    cache.set("c", "C")
+
+    assert cache.get_many(["a", "b", "c"]) == {"c": "C"}
+    assert cache.stats()["entries"] == 1
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), enabled=False)
+    cache.set("a", "A")
+
+    assert cache.get("a") is None
+    assert not (tmp_path / "cache.sqlite3").exists()
@@ -0,0 +1,114 @@
+import os
+import time
+
+import pytest
+
+from app.services.storage import (
+    BlobStorage,
+    LocalBlobClient,
+    LocalStorage,
+    MemoryStorage,
+    OutputStorage,
+    is_valid_key,
+    make_output_key,
+)
+
+
+@pytest.fixture(params=["local", "memory", "blob"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        return LocalStorage(str(tmp_path / "outputs"), ttl_seconds=3600)
+    if request.param == "memory":
+        return MemoryStorage(ttl_seconds=3600)
+    return BlobStorage("outputs", "simplified/", client=LocalBlobClient(str(tmp_path / "blobs")), ttl_seconds=3600)
+
+
+def _age(storage, key, seconds):
+    """Make a stored object look as if it was stored the given number of seconds ago"""
+    stored_at = time.time() - seconds
+    if isinstance(storage, LocalStorage):
+        os.utime(storage._path(key), (stored_at, stored_at))
+    elif isinstance(storage, MemoryStorage):
+        data, _ = storage._objects[key]
+        storage._objects[key] = (data, stored_at)
+    else:
+        path = storage._get_client()._path(storage.bucket, storage._object_key(key))
+        os.utime(path, (stored_at, stored_at))
+
+
+def test_put_then_get_returns_the_document(storage):
+    key = storage.put("report.docx", b"simplified")
+
+    assert key.startswith("report_") and key.endswith(".docx")
+    assert storage.get(key) == b"simplified"
+    assert [stored.key for stored in storage.list()] == [key]
+
+
+def test_storing_the_same_output_again_reuses_its_key(storage):
+    first = storage.put("report.docx", b"simplified")
+    second = storage.put("report.docx", b"simplified")
+
+    assert first == second
+    assert len(storage.list()) == 1
+
+
+def test_expired_output_is_missing_and_collected(storage):
+    key = storage.put("report.docx", b"simplified")
+    _age(storage, key, 7200)
+
+    assert storage.get(key) is None
+    assert storage.collect_garbage() == 1
+    assert storage.list() == []
+
+
+def test_garbage_collection_removes_the_oldest_outputs_above_the_size_cap(storage):
+    oldest = storage.put("a.docx", b"a" * 100)
+    older = storage.put("b.docx", b"b" * 100)
+    newest = storage.put("c.docx", b"c" * 100)
+    _age(storage, oldest, 30)
+    _age(storage, older, 20)
+
+    storage.max_bytes = 250
+    assert storage.collect_garbage() == 1
+
+    assert storage.get(oldest) is None
+    assert storage.get(older) == b"b" * 100
+    assert storage.get(newest) == b"c" * 100
+
+
+def test_the_most_recent_output_is_kept_even_above_the_size_cap(storage):
+    key = storage.put("big.docx", b"x" * 1000)
+
+    storage.max_bytes = 10
+    assert storage.collect_garbage() == 0
+    assert storage.get(key) == b"x" * 1000
+
+
+@pytest.mark.parametrize("key", ["", ".", "..", "../secret.docx", "..\\secret.docx", "a/b.docx", "a\0.docx"])
+def test_keys_reaching_outside_the_storage_are_rejected(storage, key):
+    assert not is_valid_key(key)
+    assert storage.get(key) is None
+
+
+@pytest.mark.parametrize("filename", [
+    "../../etc/passwd.docx",
+    "C:\\Users\\someone\\My \"Report\".docx",
+    "/tmp/uploads/report.docx",
+    "..",
+    "résumé; rm -rf.docx",
+])
+def test_output_keys_are_plain_safe_file_names(filename):
+    key = make_output_key(filename, b"simplified")
+
+    assert is_valid_key(key)
+    assert all(character.isalnum() or character in "._-" for character in key)
+    assert not key.startswith(".")
+
+
+def test_output_key_keeps_the_name_of_a_windows_path():
+    assert make_output_key("C:\\Users\\someone\\report.docx", b"simplified").startswith("report_")
+
+
+def test_output_storage_requires_the_object_operations():
+    with pytest.raises(TypeError):
+        OutputStorage()